@@ -1,30 +1,109 @@
 """API backend for Vercel deployment."""
 
+import asyncio
+import json
+import os
 import sys
-from typing import Any, Optional
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
 
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detector.admission import RateLimitError, admission, client_address, retry_after_header, tenant_id  # noqa: E402
+from detector.cache import get_verdict_cache  # noqa: E402
+from detector.clients import ClientPool, genai_sdk  # noqa: E402
+from detector.concurrency import current_tenant, model_executor  # noqa: E402
+from detector.context_cache import context_caches  # noqa: E402
+from detector.engine import SUPPORTED_TYPES, AnalysisEngine, AnalysisRequest, error_status  # noqa: E402
+from detector.files import remote_files  # noqa: E402
+from detector.jobs import JobError, JobRunner, JobStore, public_view  # noqa: E402
+from detector.metrics import CONTENT_TYPE, MetricsMiddleware, client_pool_collector, registry, render, stage  # noqa: E402
+from detector.phash import loaded_perceptual_index  # noqa: E402
+from detector.preprocess import preprocess_executor  # noqa: E402
+from detector.prescreen import prescreen_stats  # noqa: E402
+from detector.regions import region_stats  # noqa: E402
+from detector.resilience import model_caller  # noqa: E402
+from detector.routing import model_router  # noqa: E402
+from detector.segments import segment_stats  # noqa: E402
+from detector.streaming import SSE_HEADERS, sse_event, stream_timings  # noqa: E402
+from detector.uploads import (  # noqa: E402
+    MULTIPART_OVERHEAD,
+    IngestedUpload,
+    UploadLimitMiddleware,
+    check_public_url,
+    fetch_url_upload,
+    ingest_upload,
+)
+from detector.video import sampling_stats  # noqa: E402
+
+# google.genai is imported on the first analyze rather than here, so health and info
+# requests on a cold lambda never pay for it. Assigning a module to ``genai`` overrides it.
 genai: Any = None
-types: Any = None
-GENAI_AVAILABLE = False
+GENAI_AVAILABLE = genai_sdk.installed()
+
+
+def _genai_client(api_key: str) -> Any:
+    sdk = genai
+    if sdk is None:
+        try:
+            sdk = genai_sdk.load()
+        except Exception as error:
+            print(f"google-genai import failed: {error}", file=sys.stderr)
+            raise
+    return sdk.Client(api_key=api_key)
+
+
+client_pool = ClientPool(_genai_client)
+genai_sdk.start_prewarm()
+engine = AnalysisEngine(
+    clients=client_pool,
+    record_usage=lambda api_key, tokens: admission.record_usage(api_key, tokens),
+)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    # Resume jobs persisted by a previous process; job endpoints also start workers lazily.
+    job_runner.ensure_started()
+    yield
+    await job_runner.stop()
 
-try:
-    from google import genai  # type: ignore
-    from google.genai import types  # type: ignore
-    GENAI_AVAILABLE = True
-except Exception as error:
-    print(f"google-genai import failed: {error}", file=sys.stderr)
 
 app = FastAPI(
     title="Deepfake Detection API",
     version="2.1.0",
     docs_url="/api/docs",
     redoc_url="/api/redoc",
+    lifespan=lifespan,
 )
 
+MAX_FILE_BYTES = int(4.5 * 1024 * 1024)
+FILE_TOO_LARGE = "File too large (max 4.5MB on Vercel)"
+BATCH_MAX_ITEMS = int(os.environ.get("DEEPFAKE_BATCH_MAX_ITEMS", "50"))
+BATCH_CONCURRENCY = int(os.environ.get("DEEPFAKE_BATCH_CONCURRENCY", "4"))
+
+BATCH_PATHS = ("/analyze/batch", "/api/analyze/batch")
+
+app.add_middleware(
+    UploadLimitMiddleware,
+    max_body=MAX_FILE_BYTES + MULTIPART_OVERHEAD,
+    paths=("/analyze", "/api/analyze", "/jobs", "/api/jobs"),
+    detail=FILE_TOO_LARGE,
+    exclude=BATCH_PATHS,
+)
+# A batch may carry BATCH_MAX_ITEMS files of up to MAX_FILE_BYTES each; every item is checked on its own
+app.add_middleware(
+    UploadLimitMiddleware,
+    max_body=BATCH_MAX_ITEMS * (MAX_FILE_BYTES + MULTIPART_OVERHEAD),
+    paths=BATCH_PATHS,
+)
+app.add_middleware(MetricsMiddleware)
+registry.collector(client_pool_collector(client_pool))
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -40,65 +119,191 @@ class DetectionResult(BaseModel):
     confidence: str
     analysis: str
     is_fake: bool
+    cached: bool = False
+    similarity: Optional[float] = None
+    model: Optional[str] = None
+    findings: Optional[Dict[str, Any]] = None
+    metadata: Optional[Dict[str, Any]] = None
+    sampling: Optional[Dict[str, Any]] = None
+    regions: Optional[Dict[str, Any]] = None
+    segments: Optional[Dict[str, Any]] = None
+    routing: Optional[Dict[str, Any]] = None
+    prescreened: bool = False
 
 
-FORENSIC_PROMPT = """You are an expert forensic digital media analyst specializing in deepfake detection.
-Analyze for lighting mismatch, facial artifacts, texture/noise anomalies, and (for video) lip-sync issues.
-Return: VERDICT (REAL/FAKE), CONFIDENCE (%), and a concise technical explanation."""
+class BatchItemResult(BaseModel):
+    index: int
+    source: str
+    status_code: int = 200
+    result: Optional[DetectionResult] = None
+    error: Optional[str] = None
+    duplicate_of: Optional[int] = None
 
 
-def _extract_confidence(text: str) -> str:
-    if "%" not in text:
-        return "N/A"
-    for token in text.replace("\n", " ").split():
-        if "%" in token:
-            return token.strip()
-    return "N/A"
+class JobStatus(BaseModel):
+    job_id: str
+    status: str
+    attempts: int
+    created_at: float
+    updated_at: float
+    result: Optional[DetectionResult] = None
+    error: Optional[str] = None
+    webhook_status: Optional[str] = None
+    deduplicated: bool = False
 
 
-async def _analyze(file: UploadFile, api_key: Optional[str]) -> DetectionResult:
+async def _validate_upload(file: UploadFile, api_key: Optional[str]) -> IngestedUpload:
     if not GENAI_AVAILABLE:
         raise HTTPException(status_code=503, detail="Gemini library unavailable on server")
 
     if not api_key:
         raise HTTPException(status_code=400, detail="api_key is required")
 
-    allowed_types = {
-        "image/jpeg",
-        "image/jpg",
-        "image/png",
-        "video/mp4",
-        "video/quicktime",
-        "video/x-msvideo",
-    }
-    if file.content_type not in allowed_types:
+    if file.content_type not in SUPPORTED_TYPES:
         raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.content_type}")
 
-    file_bytes = await file.read()
-    if not file_bytes:
-        raise HTTPException(status_code=400, detail="Uploaded file is empty")
-    if len(file_bytes) > int(4.5 * 1024 * 1024):
-        raise HTTPException(status_code=400, detail="File too large (max 4.5MB on Vercel)")
-
-    client = genai.Client(api_key=api_key)
-    response = client.models.generate_content(
-        model="gemini-2.0-flash-exp",
-        contents=[
-            types.Part.from_bytes(data=file_bytes, mime_type=file.content_type),
-            FORENSIC_PROMPT,
-        ],
-    )
+    with stage("ingest", file.content_type) as timer:
+        upload = await ingest_upload(file, MAX_FILE_BYTES, limit_detail=FILE_TOO_LARGE)
+        timer.size = upload.size
+    return upload
 
-    result_text = response.text or "No analysis returned"
-    verdict = "FAKE" if "FAKE" in result_text.upper() else "REAL"
 
-    return DetectionResult(
-        success=True,
-        verdict=verdict,
-        confidence=_extract_confidence(result_text),
-        analysis=result_text,
-        is_fake=(verdict == "FAKE"),
-    )
+def _admit(request: Request, api_key: Optional[str]) -> None:
+    """Rate-limit by address and key before the upload is processed (429 with Retry-After)."""
+    if not api_key:
+        return
+    try:
+        admission.admit(api_key, client_address(request))
+    except RateLimitError as error:
+        raise _http_error(error)
+
+
+async def _analyze(file: UploadFile, api_key: Optional[str]) -> DetectionResult:
+    upload = await _validate_upload(file, api_key)
+    return await _analyze_upload(upload, api_key)
+
+
+async def _analyze_upload(upload: IngestedUpload, api_key: str) -> DetectionResult:
+    result = await engine.analyze(AnalysisRequest.from_upload(upload, api_key))
+    return DetectionResult(success=True, **result.model_dump())
+
+
+async def _stream_upload(upload: IngestedUpload, api_key: str) -> AsyncIterator[str]:
+    """Server-sent events for one analysis.
+
+    ``verdict`` is sent as soon as it is parsed (again if the confidence completes in a
+    later chunk), ``delta`` events carry readable pieces of the analysis, and the
+    stream closes with ``timing`` and the final ``result`` (or a single ``error``).
+    """
+    try:
+        async for event, data in engine.stream(AnalysisRequest.from_upload(upload, api_key)):
+            if event == "delta":
+                yield sse_event("delta", {"text": data})
+            elif event == "timing":
+                stream_timings.record(**data)
+                yield sse_event("timing", data)
+            elif event == "result":
+                yield sse_event("result", DetectionResult(success=True, **data.model_dump()).model_dump())
+            else:
+                yield sse_event(event, data)
+    except asyncio.CancelledError:
+        raise
+    except Exception as error:
+        status_code, detail = _error_status(error)
+        yield sse_event("error", {"status_code": status_code, "detail": detail})
+
+
+def _http_error(error: Exception) -> HTTPException:
+    if isinstance(error, HTTPException):
+        return error
+    status, detail, wait = error_status(error)
+    return HTTPException(status_code=status, detail=detail, headers=retry_after_header(wait))
+
+
+def _error_status(error: Exception) -> tuple:
+    http_error = _http_error(error)
+    return http_error.status_code, str(http_error.detail)
+
+
+async def _run_batch(
+    items: List[Tuple[str, Union[UploadFile, str]]],
+    api_key: str,
+    concurrency: int,
+) -> AsyncIterator[str]:
+    """Analyse ``(source, upload-or-url)`` items concurrently, yielding one NDJSON line per item as it finishes.
+
+    Items whose content digest matches an earlier item share that item's analysis.
+    The request itself was admitted for the first item; every further item is
+    charged to the key and reported as a 429 line once its limits are reached.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    in_flight: Dict[str, "asyncio.Task[DetectionResult]"] = {}
+    owners: Dict[str, int] = {}
+
+    async def analyze_limited(upload: IngestedUpload) -> DetectionResult:
+        async with semaphore:
+            return await _analyze_upload(upload, api_key)
+
+    async def run_item(index: int, source: str, item: Union[UploadFile, str]) -> BatchItemResult:
+        duplicate_of = None
+        fetched: Optional[UploadFile] = None
+        try:
+            if index:
+                admission.admit(api_key)
+            async with semaphore:
+                if isinstance(item, str):
+                    item = fetched = await fetch_url_upload(item, MAX_FILE_BYTES)
+                upload = await _validate_upload(item, api_key)
+            task = in_flight.get(upload.digest)
+            if task is None:
+                task = in_flight[upload.digest] = asyncio.ensure_future(analyze_limited(upload))
+                owners[upload.digest] = index
+            else:
+                duplicate_of = owners[upload.digest]
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            status_code, detail = _error_status(error)
+            return BatchItemResult(
+                index=index, source=source, status_code=status_code, error=detail, duplicate_of=duplicate_of
+            )
+        finally:
+            if fetched is not None:
+                await fetched.close()
+        return BatchItemResult(index=index, source=source, result=result, duplicate_of=duplicate_of)
+
+    tasks = [asyncio.ensure_future(run_item(index, source, item)) for index, (source, item) in enumerate(items)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            item = await finished
+            yield json.dumps(item.model_dump(exclude_none=True)) + "\n"
+    finally:
+        # The client went away (or we are done): stop any work still queued.
+        for task in [*tasks, *in_flight.values()]:
+            task.cancel()
+
+
+async def _process_job(job: dict) -> dict:
+    current_tenant.set(tenant_id(job["api_key"]))
+    with open(job["content_path"], "rb") as handle:
+        upload = IngestedUpload(handle, job["size"], job["digest"], job["mime_type"], None)
+        try:
+            result = await _analyze_upload(upload, job["api_key"])
+        except HTTPException as error:
+            if error.status_code < 500:
+                raise JobError(error.detail)
+            raise
+        except Exception as error:
+            # Bad requests and rejected keys won't succeed on retry; 429s and 5xx may.
+            code = getattr(error, "code", None)
+            if isinstance(code, int) and 400 <= code < 500 and code != 429:
+                raise JobError(f"Analysis failed: {error}")
+            raise
+    return result.model_dump()
+
+
+job_runner = JobRunner(JobStore, _process_job)
 
 
 @app.get("/")
@@ -112,7 +317,11 @@ async def api_info() -> dict:
         "python_version": sys.version.split()[0],
         "endpoints": {
             "health": "/api/health",
+            "metrics": "/api/metrics",
             "analyze": "/api/analyze",
+            "analyze_stream": "/api/analyze/stream",
+            "analyze_batch": "/api/analyze/batch",
+            "jobs": "/api/jobs",
             "docs": "/api/docs",
         },
     }
@@ -121,22 +330,136 @@ async def api_info() -> dict:
 @app.get("/health")
 @app.get("/api/health")
 async def health() -> dict:
+    # Only what is already in memory: a probe must not load the index or scan Redis.
+    index = loaded_perceptual_index()
     return {
         "status": "healthy",
         "service": "deepfake-detector",
         "genai": "available" if GENAI_AVAILABLE else "unavailable",
+        "sdk": genai_sdk.stats(),
+        "model_calls": model_executor.stats(),
+        "admission": admission.stats(),
+        "resilience": model_caller.stats(),
+        "routing": model_router.stats(),
+        "preprocessing": preprocess_executor.stats(),
+        "video_sampling": sampling_stats(),
+        "face_regions": region_stats(),
+        "segments": segment_stats(),
+        "prescreen": prescreen_stats(),
+        "streaming": stream_timings.stats(),
+        "clients": client_pool.stats(),
+        "remote_files": remote_files.stats(),
+        "context_cache": {"prompt_version": engine.prompt_version, **context_caches.stats()},
+        "cache": get_verdict_cache().stats(),
+        "perceptual_index": index.stats() if index is not None else None,
     }
 
 
+@app.get("/metrics")
+@app.get("/api/metrics")
+async def metrics() -> Response:
+    """Prometheus text exposition: stage latencies, upstream errors, cache and admission counters."""
+    return Response(render(), media_type=CONTENT_TYPE)
+
+
 @app.post("/analyze", response_model=DetectionResult)
 @app.post("/api/analyze", response_model=DetectionResult)
-async def analyze(file: UploadFile = File(...), api_key: Optional[str] = Form(None)) -> DetectionResult:
+async def analyze(
+    request: Request, file: UploadFile = File(...), api_key: Optional[str] = Form(None)
+) -> DetectionResult:
     try:
+        _admit(request, api_key)
         return await _analyze(file=file, api_key=api_key)
-    except HTTPException:
-        raise
     except Exception as error:
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {error}")
+        raise _http_error(error)
+
+
+@app.post("/analyze/stream")
+@app.post("/api/analyze/stream")
+async def analyze_stream(
+    request: Request, file: UploadFile = File(...), api_key: Optional[str] = Form(None)
+) -> StreamingResponse:
+    """Analyse one file and stream the report as server-sent events while Gemini writes it."""
+    _admit(request, api_key)
+    upload = await _validate_upload(file, api_key)
+    return StreamingResponse(_stream_upload(upload, api_key), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.post("/analyze/batch")
+@app.post("/api/analyze/batch")
+async def analyze_batch(
+    request: Request,
+    files: Optional[List[UploadFile]] = File(None),
+    urls: Optional[List[str]] = Form(None),
+    api_key: Optional[str] = Form(None),
+    concurrency: Optional[int] = Form(None),
+) -> StreamingResponse:
+    """Analyse many files and/or URLs; results stream back as NDJSON in completion order."""
+    if not GENAI_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Gemini library unavailable on server")
+    if not api_key:
+        raise HTTPException(status_code=400, detail="api_key is required")
+
+    items: List[Tuple[str, Union[UploadFile, str]]] = [(file.filename or "upload", file) for file in files or []]
+    items += [(url.strip(), url.strip()) for url in urls or [] if url.strip()]
+    if not items:
+        raise HTTPException(status_code=400, detail="Provide at least one file or url")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many items (max {BATCH_MAX_ITEMS} per batch)")
+
+    _admit(request, api_key)
+    limit = max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    return StreamingResponse(_run_batch(items, api_key, limit), media_type="application/x-ndjson")
+
+
+@app.post("/jobs", response_model=JobStatus, status_code=202)
+@app.post("/api/jobs", response_model=JobStatus, status_code=202)
+async def submit_job(
+    request: Request,
+    file: UploadFile = File(...),
+    api_key: Optional[str] = Form(None),
+    webhook_url: Optional[str] = Form(None),
+) -> JobStatus:
+    if webhook_url and not webhook_url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="webhook_url must be an http(s) URL")
+    if webhook_url:
+        await check_public_url(webhook_url)
+
+    _admit(request, api_key)
+    upload = await _validate_upload(file, api_key)
+    job_runner.ensure_started()
+    tenant = tenant_id(api_key)
+    dedup_key = engine.cache_key(AnalysisRequest.from_upload(upload, api_key))
+    existing = await job_runner.call(JobStore.find_duplicate, dedup_key, tenant, webhook_url)
+    if existing is not None:
+        return JobStatus(**public_view(existing), deduplicated=True)
+
+    job = await job_runner.call(
+        JobStore.create,
+        upload.file,
+        upload.mime_type,
+        upload.size,
+        upload.digest,
+        api_key,
+        dedup_key,
+        webhook_url,
+        tenant,
+    )
+    job_runner.notify()
+    return JobStatus(**public_view(job))
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+@app.get("/api/jobs/{job_id}", response_model=JobStatus)
+async def job_status(job_id: str, api_key: Optional[str] = None) -> JobStatus:
+    """A job submitted with the same ``api_key`` (query parameter); other keys' jobs are not found."""
+    if not api_key:
+        raise HTTPException(status_code=400, detail="api_key is required")
+    job_runner.ensure_started()
+    job = await job_runner.call(JobStore.get, job_id, tenant_id(api_key))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobStatus(**public_view(job))
 
 
 handler = app
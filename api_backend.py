@@ -3,15 +3,43 @@ FastAPI Backend for Mobile Apps
 Run with: uvicorn api_backend:app --reload
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Request, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from google import genai
-from google.genai import types
 from pydantic import BaseModel
+from typing import Optional
 import io
 
+from detector.admission import admission, client_address, retry_after_header
+from detector.cache import get_verdict_cache
+from detector.clients import ClientPool
+from detector.context_cache import context_caches
+from detector.engine import SUPPORTED_TYPES, AnalysisEngine, AnalysisRequest, error_status
+from detector.metrics import CONTENT_TYPE, MetricsMiddleware, client_pool_collector, registry, render, stage
+from detector.resilience import model_caller
+from detector.routing import model_router
+from detector.uploads import MAX_UPLOAD_BYTES, MULTIPART_OVERHEAD, UploadLimitMiddleware, ingest_upload
+
 app = FastAPI(title="Deepfake Detection API")
 
+# One reusable Gemini client per API key (keeps HTTP connections warm)
+client_pool = ClientPool(lambda key: genai.Client(api_key=key))
+
+# Cache, pre-screen, preprocessing, model call and parsing shared with the other entry points
+engine = AnalysisEngine(clients=client_pool, record_usage=lambda key, tokens: admission.record_usage(key, tokens))
+
+# Reject oversize bodies while they stream in, before they are buffered
+app.add_middleware(
+    UploadLimitMiddleware,
+    max_body=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,
+    paths=("/analyze",),
+)
+
+# Per-route request latency and in-flight gauge for /metrics
+app.add_middleware(MetricsMiddleware)
+registry.collector(client_pool_collector(client_pool))
+
 # Enable CORS for mobile apps
 app.add_middleware(
     CORSMiddleware,
@@ -26,15 +54,15 @@ class AnalysisResponse(BaseModel):
     confidence: str
     analysis: str
     is_fake: bool
-
-FORENSIC_PROMPT = """You are an expert forensic digital media analyst specializing in deepfake detection. Analyze the provided media for inconsistencies in:
-
-1. **Lighting & Shadows:** Check if light sources on the subject match the background.
-2. **Facial Artifacts:** Look for 'ghosting' around edges, unnatural eye reflections, or irregular blinking patterns.
-3. **Texture & Noise:** Identify inconsistent skin textures or 'digital noise' that suggests GAN/Diffusion generation.
-4. **Audio-Visual Sync:** (For Video) Check if lip movements align perfectly with the phonemes in the audio.
-
-Provide a final verdict: **REAL** or **FAKE**, followed by a confidence score (0-100%) and a concise technical explanation."""
+    cached: bool = False  # True when served from the verdict cache
+    findings: Optional[dict] = None  # Per-category findings: lighting, facial artifacts, texture/noise, AV sync
+    metadata: Optional[dict] = None  # EXIF/generator info kept aside when the image is downscaled
+    sampling: Optional[dict] = None  # Keyframe sampling report for videos
+    regions: Optional[dict] = None  # Face crops sent instead of the whole picture, with their boxes
+    segments: Optional[dict] = None  # Per-segment timeline when a long video was analysed in parts
+    routing: Optional[dict] = None  # Tiers asked and why each escalated, when model routing is on
+    prescreened: bool = False  # True when the local pre-screen settled it without Gemini
+    model: Optional[str] = None  # The model that answered; a fallback when the primary was unavailable
 
 @app.get("/")
 async def root():
@@ -43,16 +71,31 @@ async def root():
         "version": "1.0",
         "endpoints": {
             "/analyze": "POST - Upload media for analysis",
-            "/health": "GET - API health check"
+            "/health": "GET - API health check",
+            "/metrics": "GET - Prometheus metrics"
         }
     }
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "deepfake-detector"}
+    return {
+        "status": "healthy",
+        "service": "deepfake-detector",
+        "cache": get_verdict_cache().stats(),
+        "clients": client_pool.stats(),
+        "admission": admission.stats(),
+        "resilience": model_caller.stats(),
+        "routing": model_router.stats(),
+        "context_cache": {"prompt_version": engine.prompt_version, **context_caches.stats()},
+    }
+
+@app.get("/metrics")
+async def metrics():
+    return Response(render(), media_type=CONTENT_TYPE)
 
 @app.post("/analyze", response_model=AnalysisResponse)
 async def analyze_media(
+    request: Request,
     file: UploadFile = File(...),
     api_key: str = None
 ):
@@ -71,54 +114,32 @@ async def analyze_media(
         raise HTTPException(status_code=400, detail="API key is required")
     
     # Validate file type
-    allowed_types = ['image/jpeg', 'image/png', 'video/mp4', 'video/quicktime', 'video/x-msvideo']
-    if file.content_type not in allowed_types:
+    if file.content_type not in SUPPORTED_TYPES:
         raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.content_type}")
     
     try:
-        # Read file bytes
-        file_bytes = await file.read()
-        
-        # Initialize Gemini client
-        client = genai.Client(api_key=api_key)
-        
-        # Call Gemini API
-        response = client.models.generate_content(
-            model="gemini-3-flash-preview",
-            contents=[
-                types.Part.from_bytes(data=file_bytes, mime_type=file.content_type),
-                FORENSIC_PROMPT
-            ]
-        )
-        
-        result_text = response.text
-        
-        # Parse verdict
-        is_fake = "FAKE" in result_text.upper()
-        verdict = "FAKE" if is_fake else "REAL"
+        # Per-address and per-key rate limits and the key's token budget
+        admission.admit(api_key, client_address(request))
         
-        # Try to extract confidence (basic parsing)
-        confidence = "N/A"
-        if "%" in result_text:
-            # Simple extraction - can be improved
-            words = result_text.split()
-            for i, word in enumerate(words):
-                if "%" in word:
-                    confidence = word
-                    break
+        # Hash, size-check and sniff the spooled upload in one chunked pass
+        with stage("ingest", file.content_type) as timer:
+            upload = await ingest_upload(file)
+            timer.size = upload.size
         
-        return AnalysisResponse(
-            verdict=verdict,
-            confidence=confidence,
-            analysis=result_text,
-            is_fake=is_fake
-        )
+        # Cache and pre-screen first, then preprocessing, the pooled model call
+        # (retries and fallback models) and the JSON report
+        result = await engine.analyze(AnalysisRequest.from_upload(upload, api_key))
+        return AnalysisResponse(**result.model_dump())
         
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+        status, detail, wait = error_status(e)
+        raise HTTPException(status_code=status, detail=detail, headers=retry_after_header(wait))
 
 @app.post("/analyze-with-key-header")
 async def analyze_with_header(
+    request: Request,
     file: UploadFile = File(...),
     authorization: str = None
 ):
@@ -131,4 +152,4 @@ async def analyze_with_header(
         raise HTTPException(status_code=401, detail="Invalid authorization header")
     
     api_key = authorization.replace("Bearer ", "")
-    return await analyze_media(file=file, api_key=api_key)
+    return await analyze_media(request=request, file=file, api_key=api_key)
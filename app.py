@@ -1,8 +1,93 @@
 import streamlit as st
-from google import genai
-from google.genai import types
-from PIL import Image
+from PIL import Image, ImageOps
 import io
+import time
+
+from detector.engine import SUPPORTED_EXTENSIONS, AnalysisEngine, AnalysisRequest
+from detector.report import CATEGORY_LABELS
+from detector.cache import CACHE_BACKEND, CACHE_TTL
+from detector.files import FILES_API_THRESHOLD
+from detector.phash import PHASH_ENABLED
+
+
+def storage_note():
+    """What this deployment keeps, and where, for the privacy notes."""
+    kept = []
+    if CACHE_BACKEND != "none":
+        kept.append("verdicts (in memory)" if CACHE_BACKEND == "memory" else f"verdicts (in {CACHE_BACKEND})")
+    if PHASH_ENABLED:
+        kept.append("perceptual hashes with their verdicts (on disk, to recognise near-duplicates)")
+    note = "Uploads are sent to Google Gemini for analysis and are not saved here."
+    if kept:
+        note += f" Kept for up to {CACHE_TTL / 3600:g}h: {' and '.join(kept)}."
+    if FILES_API_THRESHOLD >= 0:
+        note += (
+            f" Files over {FILES_API_THRESHOLD / (1024 * 1024):g}MB go through the Gemini Files API,"
+            " where Google keeps them for up to 48 hours."
+        )
+    return note
+
+PREVIEW_SIDE = 1280  # longest side of the image preview sent to the browser
+HISTORY_THUMB_SIDE = 160
+HISTORY_LIMIT = 20  # analyses kept in the session's history panel
+
+
+@st.cache_resource
+def get_engine():
+    """Same pipeline as the APIs: cache, pre-screen, preprocessing, pooled model call with fallbacks.
+
+    Built once per server process instead of on every rerun; its client pool keeps
+    one Gemini client per API key warm across reruns and sessions.
+    """
+    return AnalysisEngine()
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def thumbnail(digest, _file, max_side):
+    """Downscaled copy of an uploaded image, decoded once per file (``digest``) and size."""
+    with Image.open(_file) as img:
+        img.draft("RGB", (max_side, max_side))  # JPEGs decode straight at reduced scale
+        small = ImageOps.exif_transpose(img)
+        small.thumbnail((max_side, max_side))
+        out = io.BytesIO()
+        if small.mode in ("RGBA", "LA", "P"):
+            small.save(out, format="PNG", optimize=True)
+        else:
+            small.convert("RGB").save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def recall(key):
+    """The history entry for a verdict cache key, if this session already analyzed it."""
+    return next((entry for entry in st.session_state.history if entry["key"] == key), None)
+
+
+def remember(key, name, thumb, result, source):
+    """Put an analysis at the top of the session's history panel."""
+    history = [entry for entry in st.session_state.history if entry["key"] != key]
+    history.insert(0, {
+        "key": key,
+        "name": name,
+        "thumbnail": thumb,
+        "result": result,
+        "source": source,
+        "at": time.strftime("%H:%M:%S"),
+    })
+    st.session_state.history = history[:HISTORY_LIMIT]
+
+
+def show_verdict(slot, fields):
+    """Render the verdict banner (and confidence, once known) into a placeholder."""
+    with slot.container():
+        if fields["is_fake"]:
+            st.error("🚩 **Potential Deepfake Detected**")
+            st.markdown("### ⚠️ This media shows signs of manipulation")
+        else:
+            st.success("✅ **Likely Authentic Media**")
+            st.markdown("### ✓ No significant manipulation detected")
+        if fields.get("confidence"):
+            st.metric("Confidence", fields["confidence"])
+
 
 # --- UI CONFIGURATION ---
 st.set_page_config(page_title="Gemini Forensic AI", page_icon="🔍", layout="wide")
@@ -10,6 +95,8 @@ st.set_page_config(page_title="Gemini Forensic AI", page_icon="🔍", layout="wi
 # Initialize session state for welcome page
 if 'show_welcome' not in st.session_state:
     st.session_state.show_welcome = True
+if 'history' not in st.session_state:
+    st.session_state.history = []
 
 # --- WELCOME PAGE ---
 if st.session_state.show_welcome:
@@ -266,7 +353,7 @@ st.write("Upload Video or Images to Analyze Media Authenticity using Gemini 3 Fl
 # --- SIDEBAR & API KEY ---
 with st.sidebar:
     api_key = st.text_input("Enter Gemini API Key", type="password")
-    st.info("No data is stored. Analysis happens in real-time.")
+    st.info(storage_note())
     
     st.markdown("---")
     st.markdown("### About This Tool")
@@ -288,61 +375,137 @@ with st.sidebar:
     """)
 
 # --- FILE UPLOADER ---
-uploaded_file = st.file_uploader("Choose a Video or Image...", type=['mp4', 'mov', 'avi', 'jpg', 'jpeg', 'png'])
+uploaded_file = st.file_uploader("Choose a Video or Image...", type=list(SUPPORTED_EXTENSIONS))
 
 if uploaded_file and api_key:
-    client = genai.Client(api_key=api_key)
+    engine = get_engine()
+    mime_type = uploaded_file.type
+    request = AnalysisRequest.from_bytes(uploaded_file.getvalue(), mime_type, api_key)
     
     # Display the uploaded media
-    if uploaded_file.type.startswith('video'):
+    if mime_type.startswith('video'):
         st.video(uploaded_file)
-        mime_type = uploaded_file.type
+        preview = None
     else:
-        img = Image.open(uploaded_file)
-        st.image(img, caption="Uploaded Image", use_container_width=True)
-        mime_type = uploaded_file.type
+        # Decoded and downscaled once per file, not on every rerun, and the
+        # browser gets a preview-sized copy instead of the full-resolution original
+        preview = thumbnail(request.digest, request.open(), PREVIEW_SIDE)
+        st.image(preview, caption="Uploaded Image", use_container_width=True)
 
     if st.button("🔍 Run Forensic Analysis"):
         with st.spinner("Analyzing media artifacts..."):
             try:
-                # Read file bytes
-                file_bytes = uploaded_file.getvalue()
+                key = engine.cache_key(request)
+                thumb = None if preview is None else thumbnail(request.digest, request.open(), HISTORY_THUMB_SIDE)
                 
-                # Expert forensic prompt for deepfake detection
-                forensic_prompt = """You are an expert forensic digital media analyst specializing in deepfake detection. Analyze the provided media for inconsistencies in:
-
-1. **Lighting & Shadows:** Check if light sources on the subject match the background.
-2. **Facial Artifacts:** Look for 'ghosting' around edges, unnatural eye reflections, or irregular blinking patterns.
-3. **Texture & Noise:** Identify inconsistent skin textures or 'digital noise' that suggests GAN/Diffusion generation.
-4. **Audio-Visual Sync:** (For Video) Check if lip movements align perfectly with the phonemes in the audio.
-
-Provide a final verdict: **REAL** or **FAKE**, followed by a confidence score (0-100%) and a concise technical explanation."""
-                
-                # Call Gemini 3 API (Latest 2026 reasoning model)
-                response = client.models.generate_content(
-                    model="gemini-3-flash-preview",
-                    contents=[
-                        types.Part.from_bytes(data=file_bytes, mime_type=mime_type),
-                        forensic_prompt
-                    ]
-                )
+                # Re-running a file from this session shows its stored result; otherwise reuse
+                # the verdict for content we've already analyzed, or settle obvious images
+                # locally (generator tags, camera originals)
+                previous = recall(key)
+                if previous is not None:
+                    result, hashes = previous["result"], None
+                else:
+                    result, hashes = engine.lookup(request)
                 
                 # --- ATTRACTIVE RESULT DISPLAY ---
                 st.markdown("---")
                 st.subheader("🎯 Forensic Analysis Results")
-                result_text = response.text
+                verdict_slot = st.empty()
                 
-                # Determine verdict based on response
-                if "FAKE" in result_text.upper():
-                    st.error("🚩 **Potential Deepfake Detected**")
-                    st.markdown("### ⚠️ This media shows signs of manipulation")
+                if result is not None:
+                    if previous is not None:
+                        st.caption(f"🕘 Shown from this session's history (analyzed at {previous['at']})")
+                        source = previous["source"]
+                    elif result.prescreened:
+                        st.caption("🧪 Settled by the local pre-screen - Gemini was not called")
+                        source = "pre-screen"
+                    elif result.similarity is not None:
+                        st.caption(f"⚡ Served from cache - a {result.similarity:.0%} similar file was analyzed recently")
+                        source = "cache"
+                    else:
+                        st.caption("⚡ Served from cache - this file was analyzed recently")
+                        source = "cache"
+                    show_verdict(verdict_slot, result.model_dump())
+                    st.markdown("### 📋 Detailed Analysis Report")
+                    st.markdown(result.analysis)
                 else:
-                    st.success("✅ **Likely Authentic Media**")
-                    st.markdown("### ✓ No significant manipulation detected")
+                    # Long clips are cut into segments analyzed in parallel
+                    spans = engine.plan(request)
+                    if spans:
+                        st.caption(f"🧩 Analyzing a {spans[-1][1]:.0f}s clip as {len(spans)} segments in parallel")
+                        events = engine.stream_segments(request, spans, hashes)
+                    else:
+                        # Downscale/re-encode large photos and sample video keyframes;
+                        # forensic metadata goes into the prompt instead
+                        prepared = engine.prepare(request)
+                        sampling = prepared.stats
+                        if sampling:
+                            st.caption(
+                                f"🎞️ Analyzing {sampling['frames_selected']} keyframes of a {sampling['duration']:.1f}s clip "
+                                f"({sampling['reduction']:.0%} smaller payload, decoded in {sampling['decode_ms']:.0f}ms)"
+                            )
+                        # Faces go at full detail next to a small overview instead of one downscaled frame
+                        regions = prepared.regions
+                        if regions and sampling:
+                            st.caption(f"🔍 {len(regions['crops'])} keyframes with a face also carry a full-detail face crop")
+                        elif regions:
+                            width, height = regions["context"]
+                            st.caption(
+                                f"🔍 Sending {len(regions['crops'])} face crop(s) at full detail with a {width}x{height} overview "
+                                f"({regions['reduction']:.0%} smaller payload, faces found in {regions['detect_ms']:.0f}ms)"
+                            )
+                        events = engine.stream_report(request, prepared, hashes)
+                    st.markdown("### 📋 Detailed Analysis Report")
+                    
+                    # Stream Gemini 3's JSON report: the verdict shows as soon as it is written,
+                    # then each finding (or segment) as it completes
+                    outcome = {}
+                    
+                    def analysis_pieces():
+                        for event, data in events:
+                            if event == "verdict":
+                                show_verdict(verdict_slot, data)
+                            elif event == "delta":
+                                yield data
+                            else:
+                                outcome[event] = data
+                    
+                    st.write_stream(analysis_pieces())
+                    
+                    # Typed JSON report: verdict, confidence and per-category findings
+                    result = outcome["result"]
+                    show_verdict(verdict_slot, result.model_dump())
+                    timings = outcome["timing"]
+                    st.caption(
+                        f"⏱️ First words after {timings['first_chunk_ms']:.0f}ms, "
+                        f"verdict after {timings['verdict_ms']:.0f}ms, complete in {timings['total_ms']:.0f}ms"
+                    )
+                    if result.segments:
+                        report = result.segments
+                        st.caption(
+                            f"🧩 {report['completed']} of {report['count']} segments analyzed "
+                            f"({report['cancelled']} skipped once the verdict was settled) in {report['wall_ms']:.0f}ms, "
+                            f"against {report['serial_ms']:.0f}ms one after another"
+                        )
+                    if result.routing:
+                        routing = result.routing
+                        if routing["escalations"]:
+                            unsure = ", ".join(
+                                f"{step['tier']} ({step['outcome'].replace('_', ' ')})" for step in routing["steps"][:-1]
+                            )
+                            st.caption(f"🪜 Escalated to {result.model} after {unsure}")
+                        else:
+                            st.caption(f"🪶 Answered by the fast tier {result.model} in {routing['ms']:.0f}ms")
+                    for name, finding in (result.findings or {}).items():
+                        if "box" in finding:
+                            left, top, right, bottom = finding["box"]
+                            where = f"face crop {finding['crop']}, pixels ({left}, {top})-({right}, {bottom})"
+                            if "time" in finding:
+                                where += f" of the frame at {finding['time']:.2f}s"
+                            st.caption(f"📍 {CATEGORY_LABELS.get(name, name)}: {where}")
+                    source = result.model or "Gemini"
                 
-                # Display detailed analysis
-                st.markdown("### 📋 Detailed Analysis Report")
-                st.markdown(f"> {result_text}")
+                remember(key, uploaded_file.name, thumb, result, source)
                 
                 # Additional info box
                 st.info("💡 **Note:** This analysis is AI-powered and should be used as a guidance tool. For critical decisions, consult with human forensic experts.")
@@ -381,12 +544,31 @@ elif not uploaded_file:
         st.markdown("- MOV")
         st.markdown("- AVI")
 
+# --- RESULTS HISTORY ---
+# Earlier analyses of this session, rendered from session state (no decoding or model calls)
+if st.session_state.history:
+    st.markdown("---")
+    st.subheader("🕘 Analysis History")
+    for entry in st.session_state.history:
+        past = entry["result"]
+        label = f"{'🚩' if past.is_fake else '✅'} {entry['name']} - {past.verdict}"
+        if past.confidence:
+            label += f" ({past.confidence})"
+        with st.expander(label):
+            thumb_col, text_col = st.columns([1, 4])
+            if entry["thumbnail"] is not None:
+                thumb_col.image(entry["thumbnail"])
+            else:
+                thumb_col.markdown("🎞️ Video")
+            text_col.caption(f"Analyzed at {entry['at']} · {entry['source']}")
+            text_col.markdown(past.analysis)
+
 # --- FOOTER ---
 st.markdown("---")
 st.markdown("""
 <div style='text-align: center; color: #888;'>
     <p>🔍 Powered by Ved Industries </p>
     <p> Colabrated With VGY NXT<p>
-    <p>No data is stored or transmitted beyond the analysis session</p>
+    <p>{}</p>
 </div>
-""", unsafe_allow_html=True)
+""".format(storage_note()), unsafe_allow_html=True)
@@ -0,0 +1 @@
+"""Offline benchmarks; run modules with ``python -m benchmarks.<name>`` from the repo root."""
@@ -0,0 +1,120 @@
+"""How a noisy tenant affects quiet ones, with and without admission control.
+
+Usage: python -m benchmarks.admission [--latency 0.2] [--noisy 80] [--quiet 3]
+
+api/index.py runs against the stub model with four model slots. One API key
+floods the endpoint with ``--noisy`` requests, 40 at a time. Meanwhile
+``--quiet`` other keys each send six requests, one after another. Each tenant
+has its own address (via X-Forwarded-For). Three configurations are compared:
+
+  unprotected   no limits, model slots granted first come first served
+  fair queue    no limits, model slots shared round-robin between keys
+  admission     default per-key/per-IP limits and token budget, plus the fair queue
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DEEPFAKE_MAX_CONCURRENT_CALLS", "4")
+os.environ.setdefault("DEEPFAKE_QUEUE_TIMEOUT", "120")
+os.environ.setdefault("DEEPFAKE_CACHE_BACKEND", "none")
+os.environ.setdefault("DEEPFAKE_PHASH_ENABLED", "0")
+os.environ.setdefault("DEEPFAKE_PRESCREEN", "0")
+os.environ["DEEPFAKE_TRUST_FORWARDED_FOR"] = "1"
+
+from benchmarks import stub_model  # noqa: E402
+from detector.admission import AdmissionController  # noqa: E402
+
+SAMPLE = b"\xff\xd8\xff\xe0" + b"\x00" * 2048
+
+CONFIGURATIONS = {
+    "unprotected": dict(key_rate=0, ip_rate=0, tokens_per_minute=0, fair=False),
+    "fair queue": dict(key_rate=0, ip_rate=0, tokens_per_minute=0, fair=True),
+    "admission": dict(fair=True),
+}
+
+
+async def _drive(app, noisy: int, quiet: int) -> Dict[str, object]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        counter = 0
+
+        async def post(key: str, address: str) -> "tuple[int, float]":
+            nonlocal counter
+            counter += 1
+            files = {"file": ("sample.jpg", SAMPLE + f"{key}:{counter}".encode(), "image/jpeg")}
+            started = time.perf_counter()
+            response = await client.post(
+                "/api/analyze", files=files, data={"api_key": key}, headers={"X-Forwarded-For": address}
+            )
+            return response.status_code, time.perf_counter() - started
+
+        flood = asyncio.Semaphore(40)
+
+        async def noisy_one() -> int:
+            async with flood:
+                return (await post("noisy-tenant", "10.0.0.1"))[0]
+
+        async def quiet_tenant(number: int) -> List["tuple[int, float]"]:
+            await asyncio.sleep(0.1)  # arrive once the flood has queued up
+            return [await post(f"quiet-{number}", f"10.0.1.{number}") for _ in range(6)]
+
+        started = time.perf_counter()
+        noisy_codes, *quiet_results = await asyncio.gather(
+            asyncio.gather(*(noisy_one() for _ in range(noisy))),
+            *(quiet_tenant(number) for number in range(quiet)),
+        )
+        elapsed = time.perf_counter() - started
+
+    quiet_samples = [sample for results in quiet_results for sample in results]
+    quiet_ok = sorted(seconds for code, seconds in quiet_samples if code == 200)
+    return {
+        "noisy_ok": sum(code == 200 for code in noisy_codes),
+        "noisy_429": sum(code == 429 for code in noisy_codes),
+        "quiet_ok": len(quiet_ok),
+        "quiet_total": len(quiet_samples),
+        "quiet_p50": statistics.median(quiet_ok) * 1000 if quiet_ok else 0.0,
+        "quiet_p95": quiet_ok[min(len(quiet_ok) - 1, int(len(quiet_ok) * 0.95))] * 1000 if quiet_ok else 0.0,
+        "elapsed": elapsed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.2, help="stub model latency in seconds")
+    parser.add_argument("--noisy", type=int, default=80, help="requests sent by the noisy tenant")
+    parser.add_argument("--quiet", type=int, default=3, help="number of quiet tenants")
+    args = parser.parse_args()
+
+    index = importlib.import_module("api.index")
+    stub_model.install(index, latency=args.latency)
+
+    print(f"stub latency {args.latency:g}s, {index.model_executor.max_concurrent} model slots")
+    print(
+        f"{'configuration':>13} {'noisy ok':>9} {'noisy 429':>10} {'quiet ok':>9} "
+        f"{'quiet p50 ms':>13} {'quiet p95 ms':>13} {'model calls':>12}"
+    )
+    for name, options in CONFIGURATIONS.items():
+        index.admission = AdmissionController(**options)
+        calls_before = index.model_executor.completed
+        row = asyncio.run(_drive(index.app, args.noisy, args.quiet))
+        calls = index.model_executor.completed - calls_before
+        print(
+            f"{name:>13} {row['noisy_ok']:>9} {row['noisy_429']:>10} "
+            f"{row['quiet_ok']:>4}/{row['quiet_total']:<4} {row['quiet_p50']:>13.0f} {row['quiet_p95']:>13.0f} "
+            f"{calls:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Per-call latency of a fresh ``genai.Client`` per request versus the pooled client.
+
+Usage: python -m benchmarks.client_pool [--calls 50] [--latency 0.0]
+
+Runs the real SDK against a local HTTPS stub, so the difference is client
+construction plus the TCP and TLS handshakes the pool avoids.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.https_stub import StubGeminiServer  # noqa: E402
+from detector.clients import ClientPool  # noqa: E402
+
+
+def _run(server: StubGeminiServer, calls: int, pooled: bool) -> dict:
+    from google import genai
+
+    def factory(api_key: str):
+        return genai.Client(api_key=api_key, http_options=server.client_options())
+
+    pool = ClientPool(factory)
+    before = dict(server.counters)
+    samples = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        if pooled:
+            with pool.lease("bench-key") as lease:
+                lease.client.models.generate_content(model="stub-model", contents="ping")
+        else:
+            client = factory("bench-key")
+            client.models.generate_content(model="stub-model", contents="ping")
+            client.close()
+        samples.append((time.perf_counter() - started) * 1000)
+    pool.clear()
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p95": samples[int(len(samples) * 0.95) - 1],
+        "mean": statistics.fmean(samples),
+        "connections": server.counters["connections"] - before["connections"],
+        "pool": pool.stats(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub server latency in seconds")
+    args = parser.parse_args()
+
+    with StubGeminiServer(latency=args.latency) as server:
+        _run(server, 3, pooled=True)  # warm imports and the server
+        fresh = _run(server, args.calls, pooled=False)
+        pooled = _run(server, args.calls, pooled=True)
+
+    print(f"{'mode':>8} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'TCP+TLS connects':>17}")
+    for label, result in (("fresh", fresh), ("pooled", pooled)):
+        print(
+            f"{label:>8} {result['p50']:>8.2f} {result['p95']:>8.2f} {result['mean']:>8.2f} "
+            f"{result['connections']:>17}"
+        )
+    print(f"\nsaved per call: {fresh['mean'] - pooled['mean']:.2f}ms mean")
+    print(f"pool: {pooled['pool']}")
+
+
+if __name__ == "__main__":
+    main()
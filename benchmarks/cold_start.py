@@ -0,0 +1,131 @@
+"""Cold-start cost of the Vercel handler (api/index.py), broken down by module, with a budget check.
+
+Usage: python -m benchmarks.cold_start [--runs 5] [--route /api/health] [--top 15] [--budget-ms 1000]
+
+Every run is a fresh interpreter, like a cold lambda: it imports api/index.py
+and answers one GET on ``--route`` through the ASGI app, timing the import and
+the request separately. One more run under ``python -X importtime`` attributes
+the import time to packages (self time summed per top-level package; detector
+modules are listed one by one).
+
+The script exits with status 1 if the median import + first-request time
+exceeds ``--budget-ms``, or if answering the route imported ``google.genai``
+(that SDK is meant to load on the first analyze, never for health checks).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import api.index as index
+imported = time.perf_counter()
+status = []
+
+async def call():
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": ROUTE, "raw_path": ROUTE.encode(), "root_path": "",
+             "query_string": b"", "headers": [(b"host", b"localhost")], "client": ("127.0.0.1", 1),
+             "server": ("localhost", 80)}
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+    await index.app(scope, receive, send)
+
+asyncio.run(call())
+answered = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "request_ms": (answered - imported) * 1000,
+    "status": status[0] if status else None,
+    "genai_loaded": "google.genai" in sys.modules,
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def _probe(route: str, importtime: bool = False) -> Tuple[dict, str]:
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", f"ROUTE = {route!r}\n" + PROBE]
+    finished = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, timeout=120)
+    if finished.returncode != 0:
+        raise SystemExit(f"probe failed:\n{finished.stderr[-2000:]}")
+    return json.loads(finished.stdout.strip().splitlines()[-1]), finished.stderr
+
+
+def _package(module: str) -> str:
+    parts = module.split(".")
+    if parts[0] in ("detector", "api"):
+        return module
+    if parts[0] == "google" and len(parts) > 1:
+        return ".".join(parts[:2])
+    return parts[0]
+
+
+def breakdown(importtime_log: str) -> List[Tuple[str, float, int]]:
+    """``(package, self ms, modules)`` from ``-X importtime`` output, costliest first."""
+    totals: Dict[str, float] = defaultdict(float)
+    counts: Dict[str, int] = defaultdict(int)
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|", 2)
+        package = _package(name.strip())
+        totals[package] += int(own) / 1000
+        counts[package] += 1
+    return sorted(((name, ms, counts[name]) for name, ms in totals.items()), key=lambda row: -row[1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--route", default="/api/health", help="route answered after the import")
+    parser.add_argument("--top", type=int, default=15, help="packages listed in the breakdown")
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="max median import + first request")
+    args = parser.parse_args()
+
+    runs = [_probe(args.route)[0] for _ in range(max(1, args.runs))]
+    imports = [run["import_ms"] for run in runs]
+    requests = [run["request_ms"] for run in runs]
+    totals = [run["import_ms"] + run["request_ms"] for run in runs]
+    print(f"api/index.py cold start, GET {args.route} (status {runs[0]['status']}), {len(runs)} runs")
+    print(f"{'':>14}{'median':>10}{'min':>10}{'max':>10}")
+    for label, values in (("import", imports), ("first request", requests), ("total", totals)):
+        print(f"{label:>14}{statistics.median(values):>8.1f}ms{min(values):>8.1f}ms{max(values):>8.1f}ms")
+    print(f"modules loaded: {runs[0]['modules']}, google.genai loaded: {runs[0]['genai_loaded']}")
+
+    profiled, log = _probe(args.route, importtime=True)
+    rows = breakdown(log)
+    traced = sum(ms for _, ms, _ in rows)
+    print(f"\nimport time by package (-X importtime, {traced:.0f}ms traced incl. interpreter startup)")
+    print(f"{'package':<32}{'self ms':>10}{'share':>8}{'modules':>9}")
+    for name, ms, count in rows[: args.top]:
+        print(f"{name:<32}{ms:>10.1f}{ms / traced:>8.1%}{count:>9}")
+
+    failures = []
+    median_total = statistics.median(totals)
+    if median_total > args.budget_ms:
+        failures.append(f"median cold start {median_total:.0f}ms exceeds the {args.budget_ms:.0f}ms budget")
+    if any(run["genai_loaded"] for run in runs):
+        failures.append(f"GET {args.route} imported google.genai")
+    if failures:
+        print("\nFAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print(f"\nOK: {median_total:.0f}ms within the {args.budget_ms:.0f}ms budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Instructions sent inline versus from a Gemini context cache, with the registry's accounting.
+
+Usage: python -m benchmarks.context_cache [--requests 12] [--latency 0.2] [--long-tokens 1500]
+
+Every scenario sends ``--requests`` photos through ``AnalysisEngine.analyze`` with a
+fresh :class:`detector.context_cache.ContextCacheRegistry`. The real SDK talks to
+the local HTTPS stub.
+
+  current prompt      FORENSIC_PROMPT, below the minimum cacheable size: inline
+  long prompt         instructions padded to ``--long-tokens``: cached once, then referenced
+  caching refused     the stub rejects cache creation: inline, one failed create
+  cache expired       the stub forgets its caches halfway: one inline retry, then recreated
+
+Reports request bytes and prompt tokens per call, input tokens served from the
+cache, and the cache operations. The stub does not model server-side
+tokenization time, so latency differences here come from request size only.
+Needs the openssl CLI.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DEEPFAKE_CACHE_BACKEND", "none")
+
+from benchmarks.https_stub import StubGeminiServer  # noqa: E402
+from benchmarks.preprocess import _synthetic_photo  # noqa: E402
+
+GUIDANCE = (
+    "Reference note {index}: compare specular highlights in both eyes, check that hair strands cross the "
+    "background cleanly, and look for repeated texture tiles in skin, fabric and foliage. "
+)
+
+
+def _scenario(name: str, prompt: str, args: argparse.Namespace, caching: bool = True, expire: bool = False) -> None:
+    from google import genai
+
+    from detector.clients import ClientPool
+    from detector.context_cache import ContextCacheRegistry
+    from detector.engine import AnalysisEngine, AnalysisRequest
+    from detector.resilience import ModelCaller
+
+    photo = _synthetic_photo(1.0, seed=1)
+    with StubGeminiServer(latency=args.latency, caching=caching) as stub:
+        contexts = ContextCacheRegistry(enabled=True)
+        engine = AnalysisEngine(
+            clients=ClientPool(lambda api_key: genai.Client(api_key=api_key, http_options=stub.client_options())),
+            caller=ModelCaller(),
+            prompt=prompt,
+            index=lambda: None,
+            screen=lambda data, mime_type: None,
+            context_cache=contexts,
+        )
+        timings = []
+        for index in range(args.requests):
+            if expire and index == args.requests // 2:
+                stub.expire_caches()
+            request = AnalysisRequest.from_bytes(photo + index.to_bytes(4, "big"), "image/jpeg", "bench")
+            started = time.perf_counter()
+            asyncio.run(engine.analyze(request))
+            timings.append(time.perf_counter() - started)
+        stats = contexts.stats()
+        calls = stats["cached_calls"] + stats["inline_calls"]
+        print(
+            f"{name:<18}{stub.counters['generate_bytes'] / calls / 1024:>10.1f}"
+            f"{contexts.prompt_tokens / calls:>10.0f}{stats['tokens_saved_per_request']:>10.0f}"
+            f"{stats['cached_calls']:>8}{stats['inline_calls']:>8}{stats['created']:>9}"
+            f"{stats['create_failures']:>9}{stats['recreated']:>10}{statistics.median(timings) * 1000:>9.0f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub seconds per reply")
+    parser.add_argument("--long-tokens", type=int, default=1500, help="approximate size of the padded instructions")
+    args = parser.parse_args()
+
+    from detector.engine import FORENSIC_PROMPT
+
+    notes = []
+    while len(FORENSIC_PROMPT) + sum(len(note) for note in notes) < args.long_tokens * 4:
+        notes.append(GUIDANCE.format(index=len(notes) + 1))
+    long_prompt = FORENSIC_PROMPT + "\n\n" + "".join(notes)
+
+    print(f"{args.requests} photos per scenario, stub latency {args.latency:.1f}s")
+    print(
+        f"{'scenario':<18}{'KiB/call':>10}{'prompt':>10}{'cached':>10}{'cached':>8}{'inline':>8}"
+        f"{'created':>9}{'refused':>9}{'recreated':>10}{'p50 ms':>9}"
+    )
+    print(f"{'':<18}{'':>10}{'tok/call':>10}{'tok/call':>10}{'calls':>8}{'calls':>8}")
+    _scenario("current prompt", FORENSIC_PROMPT, args)
+    _scenario("long prompt", long_prompt, args)
+    _scenario("caching refused", long_prompt, args, caching=False)
+    _scenario("cache expired", long_prompt, args, expire=True)
+
+
+if __name__ == "__main__":
+    main()
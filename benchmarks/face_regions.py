@@ -0,0 +1,230 @@
+"""Face crops plus a small context copy against the whole downscaled photo: payload, tokens, detail and latency.
+
+Usage: python -m benchmarks.face_regions [--count 6] [--megapixels 12] [--faces 2] [--uplink-mbps 20]
+       python -m benchmarks.face_regions --faces 0   # the cost of searching photos without faces
+       python -m benchmarks.face_regions --images DIR   # your own .jpg/.png photos
+
+Synthetic camera photos get ``--faces`` drawn faces (OpenCV's Haar cascade
+finds them) and each photo goes through ``AnalysisEngine`` against the local
+HTTPS stub twice: prepared as a whole (``DEEPFAKE_FACE_CROPS=0``) and as face
+crops. A photo without a face, or smaller than ``DEEPFAKE_MAX_IMAGE_SIDE``,
+costs the face search and is then prepared as a whole.
+
+Per mode the report shows payload size, estimated image tokens, the width of
+the largest face as the model receives it, preprocessing time, and end-to-end
+latency: preprocessing, the stub round trip (``--latency`` plus
+``--latency-per-mb`` of request body), and the upload time at ``--uplink-mbps``.
+The stub's reply points the facial-artifacts finding at crop 1, and the report
+counts how often the box it is resolved to holds a drawn face. Needs OpenCV and
+the openssl CLI.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DEEPFAKE_CACHE_BACKEND", "none")
+
+from benchmarks.https_stub import StubGeminiServer  # noqa: E402
+from benchmarks.preprocess import _estimated_tokens, _load_images, _synthetic_photo  # noqa: E402
+
+Box = Tuple[int, int, int, int]
+
+
+def _face(size: int):
+    """A drawn frontal face on a ``2 * size`` square: skin oval, brows, eyes, nose and mouth."""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    image = Image.new("RGB", (size * 2, size * 2), (90, 110, 130))
+    draw = ImageDraw.Draw(image)
+    # Half-width and half-height of the face; features are placed relative to them
+    w, h = size * 0.5, size * 0.65
+    draw.ellipse((size - w, size - h, size + w, size + h), fill=(225, 185, 160))
+    for side in (-1, 1):
+        x, y = size + side * w * 0.42, size - h * 0.18
+        draw.rectangle((x - w * 0.28, y - h * 0.2, x + w * 0.28, y - h * 0.14), fill=(60, 40, 30))
+        draw.ellipse((x - w * 0.2, y - h * 0.07, x + w * 0.2, y + h * 0.07), fill=(40, 30, 30))
+    nose = [(size, size - h * 0.1), (size - w * 0.12, size + h * 0.2), (size + w * 0.12, size + h * 0.2)]
+    draw.polygon(nose, fill=(200, 150, 130))
+    draw.ellipse((size - w * 0.35, size + h * 0.38, size + w * 0.35, size + h * 0.5), fill=(150, 60, 60))
+    return image.filter(ImageFilter.GaussianBlur(size / 60))
+
+
+def _portrait(megapixels: float, faces: int, seed: int) -> Tuple[bytes, List[Box]]:
+    """A synthetic camera photo with ``faces`` drawn faces, and their boxes (largest first)."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(_synthetic_photo(megapixels, seed))) as photo:
+        exif = photo.getexif()
+        photo.load()
+    boxes: List[Box] = []
+    for index in range(faces):
+        size = max(40, photo.width // (8 + 4 * index))
+        left = photo.width * (1 + 3 * index) // (3 * faces + 1)
+        top = photo.height // 3 - size // 2 + (seed * 37 % max(1, photo.height // 6))
+        photo.paste(_face(size), (left, top))
+        boxes.append((left, top, left + 2 * size, top + 2 * size))
+    buffer = io.BytesIO()
+    photo.save(buffer, "JPEG", quality=92, exif=exif)
+    return buffer.getvalue(), boxes
+
+
+def _reply(model: str, request: dict) -> str:
+    """Scripted report; with face crops in the request the facial finding names crop 1."""
+    cropped = "Face crop 1," in json.dumps(request.get("contents"))
+    facial = {"anomaly": False, "detail": "Scripted finding."}
+    if cropped:
+        facial["crop"] = 1
+    return json.dumps(
+        {
+            "verdict": "REAL",
+            "confidence": 90,
+            "findings": {
+                "lighting": {"anomaly": False, "detail": "Scripted finding."},
+                "facial_artifacts": facial,
+                "texture_noise": {"anomaly": False, "detail": "Scripted finding."},
+            },
+            "summary": "Scripted reply.",
+        }
+    )
+
+
+def _face_width(prepared, faces: List[Box]) -> Optional[float]:
+    """Width in sent pixels of the largest face the model receives, or ``None`` without known faces."""
+    if not faces:
+        return None
+    face = faces[0]
+    width = face[2] - face[0]
+    crops = getattr(prepared, "crops", None)
+    if crops:
+        for crop in crops:
+            if crop.box[0] <= face[0] + width // 2 <= crop.box[2]:
+                return width * crop.size[0] / (crop.box[2] - crop.box[0])
+    if prepared.original_dimensions and prepared.transformed:
+        with _open(prepared.data) as image:
+            return width * image.width / prepared.original_dimensions[0]
+    return float(width)
+
+
+def _open(data: bytes):
+    from PIL import Image
+
+    return Image.open(io.BytesIO(data))
+
+
+def _tokens(prepared) -> int:
+    crops = getattr(prepared, "crops", None)
+    if crops is None:
+        return _estimated_tokens(prepared.data)
+    return _estimated_tokens(prepared.context) + sum(_estimated_tokens(crop.jpeg) for crop in crops)
+
+
+def _located(result, faces: List[Box]) -> bool:
+    box = ((result.findings or {}).get("facial_artifacts") or {}).get("box")
+    if not box or not faces:
+        return False
+    return any(box[0] <= (f[0] + f[2]) / 2 <= box[2] and box[1] <= (f[1] + f[3]) / 2 <= box[3] for f in faces)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=6)
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--faces", type=int, default=2, help="faces drawn per synthetic photo")
+    parser.add_argument("--images", help="directory of .jpg/.png files to use instead of synthetic photos")
+    parser.add_argument("--uplink-mbps", type=float, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub seconds per reply")
+    parser.add_argument("--latency-per-mb", type=float, default=0.2, help="stub seconds per MiB of request body")
+    args = parser.parse_args()
+
+    from google import genai
+
+    import detector.regions
+    from detector.clients import ClientPool
+    from detector.context_cache import ContextCacheRegistry
+    from detector.engine import AnalysisEngine, AnalysisRequest
+    from detector.faces import faces_available
+    from detector.preprocess import prepare
+
+    if not faces_available():
+        sys.exit("needs opencv-python-headless<5 for face detection")
+    if args.images:
+        samples = [(name, data, mime_type, []) for name, data, mime_type in _load_images(args)]
+    else:
+        samples = []
+        for seed in range(args.count):
+            data, faces = _portrait(args.megapixels, args.faces, seed)
+            samples.append((f"portrait-{seed}.jpg", data, "image/jpeg", faces))
+    if not samples:
+        sys.exit("no images found")
+
+    rows = {"whole": [], "face crops": []}
+    located = bundled = 0
+    with StubGeminiServer(latency=args.latency, latency_per_mb=args.latency_per_mb, script=_reply) as stub:
+        engine = AnalysisEngine(
+            clients=ClientPool(lambda api_key: genai.Client(api_key=api_key, http_options=stub.client_options())),
+            index=lambda: None,
+            screen=lambda data, mime_type: None,
+            context_cache=ContextCacheRegistry(enabled=False),
+        )
+        for name, data, mime_type, faces in samples:
+            for label, crops in (("whole", False), ("face crops", True)):
+                detector.regions.FACE_CROPS = crops
+                started = time.perf_counter()
+                prepared = prepare(data, mime_type)
+                prepare_ms = (time.perf_counter() - started) * 1000
+                # A distinct key per mode, so the second pass is not a verdict cache hit
+                request = AnalysisRequest.from_bytes(data, mime_type, f"bench-{label}")
+                started = time.perf_counter()
+                result = asyncio.run(engine.analyze_precomputed(request, [], None, [], prepared))
+                call_ms = (time.perf_counter() - started) * 1000
+                upload_ms = prepared.payload_bytes * 8 / (args.uplink_mbps * 1e6) * 1000
+                rows[label].append(
+                    (
+                        prepared.payload_bytes,
+                        _tokens(prepared),
+                        _face_width(prepared, faces),
+                        prepare_ms,
+                        prepare_ms + call_ms + upload_ms,
+                    )
+                )
+                if crops and prepared.regions:
+                    bundled += 1
+                    located += _located(result, faces)
+            sent = len(prepared.regions["crops"]) if prepared.regions else 0
+            print(f"{name}: {len(data) / 1e6:.2f}MB, {sent} face crop(s), {prepared.payload_bytes / 1e3:.0f}KB sent")
+
+    print(
+        f"\n{len(samples)} images, uplink modelled at {args.uplink_mbps:g} Mbit/s, "
+        f"stub {args.latency:.1f}s + {args.latency_per_mb:.1f}s/MiB"
+    )
+    print(f"{'payload':>11} {'mean KB':>9} {'tokens':>8} {'face px':>8} {'prep ms':>9} {'e2e ms':>9}")
+    for label, measured in rows.items():
+        widths = [row[2] for row in measured if row[2] is not None]
+        face_px = f"{statistics.fmean(widths):>8.0f}" if widths else f"{'-':>8}"
+        print(
+            f"{label:>11} {statistics.fmean(row[0] for row in measured) / 1e3:>9.0f} "
+            f"{statistics.fmean(row[1] for row in measured):>8.0f} {face_px} "
+            f"{statistics.fmean(row[3] for row in measured):>9.1f} {statistics.fmean(row[4] for row in measured):>9.1f}"
+        )
+    whole, cropped = rows["whole"], rows["face crops"]
+    saved = 1 - sum(row[4] for row in cropped) / sum(row[4] for row in whole)
+    print(
+        f"\npayload {1 - sum(row[0] for row in cropped) / sum(row[0] for row in whole):.0%} smaller, "
+        f"end-to-end {abs(saved):.0%} {'faster' if saved >= 0 else 'slower'}; "
+        f"{bundled} of {len(samples)} sent as face crops"
+    )
+    if not args.images:
+        print(f"facial finding resolved to a box around a drawn face: {located}/{bundled}")
+
+
+if __name__ == "__main__":
+    main()
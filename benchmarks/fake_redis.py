@@ -0,0 +1,62 @@
+"""Minimal in-memory stand-in for the subset of redis-py used by ``detector``."""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class FakeRedis:
+    def __init__(self) -> None:
+        self._values: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._zsets: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[Any]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._values[key]
+            return None
+        return value
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._live(key)
+            return value.encode("utf-8") if isinstance(value, str) else value
+
+    def set(self, key: str, value: Any, ex: Optional[float] = None) -> bool:
+        with self._lock:
+            self._values[key] = (value, time.time() + ex if ex else None)
+            return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            removed = 0
+            for key in keys:
+                removed += int(self._values.pop(key, None) is not None)
+                removed += int(self._zsets.pop(key, None) is not None)
+            return removed
+
+    def zadd(self, key: str, mapping: Dict[str, float]) -> int:
+        with self._lock:
+            zset = self._zsets.setdefault(key, {})
+            added = sum(1 for member in mapping if member not in zset)
+            zset.update(mapping)
+            return added
+
+    def zcard(self, key: str) -> int:
+        with self._lock:
+            return len(self._zsets.get(key, {}))
+
+    def zrange(self, key: str, start: int, end: int) -> List[bytes]:
+        with self._lock:
+            members = sorted(self._zsets.get(key, {}).items(), key=lambda item: item[1])
+            end = len(members) if end == -1 else end + 1
+            return [member.encode("utf-8") for member, _ in members[start:end]]
+
+    def zrem(self, key: str, *members: str) -> int:
+        with self._lock:
+            zset = self._zsets.get(key, {})
+            return sum(1 for member in members if zset.pop(member, None) is not None)
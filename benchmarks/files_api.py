@@ -0,0 +1,81 @@
+"""Inline bytes versus the Files API path for repeated analyses of one large video.
+
+Usage: python -m benchmarks.files_api [--size-mb 16] [--repeats 5]
+
+Drives the real SDK against the local HTTPS stub and reports request bytes and
+latency per analysis. The last Files API run expires the remote file halfway to
+show the handle being dropped and re-uploaded once.
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.https_stub import StubGeminiServer  # noqa: E402
+from detector.files import RemoteFileRegistry, generate_with_remote_file  # noqa: E402
+
+PROMPT = "Analyze this video for deepfake artifacts."
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=16)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    from google import genai
+    from google.genai import types
+
+    video = b"\x00\x00\x00\x18ftypmp42" + os.urandom(int(args.size_mb * 1024 * 1024))
+    with StubGeminiServer() as server:
+        client = genai.Client(api_key="bench", http_options=server.client_options())
+
+        def measure(label: str, call, expire_at: int = -1) -> None:
+            before = dict(server.counters)
+            samples = []
+            for attempt in range(args.repeats):
+                if attempt == expire_at:
+                    server.expire_files()
+                started = time.perf_counter()
+                call()
+                samples.append((time.perf_counter() - started) * 1000)
+            sent = (
+                server.counters["generate_bytes"] - before["generate_bytes"]
+                + server.counters["upload_bytes"] - before["upload_bytes"]
+            )
+            uploads = server.counters["uploads"] - before["uploads"]
+            print(
+                f"{label:>22} {statistics.fmean(samples):>9.1f} {samples[0]:>9.1f} "
+                f"{statistics.fmean(samples[1:] or samples):>9.1f} {sent / args.repeats / 1e6:>11.2f} {uploads:>8}"
+            )
+
+        def inline() -> None:
+            client.models.generate_content(
+                model="stub-model",
+                contents=[types.Part.from_bytes(data=video, mime_type="video/mp4"), PROMPT],
+            )
+
+        def remote(registry: RemoteFileRegistry):
+            def call() -> None:
+                generate_with_remote_file(
+                    client, "bench", "stub-model", "digest", io.BytesIO(video), "video/mp4", PROMPT, len(video), registry
+                )
+
+            return call
+
+        print(f"{args.size_mb:g}MB video, {args.repeats} analyses each")
+        print(f"{'path':>22} {'mean ms':>9} {'first ms':>9} {'rest ms':>9} {'MB sent/call':>11} {'uploads':>8}")
+        measure("inline bytes", inline)
+        measure("files api", remote(RemoteFileRegistry()))
+        expiring = RemoteFileRegistry()
+        measure("files api (expiry)", remote(expiring), expire_at=args.repeats // 2)
+        print(f"\nregistry after expiry run: {expiring.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""Local HTTPS server speaking just enough of the Gemini REST API for offline benchmarks.
+
+A throwaway self-signed certificate is generated with the ``openssl`` CLI; point
+a real ``genai.Client`` at it with :func:`client_options`.
+
+Faults can be injected into generate calls: :meth:`StubGeminiServer.inject`
+queues one-off errors or slow replies, :attr:`StubGeminiServer.down` makes a
+model fail every request until it is removed, and ``error_rate`` fails a random
+(seeded, so repeatable) share of all generate calls.
+
+Context caches (``cachedContents``) can be created and extended; with ``caching``
+off, creating one fails like a model without caching support. Reported prompt
+tokens include the system instruction, cached or inline (about four characters
+per token).
+
+``script(model, request)`` can pick each reply's text, e.g. a scripted confidence
+per model for the routing benchmark.
+"""
+
+import datetime
+import json
+import os
+import random
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_TEXT = (
+    '{"verdict": "REAL", "confidence": 91, "findings": {'
+    '"lighting": {"anomaly": false, "detail": "Shadows match the key light."}, '
+    '"facial_artifacts": {"anomaly": false, "detail": "Clean edges and eye reflections."}, '
+    '"texture_noise": {"anomaly": false, "detail": "Uniform sensor noise."}}, '
+    '"summary": "Lighting, texture and edges are consistent."}'
+)
+
+
+def _self_signed(workdir: str) -> "tuple[str, str]":
+    if shutil.which("openssl") is None:
+        raise RuntimeError("the openssl CLI is required to create the stub certificate")
+    cert = os.path.join(workdir, "stub.crt")
+    key = os.path.join(workdir, "stub.key")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+            "-keyout", key, "-out", cert,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def _json(body: bytes) -> dict:
+    try:
+        return json.loads(body or b"{}")
+    except ValueError:
+        return {}
+
+
+def _instruction_tokens(request: dict) -> int:
+    instruction = request.get("systemInstruction") or {}
+    return sum(len(part.get("text", "")) for part in instruction.get("parts", [])) // 4
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "StubGeminiServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.count("connections")
+
+    def _reply(self, status: int, payload: dict, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _file_resource(self, name: str) -> dict:
+        record = self.server.files[name]
+        expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=48)
+        return {
+            "name": name,
+            "uri": f"{self.server.url}v1beta/{name}",
+            "mimeType": record["mime_type"],
+            "sizeBytes": str(record["size"]),
+            "state": "ACTIVE" if time.monotonic() >= record["ready_at"] else "PROCESSING",
+            "expirationTime": expires.isoformat().replace("+00:00", "Z"),
+        }
+
+    def _create_cache(self, body: bytes) -> None:
+        self.server.count("requests")
+        if not self.server.caching:
+            message = "Cached content is too small or caching is not supported for this model"
+            self._reply(400, {"error": {"code": 400, "message": message, "status": "INVALID_ARGUMENT"}})
+            return
+        request = json.loads(body or b"{}")
+        name = self.server.new_cache(_instruction_tokens(request), request.get("displayName", ""))
+        self._reply(200, self._cache_resource(name))
+
+    def _cache_resource(self, name: str) -> dict:
+        record = self.server.caches[name]
+        expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+        return {
+            "name": name,
+            "displayName": record["display_name"],
+            "usageMetadata": {"totalTokenCount": record["tokens"]},
+            "expireTime": expires.isoformat().replace("+00:00", "Z"),
+        }
+
+    def do_PATCH(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        self.server.count("requests")
+        name = self.path.split("?", 1)[0].split("/v1beta/", 1)[-1]
+        if name in self.server.caches:
+            self._reply(200, self._cache_resource(name))
+        else:
+            self._reply(404, {"error": {"code": 404, "message": f"{name} not found", "status": "NOT_FOUND"}})
+
+    def do_GET(self) -> None:
+        self.server.count("requests")
+        name = self.path.split("?", 1)[0].split("/v1beta/", 1)[-1]
+        if name in self.server.files:
+            self._reply(200, self._file_resource(name))
+        else:
+            self._reply(404, {"error": {"code": 404, "message": f"{name} not found", "status": "NOT_FOUND"}})
+
+    def _upload(self, body: bytes) -> None:
+        command = self.headers.get("X-Goog-Upload-Command", "")
+        if "start" in command:
+            session = self.server.new_upload(json.loads(body or b"{}").get("file", {}))
+            self.send_response(200)
+            self.send_header("X-Goog-Upload-URL", f"{self.server.url}upload-session/{session}")
+            self.send_header("X-Goog-Upload-Status", "active")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        session = self.path.rsplit("/", 1)[-1]
+        pending = self.server.uploads[session]
+        pending["size"] += len(body)
+        self.server.bump("upload_bytes", len(body))
+        if "finalize" not in command:
+            self.send_response(200)
+            self.send_header("X-Goog-Upload-Status", "active")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        name = self.server.finish_upload(session)
+        payload = json.dumps({"file": self._file_resource(name)}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("X-Goog-Upload-Status", "final")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        self.server.count("requests")
+        if "upload" in self.path.split("?", 1)[0].split("/")[1]:
+            self._upload(body)
+            return
+        if self.path.split("?", 1)[0].endswith("/cachedContents"):
+            self._create_cache(body)
+            return
+        if self.server.latency or self.server.latency_per_mb:
+            time.sleep(self.server.latency + self.server.latency_per_mb * len(body) / 2**20)
+        streaming = ":streamGenerateContent" in self.path
+        if ":generateContent" not in self.path and not streaming:
+            self._reply(404, {"error": {"code": 404, "message": f"no stub for {self.path}"}})
+            return
+        self.server.bump("generate_bytes", len(body))
+        model = self.path.split("?", 1)[0].rsplit("/", 1)[-1].split(":", 1)[0]
+        if self._inject_fault(model):
+            return
+        for name in self.server.referenced_files(body):
+            if name not in self.server.files:
+                message = f"File {name} was not found"
+                self._reply(404, {"error": {"code": 404, "message": message, "status": "NOT_FOUND"}})
+                return
+        request = _json(body)
+        usage = {"promptTokenCount": 300 + _instruction_tokens(request), "candidatesTokenCount": 40}
+        cache = request.get("cachedContent")
+        if cache:
+            if cache not in self.server.caches:
+                message = f"CachedContent not found (or permission denied): {cache}"
+                self._reply(403, {"error": {"code": 403, "message": message, "status": "PERMISSION_DENIED"}})
+                return
+            self.server.count("cached_requests")
+            usage["promptTokenCount"] += self.server.caches[cache]["tokens"]
+            usage["cachedContentTokenCount"] = self.server.caches[cache]["tokens"]
+        usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+        text = self.server.reply(model, request)
+        if streaming:
+            self._stream(text, usage)
+            return
+        time.sleep(self.server.chunk_delay * (len(self.server.chunks(text)) - 1))
+        self._reply(
+            200,
+            {
+                "candidates": [
+                    {"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}
+                ],
+                "usageMetadata": usage,
+            },
+        )
+
+    def _inject_fault(self, model: str) -> bool:
+        """Apply a queued or standing fault for ``model``; True when an error reply was sent."""
+        fault = self.server.take_fault(model)
+        if fault is None:
+            return False
+        if fault.get("delay"):
+            time.sleep(fault["delay"])
+        status = fault.get("status")
+        if not status:
+            return False
+        self.server.count("faults")
+        headers = {"Retry-After": str(fault["retry_after"])} if fault.get("retry_after") is not None else None
+        message = fault.get("message", f"injected {status} for {model}")
+        self._reply(status, {"error": {"code": status, "message": message, "status": "INJECTED"}}, headers)
+        return True
+
+    def _stream(self, text: str, usage: dict) -> None:
+        # Server-sent events over chunked transfer encoding, one text piece per event; usage rides on the last.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = self.server.chunks(text)
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(self.server.chunk_delay)
+            candidate = {"content": {"role": "model", "parts": [{"text": piece}]}}
+            payload: Dict[str, Any] = {"candidates": [candidate]}
+            if index == len(pieces) - 1:
+                candidate["finishReason"] = "STOP"
+                payload["usageMetadata"] = usage
+            event = f"data: {json.dumps(payload)}\r\n\r\n".encode("utf-8")
+            self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class StubGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        text: str = DEFAULT_TEXT,
+        processing_delay: float = 0.0,
+        chunk_delay: float = 0.0,
+        chunk_chars: int = 24,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: int = 0,
+        latency_per_mb: float = 0.0,
+        caching: bool = True,
+        script: Optional[Callable[[str, dict], Optional[str]]] = None,
+    ) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency = latency
+        # Extra wait per MiB of request body, as the model's input processing grows with it
+        self.latency_per_mb = latency_per_mb
+        self.text = text
+        # ``script(model, request)`` picks the reply text per call (``None`` for ``text``)
+        self.script = script
+        # Generation speed: every ``chunk_chars`` of ``text`` take ``chunk_delay`` seconds,
+        # streamed or not; ``latency`` is the wait before the first one.
+        self.chunk_delay = chunk_delay
+        self.chunk_chars = chunk_chars
+        self.processing_delay = processing_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self.counters = {
+            "connections": 0,
+            "requests": 0,
+            "uploads": 0,
+            "upload_bytes": 0,
+            "generate_bytes": 0,
+            "faults": 0,
+            "caches_created": 0,
+            "cached_requests": 0,
+        }
+        # Queued one-off faults, and models that fail every call: model -> fault
+        self.faults: deque = deque()
+        self.down: Dict[str, dict] = {}
+        self.files: dict = {}
+        self.uploads: dict = {}
+        self.caches: dict = {}
+        self.caching = caching
+        self._counter_lock = threading.Lock()
+        self._workdir = tempfile.mkdtemp(prefix="gemini-stub-")
+        self.certfile, keyfile = _self_signed(self._workdir)
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(self.certfile, keyfile)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self._thread: Optional[threading.Thread] = None
+
+    def reply(self, model: str, request: dict) -> str:
+        scripted = self.script(model, request) if self.script is not None else None
+        return self.text if scripted is None else scripted
+
+    def chunks(self, text: Optional[str] = None) -> list:
+        text = self.text if text is None else text
+        size = max(1, self.chunk_chars)
+        return [text[start:start + size] for start in range(0, len(text), size)] or [""]
+
+    def inject(
+        self,
+        status: Optional[int] = None,
+        times: int = 1,
+        retry_after: Optional[float] = None,
+        delay: float = 0.0,
+        model: Optional[str] = None,
+    ) -> None:
+        """Make the next ``times`` generate calls (for ``model``, or any) fail with ``status``.
+
+        ``delay`` holds the reply for that many seconds first; with no status the
+        call then succeeds, which simulates a slow tail.
+        """
+        fault = {"status": status, "retry_after": retry_after, "delay": delay, "model": model}
+        with self._counter_lock:
+            self.faults.extend(dict(fault) for _ in range(times))
+
+    def take_fault(self, model: str) -> Optional[dict]:
+        with self._counter_lock:
+            if model in self.down:
+                return self.down[model]
+            for fault in self.faults:
+                if fault["model"] in (None, model):
+                    self.faults.remove(fault)
+                    return fault
+            if self.error_rate and self._random.random() < self.error_rate:
+                return {"status": self.error_status, "retry_after": None, "delay": 0.0}
+        return None
+
+    def count(self, name: str) -> None:
+        self.bump(name, 1)
+
+    def bump(self, name: str, amount: int) -> None:
+        with self._counter_lock:
+            self.counters[name] += amount
+
+    def new_upload(self, metadata: dict) -> str:
+        with self._counter_lock:
+            session = str(len(self.uploads) + 1)
+            self.uploads[session] = {"mime_type": metadata.get("mimeType", "application/octet-stream"), "size": 0}
+            return session
+
+    def finish_upload(self, session: str) -> str:
+        with self._counter_lock:
+            self.counters["uploads"] += 1
+            name = f"files/stub{session}"
+            record = self.uploads.pop(session)
+            record["ready_at"] = time.monotonic() + self.processing_delay
+            self.files[name] = record
+            return name
+
+    def new_cache(self, tokens: int, display_name: str) -> str:
+        with self._counter_lock:
+            self.counters["caches_created"] += 1
+            name = f"cachedContents/stub{self.counters['caches_created']}"
+            self.caches[name] = {"tokens": tokens, "display_name": display_name}
+            return name
+
+    def expire_caches(self) -> None:
+        """Forget every context cache, as if their TTL had run out."""
+        with self._counter_lock:
+            self.caches.clear()
+
+    def expire_files(self) -> None:
+        """Forget every uploaded file, as if their 48-hour lifetime had passed."""
+        with self._counter_lock:
+            self.files.clear()
+
+    @staticmethod
+    def referenced_files(body: bytes) -> list:
+        try:
+            contents = json.loads(body).get("contents", [])
+        except ValueError:
+            return []
+        names = []
+        for content in contents:
+            for part in content.get("parts", []):
+                data = part.get("fileData") or part.get("file_data") or {}
+                uri = data.get("fileUri") or data.get("file_uri")
+                if uri:
+                    names.append(uri.split("/v1beta/", 1)[-1])
+        return names
+
+    @property
+    def url(self) -> str:
+        return f"https://localhost:{self.server_address[1]}/"
+
+    def client_options(self) -> Any:
+        from google.genai import types
+
+        return types.HttpOptions(base_url=self.url, client_args={"verify": self.certfile})
+
+    def __enter__(self) -> "StubGeminiServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.shutdown()
+        self.server_close()
+        shutil.rmtree(self._workdir, ignore_errors=True)
@@ -0,0 +1,109 @@
+"""Throughput of the analyze endpoints against a stub model at rising concurrency.
+
+Usage: python -m benchmarks.load_test [--latency 0.5] [--levels 1,2,4,8,16]
+
+With the model call running off the event loop, requests/second should scale
+with concurrency up to the executor's limit, and /health should stay fast.
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# One key and one address drive every request; admission control would throttle them.
+os.environ.setdefault("DEEPFAKE_KEY_RATE", "0")
+os.environ.setdefault("DEEPFAKE_IP_RATE", "0")
+os.environ.setdefault("DEEPFAKE_KEY_TOKENS_PER_MINUTE", "0")
+
+from benchmarks import stub_model  # noqa: E402
+
+SAMPLE = b"\xff\xd8\xff\xe0" + b"\x00" * 2048
+
+TARGETS = {
+    "api/index.py": ("api.index", "/api/analyze", "/api/health", "form"),
+    "api_backend.py": ("api_backend", "/analyze", "/health", "query"),
+}
+
+
+async def _drive(
+    app, path: str, health_path: str, key_in: str, concurrency: int, total: int, salt: str = ""
+) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        failures = 0
+
+        async def one(index: int) -> None:
+            nonlocal failures
+            async with semaphore:
+                # Unique bytes per request and target: both targets share one process-wide
+                # verdict cache, so the second would otherwise be served from the first's entries
+                payload = SAMPLE + f"{salt}:{concurrency}:{index}".encode()
+                files = {"file": ("sample.jpg", payload, "image/jpeg")}
+                if key_in == "form":
+                    response = await client.post(path, files=files, data={"api_key": "bench"})
+                else:
+                    response = await client.post(path, files=files, params={"api_key": "bench"})
+                if response.status_code != 200:
+                    failures += 1
+
+        health_latencies = []
+
+        async def probe_health(stop: asyncio.Event) -> None:
+            while not stop.is_set():
+                started = time.perf_counter()
+                await client.get(health_path)
+                health_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.05)
+
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_health(stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(one(index) for index in range(total)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await prober
+
+    return {
+        "rps": total / elapsed,
+        "elapsed": elapsed,
+        "failures": failures,
+        "health_ms": 1000 * (statistics.median(health_latencies) if health_latencies else 0.0),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.5, help="stub model latency in seconds")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="comma-separated concurrency levels")
+    parser.add_argument("--rounds", type=int, default=2, help="requests per level = level * rounds")
+    parser.add_argument("--target", choices=sorted(TARGETS), action="append")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",")]
+    for name in args.target or sorted(TARGETS):
+        module_name, path, health_path, key_in = TARGETS[name]
+        module = importlib.import_module(module_name)
+        stub_model.install(module, latency=args.latency)
+
+        print(f"\n{name}  (stub latency {args.latency:.2f}s)")
+        print(f"{'in flight':>10} {'requests':>9} {'req/s':>8} {'health p50':>11} {'failures':>9}")
+        for level in levels:
+            total = level * args.rounds
+            result = asyncio.run(_drive(module.app, path, health_path, key_in, level, total, salt=name))
+            print(
+                f"{level:>10} {total:>9} {result['rps']:>8.2f} "
+                f"{result['health_ms']:>9.1f}ms {result['failures']:>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
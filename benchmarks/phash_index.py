@@ -0,0 +1,65 @@
+"""Lookup latency of the perceptual-hash index at a given number of stored hashes.
+
+Usage: python -m benchmarks.phash_index [--size 1000000] [--distance 6]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detector.phash import PerceptualIndex  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--distance", type=int, default=6)
+    parser.add_argument("--queries", type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "bench.sqlite3")
+        index = PerceptualIndex(path=path, max_distance=args.distance, max_hashes=args.size)
+        started = time.perf_counter()
+        batch = 10_000
+        for offset in range(0, args.size, batch):
+            count = min(batch, args.size - offset)
+            index.add([rng.getrandbits(64) for _ in range(count)], {"verdict": "REAL", "scope": "bench"})
+        print(f"built {len(index):,} hashes in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        reloaded = PerceptualIndex(path=path, max_distance=args.distance, max_hashes=args.size)
+        size_mb = sum(os.path.getsize(name) for name in (path, path + "-wal") if os.path.exists(name)) / 1e6
+        print(f"reloaded {len(reloaded):,} hashes in {time.perf_counter() - started:.1f}s ({size_mb:.1f}MB on disk)")
+
+        def timed(queries):
+            samples = []
+            for value in queries:
+                started = time.perf_counter()
+                reloaded.lookup([value], scope="bench")
+                samples.append((time.perf_counter() - started) * 1e6)
+            samples.sort()
+            return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+        misses = [rng.getrandbits(64) for _ in range(args.queries)]
+        near = []
+        for _ in range(args.queries):
+            value = reloaded.hashes[rng.randrange(len(reloaded))]
+            for bit in rng.sample(range(64), args.distance):
+                value ^= 1 << bit
+            near.append(value)
+
+        for label, queries in (("random (miss)", misses), (f"{args.distance}-bit neighbour", near)):
+            p50, p99 = timed(queries)
+            print(f"{label:>20}: p50 {p50:7.1f}us  p99 {p99:7.1f}us")
+
+
+if __name__ == "__main__":
+    main()
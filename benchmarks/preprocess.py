@@ -0,0 +1,162 @@
+"""Raw phone photos versus downscaled/re-encoded payloads sent to Gemini.
+
+Usage: python -m benchmarks.preprocess [--count 4] [--megapixels 12] [--uplink-mbps 20]
+       python -m benchmarks.preprocess --images DIR --live   # real model, needs GEMINI_API_KEY
+
+Offline, synthetic photos are sent through the real SDK to the local HTTPS stub
+and the report covers payload size, estimated image tokens, preprocessing time
+and end-to-end latency (stub round trip plus the upload time the payload would
+take on a ``--uplink-mbps`` link). Verdict agreement needs a model that actually
+looks at the pixels, so it is only measured with ``--live``.
+"""
+
+import argparse
+import glob
+import io
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.https_stub import StubGeminiServer  # noqa: E402
+from detector.preprocess import PreparedMedia, prepare_image  # noqa: E402
+
+PROMPT = "Analyze this image for deepfake artifacts. Return VERDICT (REAL/FAKE) and CONFIDENCE (%)."
+
+
+def _estimated_tokens(data: bytes) -> int:
+    # Gemini counts 258 tokens per image up to 384px, otherwise per 768x768 tile.
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+    if width <= 384 and height <= 384:
+        return 258
+    return math.ceil(width / 768) * math.ceil(height / 768) * 258
+
+
+def _synthetic_photo(megapixels: float, seed: int) -> bytes:
+    """A camera-sized JPEG with gradients, shapes, sensor-like noise and EXIF."""
+    from PIL import ExifTags, Image, ImageChops, ImageDraw
+
+    rng = random.Random(seed)
+    width = int(math.sqrt(megapixels * 1e6 * 4 / 3))
+    height = width * 3 // 4
+    base = Image.linear_gradient("L").resize((width, height))
+    channels = (base, base.rotate(90).resize((width, height)), base.transpose(Image.Transpose.FLIP_LEFT_RIGHT))
+    image = Image.merge("RGB", channels)
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        radius = rng.randrange(width // 40, width // 6)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+    noise = Image.merge("RGB", [Image.effect_noise((width, height), 12) for _ in range(3)])
+    image = ImageChops.add(image, noise, scale=1.0, offset=-128)
+
+    exif = Image.Exif()
+    exif[ExifTags.Base.Make] = "BenchCam"
+    exif[ExifTags.Base.Model] = f"Model {seed}"
+    exif[ExifTags.Base.DateTime] = "2026:01:01 12:00:00"
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=92, exif=exif)
+    return buffer.getvalue()
+
+
+def _load_images(args: argparse.Namespace) -> List[Tuple[str, bytes, str]]:
+    if args.images:
+        images = []
+        for path in sorted(glob.glob(os.path.join(args.images, "*"))):
+            extension = os.path.splitext(path)[1].lower()
+            mime_type = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}.get(extension)
+            if mime_type:
+                with open(path, "rb") as handle:
+                    images.append((os.path.basename(path), handle.read(), mime_type))
+        return images
+    return [(f"synthetic-{i}.jpg", _synthetic_photo(args.megapixels, i), "image/jpeg") for i in range(args.count)]
+
+
+def _verdict(text: str) -> str:
+    return "FAKE" if "FAKE" in (text or "").upper() else "REAL"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=4)
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--images", help="directory of .jpg/.png files to use instead of synthetic photos")
+    parser.add_argument("--uplink-mbps", type=float, default=20)
+    parser.add_argument("--live", action="store_true", help="call the real Gemini API to measure verdict agreement")
+    parser.add_argument("--model", default="gemini-2.0-flash")
+    args = parser.parse_args()
+
+    from google import genai
+    from google.genai import types
+
+    images = _load_images(args)
+    if not images:
+        sys.exit("no images found")
+
+    server = None
+    if args.live:
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            sys.exit("--live needs GEMINI_API_KEY")
+        client = genai.Client(api_key=api_key)
+        model = args.model
+    else:
+        server = StubGeminiServer().__enter__()
+        client = genai.Client(api_key="bench", http_options=server.client_options())
+        model = "stub-model"
+
+    def analyze(data: bytes, mime_type: str, prompt: str) -> Tuple[float, str]:
+        started = time.perf_counter()
+        response = client.models.generate_content(
+            model=model, contents=[types.Part.from_bytes(data=data, mime_type=mime_type), prompt]
+        )
+        return (time.perf_counter() - started) * 1000, response.text or ""
+
+    client.models.generate_content(model=model, contents="ping")  # warm the connection
+    rows = {"raw": [], "prepared": []}
+    agreements = []
+    try:
+        for name, data, mime_type in images:
+            started = time.perf_counter()
+            prepared = prepare_image(data, mime_type)
+            prepare_ms = (time.perf_counter() - started) * 1000
+            raw = PreparedMedia(data, mime_type)
+            verdicts = {}
+            for label, media, extra_ms in (("raw", raw, 0.0), ("prepared", prepared, prepare_ms)):
+                call_ms, text = analyze(media.data, media.mime_type, PROMPT + media.prompt_note())
+                upload_ms = len(media.data) * 8 / (args.uplink_mbps * 1e6) * 1000
+                rows[label].append(
+                    (len(media.data), _estimated_tokens(media.data), extra_ms, extra_ms + call_ms + upload_ms)
+                )
+                verdicts[label] = _verdict(text)
+            agreements.append(verdicts["raw"] == verdicts["prepared"])
+            print(f"{name}: {len(data) / 1e6:.2f}MB -> {len(prepared.data) / 1e6:.2f}MB, metadata {prepared.metadata}")
+    finally:
+        if server is not None:
+            server.__exit__(None, None, None)
+
+    print(f"\n{len(images)} images, uplink modelled at {args.uplink_mbps:g} Mbit/s")
+    print(f"{'payload':>10} {'mean MB':>9} {'tokens':>8} {'prep ms':>9} {'e2e ms':>9}")
+    for label, samples in rows.items():
+        print(
+            f"{label:>10} {statistics.fmean(s[0] for s in samples) / 1e6:>9.2f} "
+            f"{statistics.fmean(s[1] for s in samples):>8.0f} {statistics.fmean(s[2] for s in samples):>9.1f} "
+            f"{statistics.fmean(s[3] for s in samples):>9.1f}"
+        )
+    if args.live:
+        print(f"\nverdict agreement raw vs prepared: {sum(agreements)}/{len(agreements)}")
+    else:
+        print("\nverdict agreement: n/a offline (the stub returns a fixed verdict); rerun with --live")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""How much traffic the local pre-screen settles, how accurately, and what it saves.
+
+Usage: python -m benchmarks.prescreen [--per-class 8] [--model-latency 4.0] [--usd-per-mtok 0.30]
+       python -m benchmarks.prescreen --real   # also settle camera originals locally (DEEPFAKE_PRESCREEN_REAL=1)
+       python -m benchmarks.prescreen --samples DIR   # DIR/real/* and DIR/fake/* labelled images
+
+Without ``--samples`` a synthetic labelled set is generated: camera originals,
+re-saved real photos (some captioned with a generator's name), diffusion PNGs
+with their parameters chunk, IPTC-tagged AI JPEGs, spliced camera photos and
+metadata-free renders. Images
+the pre-screen does not settle would go to Gemini; each call avoided is credited
+with ``--model-latency`` seconds and its estimated input tokens.
+"""
+
+import argparse
+import glob
+import io
+import os
+import statistics
+import sys
+import time
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.preprocess import _estimated_tokens, _synthetic_photo  # noqa: E402
+from detector.prescreen import prescreen_image  # noqa: E402
+
+PROMPT_TOKENS = 200
+_CAMERA_TABLES = [[3, 2, 2, 3, 4, 6, 8, 9] * 8, [4, 4, 5, 6, 8, 9, 9, 9] * 8]
+_AI_XMP = (
+    b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+    b'<rdf:Description xmlns:Iptc4xmpExt="http://iptc.org/std/Iptc4xmpExt/2008-02-29/" '
+    b'Iptc4xmpExt:DigitalSourceType="http://cv.iptc.org/newscodes/digitalsourcetype/trainedAlgorithmicMedia"/>'
+    b"</rdf:RDF></x:xmpmeta>"
+)
+
+
+def _jpeg(image, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", **options)
+    return buffer.getvalue()
+
+
+def _camera_exif(seed: int):
+    from PIL import ExifTags, Image
+
+    exif = Image.Exif()
+    exif[ExifTags.Base.Make] = "BenchCam"
+    exif[ExifTags.Base.Model] = f"X{seed}"
+    exif.get_ifd(ExifTags.IFD.Exif)[ExifTags.Base.DateTimeOriginal] = "2025:06:01 09:30:00"
+    return exif
+
+
+def _synthetic_set(per_class: int, megapixels: float) -> List[Tuple[str, str, bytes]]:
+    from PIL import ExifTags, Image, ImageFilter, PngImagePlugin
+
+    samples = []
+    for seed in range(per_class):
+        photo = Image.open(io.BytesIO(_synthetic_photo(megapixels, seed))).convert("RGB")
+        if seed % 2 == 0:
+            samples.append(("real", "camera original", _jpeg(photo, qtables=_CAMERA_TABLES, exif=_camera_exif(seed))))
+        elif seed % 4 == 1:
+            samples.append(("real", "re-saved, no EXIF", _jpeg(photo, quality=85)))
+        else:
+            # A caption naming a generator is not a generator signature
+            exif = Image.Exif()
+            exif[ExifTags.Base.ImageDescription] = "Crowd at the Midjourney and Stable Diffusion meetup"
+            exif[ExifTags.Base.Software] = "Camera firmware 1.2"
+            samples.append(("real", "caption names a generator", _jpeg(photo, quality=85, exif=exif)))
+
+        if seed % 4 == 0:
+            text = PngImagePlugin.PngInfo()
+            text.add_text("parameters", f"portrait photo, Steps: 30, Seed: {seed}, Model: sdxl")
+            buffer = io.BytesIO()
+            photo.resize((1024, 768)).save(buffer, "PNG", pnginfo=text)
+            samples.append(("fake", "diffusion PNG", buffer.getvalue()))
+        elif seed % 4 == 1:
+            samples.append(("fake", "IPTC AI source type", _jpeg(photo.resize((1024, 768)), quality=90, xmp=_AI_XMP)))
+        elif seed % 4 == 2:
+            lowered = Image.open(io.BytesIO(_jpeg(photo, quality=30))).convert("RGB")
+            width, height = photo.size
+            box = (width // 2 - 250, height // 2 - 250, width // 2 + 250, height // 2 + 250)
+            photo.paste(lowered.crop(box), box[:2])
+            samples.append(("fake", "spliced camera photo", _jpeg(photo, qtables=_CAMERA_TABLES, exif=_camera_exif(seed))))
+        else:
+            render = photo.filter(ImageFilter.GaussianBlur(2)).resize((1024, 768))
+            samples.append(("fake", "render, no metadata", _jpeg(render, quality=95)))
+    return samples
+
+
+def _load_samples(directory: str) -> List[Tuple[str, str, bytes]]:
+    samples = []
+    for label in ("real", "fake"):
+        for path in sorted(glob.glob(os.path.join(directory, label, "*"))):
+            with open(path, "rb") as handle:
+                samples.append((label, os.path.basename(path), handle.read()))
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", help="directory with real/ and fake/ subdirectories")
+    parser.add_argument("--per-class", type=int, default=8)
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--model-latency", type=float, default=4.0, help="seconds per Gemini call avoided")
+    parser.add_argument("--usd-per-mtok", type=float, default=0.30, help="input token price used for savings")
+    parser.add_argument("--real", action="store_true", help="allow local REAL verdicts")
+    args = parser.parse_args()
+
+    samples = _load_samples(args.samples) if args.samples else _synthetic_set(args.per_class, args.megapixels)
+    if not samples:
+        sys.exit("no samples found")
+
+    timings, decided, correct, tokens_saved = [], 0, 0, 0
+    print(f"{'label':>5} {'kind':>24} {'local verdict':>14} {'conf':>5} {'ms':>7}")
+    for label, kind, data in samples:
+        started = time.perf_counter()
+        screening = prescreen_image(data, real=args.real)
+        elapsed = (time.perf_counter() - started) * 1000
+        timings.append(elapsed)
+        if screening.decided:
+            decided += 1
+            correct += int(screening.verdict.lower() == label)
+            tokens_saved += _estimated_tokens(data) + PROMPT_TOKENS
+        print(f"{label:>5} {kind[:24]:>24} {screening.verdict or 'escalate':>14} {screening.confidence:>5.2f} {elapsed:>7.1f}")
+
+    total = len(samples)
+    overhead = sum(timings) / 1000
+    saved = decided * args.model_latency - overhead
+    print(f"\nshort-circuited: {decided}/{total} ({decided / total:.0%})")
+    print(f"local accuracy: {correct}/{decided}" if decided else "local accuracy: n/a")
+    print(f"pre-screen ms: mean {statistics.fmean(timings):.1f}, max {max(timings):.1f}")
+    print(
+        f"latency saved: {saved:.1f}s over {total} requests ({saved / total * 1000:.0f}ms/request, "
+        f"assuming {args.model_latency:g}s per model call)"
+    )
+    print(f"tokens saved: {tokens_saved} (~${tokens_saved / 1e6 * args.usd_per_mtok:.4f} at ${args.usd_per_mtok}/M)")
+
+
+if __name__ == "__main__":
+    main()
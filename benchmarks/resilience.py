@@ -0,0 +1,124 @@
+"""Success rate and latency under injected upstream faults, with and without the resilience layer.
+
+Usage: python -m benchmarks.resilience [--requests 20] [--latency 0.05] [--scenario NAME ...]
+
+A real ``genai.Client`` talks to the HTTPS stub, which injects the faults of each
+scenario. "direct" is one plain ``generate_content`` call on the primary model,
+as the endpoints made before; "layer" goes through a fresh
+:class:`detector.resilience.ModelCaller`. Needs the openssl CLI.
+
+Scenarios:
+  rate-limited   every request first meets two 429s with Retry-After: 0.3
+  overloaded     every request first meets one 503
+  slow-tail      one request in five stalls for 1.5s (the layer hedges at p95)
+  primary-down   the primary model answers 503 to everything
+  all-down       every model answers 503 (the layer fails fast once breakers open)
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.https_stub import StubGeminiServer  # noqa: E402
+from detector.resilience import MODELS, ModelCaller  # noqa: E402
+
+FALLBACK_MODELS = MODELS if len(MODELS) > 1 else [*MODELS, "gemini-2.5-flash"]
+PRIMARY = FALLBACK_MODELS[0]
+SCENARIOS = ("rate-limited", "overloaded", "slow-tail", "primary-down", "all-down")
+
+
+def _arrange(stub: StubGeminiServer, scenario: str, number: int) -> None:
+    """Set up the faults the next request will meet."""
+    if scenario == "rate-limited":
+        stub.inject(429, times=2, retry_after=0.3)
+    elif scenario == "overloaded":
+        stub.inject(503)
+    elif scenario == "slow-tail" and number % 5 == 4:
+        stub.inject(delay=1.5)
+
+
+def _run(stub: StubGeminiServer, scenario: str, requests: int, call: Callable[[], str]) -> Dict[str, object]:
+    stub.faults.clear()
+    stub.down.clear()
+    if scenario == "primary-down":
+        stub.down[PRIMARY] = {"status": 503}
+    elif scenario == "all-down":
+        stub.down.update({model: {"status": 503} for model in FALLBACK_MODELS})
+
+    latencies: List[float] = []
+    succeeded = 0
+    used: Dict[str, int] = {}
+    for number in range(requests):
+        _arrange(stub, scenario, number)
+        started = time.perf_counter()
+        try:
+            model = call()
+        except Exception:
+            pass
+        else:
+            succeeded += 1
+            used[model] = used.get(model, 0) + 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    ordered = sorted(latencies)
+    return {
+        "success": succeeded / requests,
+        "p50": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "models": used,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub seconds per reply")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="run only these (repeatable)")
+    args = parser.parse_args()
+
+    from google import genai
+
+    with StubGeminiServer(latency=args.latency) as stub:
+        client = genai.Client(api_key="bench", http_options=stub.client_options())
+
+        def generate(model: str):
+            return client.models.generate_content(model=model, contents=["ping"])
+
+        def direct() -> str:
+            generate(PRIMARY)
+            return PRIMARY
+
+        print(f"{args.requests} requests per run; models {', '.join(FALLBACK_MODELS)}; stub latency {args.latency:g}s")
+        print(f"{'scenario':>13} {'path':>6} {'success':>8} {'p50 ms':>8} {'p95 ms':>8}  notes")
+        for scenario in args.scenario or SCENARIOS:
+            hedge = scenario == "slow-tail"
+            caller = ModelCaller(
+                FALLBACK_MODELS, hedge=hedge, hedge_min_samples=5, breaker_failures=3, breaker_cooldown=60
+            )
+            if hedge:
+                for _ in range(10):  # learn the model's normal latency before hedging on it
+                    caller.call(generate)
+
+            def layered() -> str:
+                return caller.call(generate)[1]
+
+            for label, call in (("direct", direct), ("layer", layered)):
+                row = _run(stub, scenario, args.requests, call)
+                notes = ""
+                if label == "layer":
+                    stats = caller.stats()
+                    counters = ("retries", "fallbacks", "hedges", "hedge_wins", "fail_fast")
+                    notes = ", ".join(f"{name} {stats[name]}" for name in counters if stats[name])
+                    notes += f"; answered by {row['models']}" if row["models"] else ""
+                print(
+                    f"{scenario:>13} {label:>6} {row['success']:>8.0%} {row['p50']:>8.0f} {row['p95']:>8.0f}  {notes}"
+                )
+        print(f"\nstub counters: {stub.counters}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Latency, cost and accuracy of tiered model routing against always calling the regular model.
+
+Usage: python -m benchmarks.routing [--items 40] [--cheap-latency 0.3] [--strong-latency 1.2]
+                                    [--thresholds 70,80,90] [--cost-ratio 10] [--concurrency 8]
+
+Photos go through ``AnalysisEngine.analyze`` against the local HTTPS stub, with
+two scripted models. Each photo has a seeded ground truth and difficulty (from
+the hash of its request contents):
+
+  cheap-model   answers after ``--cheap-latency``; its confidence falls with the
+                difficulty, and it gets half of the harder half of the photos wrong
+  strong-model  answers after ``--strong-latency``, always right, 90% confident
+
+The baseline sends everything to strong-model. Then routing runs once per
+``--thresholds`` entry, as ``DEEPFAKE_ROUTING_TIERS=cheap-model:512:<threshold>``.
+The report shows mean and p95 latency, the share answered by the cheap tier,
+accuracy against the scripted truth, the router's agreement figure, and
+relative model cost (a strong call costs ``--cost-ratio`` cheap ones). Needs the
+openssl CLI.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DEEPFAKE_CACHE_BACKEND", "none")
+
+from benchmarks.https_stub import StubGeminiServer  # noqa: E402
+from benchmarks.preprocess import _synthetic_photo  # noqa: E402
+
+CHEAP, STRONG = "cheap-model", "strong-model"
+
+
+def _case(request: dict) -> "tuple[bool, float, bool]":
+    """``(is_fake, difficulty in [0, 1), coin)`` of the photo in a generate request."""
+    digest = hashlib.sha256(json.dumps(request.get("contents"), sort_keys=True).encode("utf-8")).digest()
+    return bool(digest[0] & 1), int.from_bytes(digest[1:5], "big") / 2**32, bool(digest[5] & 1)
+
+
+def _report(is_fake: bool, confidence: int) -> str:
+    finding = {"anomaly": is_fake, "detail": "Scripted finding."}
+    return json.dumps(
+        {
+            "verdict": "FAKE" if is_fake else "REAL",
+            "confidence": confidence,
+            "findings": {"lighting": finding, "facial_artifacts": finding, "texture_noise": finding},
+            "summary": "Scripted reply.",
+        }
+    )
+
+
+def _script(args: argparse.Namespace):
+    def reply(model: str, request: dict) -> str:
+        is_fake, difficulty, coin = _case(request)
+        if model == CHEAP:
+            time.sleep(args.cheap_latency)
+            wrong = difficulty > 0.5 and coin
+            return _report(is_fake != wrong, round(98 - 50 * difficulty))
+        time.sleep(args.strong_latency)
+        return _report(is_fake, 90)
+
+    return reply
+
+
+def _run(stub: StubGeminiServer, photos: list, tiers: str, args: argparse.Namespace) -> "tuple[dict, list]":
+    """Stats of one pass over ``photos`` and the verdicts (``is_fake``) in order."""
+    from google import genai
+
+    from detector.clients import ClientPool
+    from detector.context_cache import ContextCacheRegistry
+    from detector.engine import AnalysisEngine, AnalysisRequest
+    from detector.resilience import ModelCaller
+    from detector.routing import FINAL_TIER, ModelRouter, parse_tiers
+
+    router = ModelRouter(parse_tiers(tiers))
+    engine = AnalysisEngine(
+        clients=ClientPool(lambda api_key: genai.Client(api_key=api_key, http_options=stub.client_options())),
+        caller=ModelCaller(models=[STRONG]),
+        index=lambda: None,
+        screen=lambda data, mime_type: None,
+        context_cache=ContextCacheRegistry(enabled=False),
+        router=router,
+    )
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def one(photo: bytes) -> "tuple[float, object]":
+        async with gate:
+            started = time.perf_counter()
+            result = await engine.analyze(AnalysisRequest.from_bytes(photo, "image/jpeg", "bench"))
+            return time.perf_counter() - started, result
+
+    async def everything() -> list:
+        return await asyncio.gather(*(one(photo) for photo in photos))
+
+    outcomes = asyncio.run(everything())
+    timings = sorted(seconds for seconds, _ in outcomes)
+    cheap_calls = strong_calls = 0
+    for _, result in outcomes:
+        steps = result.routing["steps"] if result.routing else [{"tier": FINAL_TIER}]
+        cheap_calls += sum(step["tier"] == CHEAP for step in steps)
+        strong_calls += sum(step["tier"] == FINAL_TIER for step in steps)
+    cheap = router.stats()["per_tier"].get(CHEAP, {})
+    row = {
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(0.95 * len(timings)))] * 1000,
+        "cheap_share": cheap.get("answered", 0) / len(photos),
+        "agreement": cheap.get("agreement"),
+        "cost": (cheap_calls + strong_calls * args.cost_ratio) / len(photos),
+    }
+    return row, [result.is_fake for _, result in outcomes]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=40)
+    parser.add_argument("--cheap-latency", type=float, default=0.3, help="cheap-model seconds per reply")
+    parser.add_argument("--strong-latency", type=float, default=1.2, help="strong-model seconds per reply")
+    parser.add_argument("--thresholds", default="70,80,90", help="comma-separated cheap-tier min confidences")
+    parser.add_argument("--cost-ratio", type=float, default=10.0, help="cost of a strong call in cheap calls")
+    parser.add_argument("--concurrency", type=int, default=8, help="analyses in flight at once")
+    args = parser.parse_args()
+
+    photos = [_synthetic_photo(0.3, seed=seed) for seed in range(args.items)]
+    print(
+        f"{args.items} photos, cheap-model {args.cheap_latency:.1f}s, strong-model {args.strong_latency:.1f}s, "
+        f"strong costs {args.cost_ratio:.0f}x, {args.concurrency} at once"
+    )
+    print(f"{'routing':<34}{'mean ms':>9}{'p95 ms':>9}{'cheap':>8}{'accuracy':>10}{'agreement':>11}{'cost':>7}")
+    with StubGeminiServer(script=_script(args)) as stub:
+        truth = None
+        for tiers in [""] + [f"{CHEAP}:512:{value}" for value in args.thresholds.split(",")]:
+            row, verdicts = _run(stub, photos, tiers, args)
+            # strong-model is always right, so the baseline pass is the ground truth
+            truth = truth or verdicts
+            accuracy = sum(got == expected for got, expected in zip(verdicts, truth)) / len(photos)
+            agreement = f"{row['agreement']:.0%}" if row["agreement"] is not None else "-"
+            print(
+                f"{tiers or 'off (strong-model only)':<34}{row['mean_ms']:>9.0f}{row['p95_ms']:>9.0f}"
+                f"{row['cheap_share']:>8.0%}{accuracy:>10.0%}{agreement:>11}{row['cost']:>7.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Wall-clock time of segment-parallel analysis against the single-call path for long videos.
+
+Usage: python -m benchmarks.segments [--durations 60,180,300] [--latency 1.0] [--latency-per-mb 2.0]
+                                     [--concurrency 4] [--verdict REAL|FAKE] [--repeats 3]
+
+Synthetic clips (480x270, a scene change every second, a tone track) go through
+``AnalysisEngine.analyze`` twice: once with segmentation off (one keyframe sample,
+one model call) and once cut into ``DEEPFAKE_SEGMENT_SECONDS`` segments. The real
+SDK talks to the local HTTPS stub, which answers after ``--latency`` seconds plus
+``--latency-per-mb`` per MiB of request. With ``--verdict FAKE`` every segment
+says FAKE, so the run settles at the quorum and the rest are cancelled.
+Needs the openssl CLI, ``av`` and ``numpy``.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DEEPFAKE_CACHE_BACKEND", "none")
+
+from benchmarks.https_stub import DEFAULT_TEXT, StubGeminiServer  # noqa: E402
+from benchmarks.suite import _short_clip  # noqa: E402
+
+
+def _run(engine, data: bytes, repeats: int) -> tuple:
+    from detector.engine import AnalysisRequest
+
+    timings = []
+    result = None
+    for repeat in range(repeats):
+        # A trailing byte per run keeps the digest unique (no cache short-circuit)
+        request = AnalysisRequest.from_bytes(data + bytes([repeat]), "video/mp4", "bench")
+        started = time.perf_counter()
+        result = asyncio.run(engine.analyze(request))
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--durations", default="60,180,300", help="comma-separated clip lengths in seconds")
+    parser.add_argument("--latency", type=float, default=1.0, help="stub seconds per reply")
+    parser.add_argument("--latency-per-mb", type=float, default=2.0, help="extra stub seconds per MiB of request")
+    parser.add_argument("--concurrency", type=int, default=4, help="segments analysed at once")
+    parser.add_argument("--verdict", choices=("REAL", "FAKE"), default="REAL", help="what every model reply says")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ["DEEPFAKE_SEGMENT_CONCURRENCY"] = str(args.concurrency)
+    from google import genai
+
+    from detector import segments
+    from detector.clients import ClientPool
+    from detector.engine import AnalysisEngine
+    from detector.resilience import ModelCaller
+
+    text = DEFAULT_TEXT.replace('"REAL"', f'"{args.verdict}"')
+    with StubGeminiServer(latency=args.latency, latency_per_mb=args.latency_per_mb, text=text) as stub:
+        pool = ClientPool(lambda api_key: genai.Client(api_key=api_key, http_options=stub.client_options()))
+        common = dict(clients=pool, caller=ModelCaller(), index=lambda: None)
+        single = AnalysisEngine(split=lambda data, mime_type: [], **common)
+        parallel = AnalysisEngine(split=lambda data, mime_type: segments.plan_for(data, mime_type, min_seconds=1), **common)
+
+        print(
+            f"stub {args.latency:.1f}s + {args.latency_per_mb:.1f}s/MiB, {args.concurrency} segments at once, "
+            f"~{segments.SEGMENT_SECONDS:.0f}s segments (max {segments.SEGMENT_MAX}), replies say {args.verdict}"
+        )
+        print(f"{'clip':>6}{'single ms':>11}{'segments ms':>13}{'speedup':>9}{'segments':>10}{'cancelled':>11}{'verdict':>9}")
+        for seconds in (int(value) for value in args.durations.split(",")):
+            data = _short_clip(seconds, seed=seconds)
+            single_ms, _ = _run(single, data, args.repeats)
+            parallel_ms, result = _run(parallel, data, args.repeats)
+            report = result.segments or {"count": 1, "cancelled": 0}
+            print(
+                f"{seconds:>5}s{single_ms:>11.0f}{parallel_ms:>13.0f}{single_ms / parallel_ms:>8.2f}x"
+                f"{report['count']:>10}{report['cancelled']:>11}{result.verdict:>9}"
+            )
+        print(f"\nstub counters: {stub.counters}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Time to first byte and to verdict: /api/analyze versus the SSE /api/analyze/stream.
+
+Usage: python -m benchmarks.streaming [--requests 10] [--latency 0.8] [--chunk-delay 0.05]
+
+api/index.py is served by uvicorn on a local port and its Gemini clients point
+at the HTTPS stub, which waits ``--latency`` seconds before the first chunk and
+``--chunk-delay`` between chunks of the reply (the same total either way). The
+client measures when the first response byte, the verdict and the complete
+result arrive. Needs ``uvicorn``, ``httpx`` and the openssl CLI.
+"""
+
+import argparse
+import io
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from typing import Dict, List
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Every request must reach the model.
+os.environ.setdefault("DEEPFAKE_CACHE_BACKEND", "none")
+os.environ.setdefault("DEEPFAKE_PHASH_ENABLED", "0")
+os.environ.setdefault("DEEPFAKE_PRESCREEN", "0")
+# One key and one address drive every request; admission control would throttle them.
+os.environ.setdefault("DEEPFAKE_KEY_RATE", "0")
+os.environ.setdefault("DEEPFAKE_IP_RATE", "0")
+os.environ.setdefault("DEEPFAKE_KEY_TOKENS_PER_MINUTE", "0")
+
+from benchmarks.https_stub import StubGeminiServer  # noqa: E402
+
+
+def _image(index: int) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.effect_noise((320, 240), 30 + index % 50).convert("RGB").save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _serve(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.02)
+    return server, thread
+
+
+def _blocking(client: httpx.Client, data: bytes) -> Dict[str, float]:
+    started = time.perf_counter()
+    files = {"file": ("sample.jpg", data, "image/jpeg")}
+    with client.stream("POST", "/api/analyze", files=files, data={"api_key": "bench"}) as response:
+        first = None
+        for _ in response.iter_bytes():
+            first = first or time.perf_counter()
+        response.raise_for_status()
+    done = time.perf_counter()
+    return {"first byte": first - started, "verdict": done - started, "result": done - started}
+
+
+def _streamed(client: httpx.Client, data: bytes) -> Dict[str, float]:
+    started = time.perf_counter()
+    files = {"file": ("sample.jpg", data, "image/jpeg")}
+    marks: Dict[str, float] = {}
+    with client.stream("POST", "/api/analyze/stream", files=files, data={"api_key": "bench"}) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            marks.setdefault("first byte", time.perf_counter() - started)
+            if line == "event: verdict":
+                marks.setdefault("verdict", time.perf_counter() - started)
+            elif line == "event: error":
+                raise RuntimeError("stream reported an error")
+            elif line == "event: result":
+                marks["result"] = time.perf_counter() - started
+    return marks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.8, help="seconds before the model's first chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="seconds between reply chunks")
+    args = parser.parse_args()
+
+    import importlib
+
+    from google import genai
+
+    index = importlib.import_module("api.index")
+    port = _free_port()
+    with StubGeminiServer(latency=args.latency, chunk_delay=args.chunk_delay) as stub:
+        index.client_pool.factory = lambda api_key: genai.Client(api_key=api_key, http_options=stub.client_options())
+        server, thread = _serve(index.app, port)
+        rows: Dict[str, List[Dict[str, float]]] = {"/api/analyze": [], "/api/analyze/stream": []}
+        try:
+            with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+                _streamed(client, _image(-1))  # warm the pooled client and TLS session
+                for number in range(args.requests):
+                    rows["/api/analyze"].append(_blocking(client, _image(2 * number)))
+                    rows["/api/analyze/stream"].append(_streamed(client, _image(2 * number + 1)))
+                server_side = client.get("/api/health").json()["streaming"]
+        finally:
+            server.should_exit = True
+            thread.join(timeout=5)
+
+    chunks = len(stub.chunks())
+    print(f"{args.requests} requests per endpoint; stub: {args.latency:g}s to first chunk, {chunks} chunks")
+    print(f"{'endpoint':>20} {'first byte ms':>14} {'verdict ms':>11} {'result ms':>10}")
+    for name, samples in rows.items():
+        first, verdict, result = (
+            statistics.median(sample[key] for sample in samples) * 1000 for key in ("first byte", "verdict", "result")
+        )
+        print(f"{name:>20} {first:>14.0f} {verdict:>11.0f} {result:>10.0f}")
+    print(f"\nserver-side stream timings (from /api/health): {server_side}")
+
+
+if __name__ == "__main__":
+    main()
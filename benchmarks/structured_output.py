@@ -0,0 +1,149 @@
+"""Replay saved model responses through the report parser; optionally compare free text vs JSON live.
+
+Usage: python -m benchmarks.structured_output            # regression check over the saved corpus
+       python -m benchmarks.structured_output --live --image photo.jpg [--repeats 3] [--record]
+
+The corpus (``benchmarks/data/report_corpus.jsonl``) holds model replies in both
+the JSON schema format and the older labelled free-text format, including
+truncated JSON and wording such as "not FAKE" that the old substring check
+misread. Each entry records the expected verdict and confidence (``null`` verdict
+means the reply must be rejected). The run exits non-zero on any mismatch.
+
+``--live`` sends the same image with the old free-text prompt and with the JSON
+schema, and reports output tokens, latency and verdict agreement (needs
+GEMINI_API_KEY). ``--record`` appends the live JSON replies to the corpus.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detector.report import REPORT_INSTRUCTIONS, ReportError, generation_config, parse_report  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "report_corpus.jsonl")
+ANALYSIS = """You are an expert forensic digital media analyst specializing in deepfake detection.
+Analyze for lighting mismatch, facial artifacts, texture/noise anomalies, and (for video) lip-sync issues.
+"""
+TEXT_PROMPT = ANALYSIS + "Return: VERDICT (REAL/FAKE), CONFIDENCE (%), and a concise technical explanation."
+JSON_PROMPT = ANALYSIS + REPORT_INSTRUCTIONS
+
+
+def _substring_verdict(text: str) -> str:
+    # The parsing this replaces.
+    return "FAKE" if "FAKE" in (text or "").upper() else "REAL"
+
+
+def _parsed(text: str) -> Tuple[Optional[str], Optional[int]]:
+    try:
+        report = parse_report(text)
+    except ReportError:
+        return None, None
+    return report.verdict, report.confidence
+
+
+def replay(path: str) -> int:
+    with open(path) as handle:
+        cases = [json.loads(line) for line in handle if line.strip()]
+
+    failures = substring_wrong = substring_invented = 0
+    timings = []
+    print(f"{'case':>34} {'format':>6} {'expected':>12} {'parsed':>12} {'substring':>10}")
+    for case in cases:
+        started = time.perf_counter()
+        verdict, confidence = _parsed(case["text"])
+        timings.append((time.perf_counter() - started) * 1e6)
+        ok = (verdict, confidence) == (case["verdict"], case["confidence"])
+        failures += not ok
+        legacy = _substring_verdict(case["text"])
+        substring_wrong += case["verdict"] is not None and legacy != case["verdict"]
+        substring_invented += case["verdict"] is None
+        expected = f"{case['verdict']} {case['confidence']}" if case["verdict"] else "rejected"
+        parsed = f"{verdict} {confidence}" if verdict else "rejected"
+        print(
+            f"{case['id'][:34]:>34} {case['format']:>6} {expected:>12} {parsed:>12} {legacy:>10}"
+            f"{'' if ok else '  <-- MISMATCH'}"
+        )
+
+    print(f"\n{len(cases) - failures}/{len(cases)} parsed as expected, mean parse {statistics.fmean(timings):.0f}us")
+    print(
+        f"substring check: {substring_wrong} verdicts wrong, plus a verdict invented for "
+        f"{substring_invented} replies that had none"
+    )
+    return failures
+
+
+def live(args: argparse.Namespace) -> None:
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        sys.exit("--live needs GEMINI_API_KEY")
+    if not args.image:
+        sys.exit("--live needs --image")
+
+    from google import genai
+    from google.genai import types
+
+    with open(args.image, "rb") as handle:
+        data = handle.read()
+    mime_type = "image/png" if args.image.lower().endswith(".png") else "image/jpeg"
+    client = genai.Client(api_key=api_key)
+    part = types.Part.from_bytes(data=data, mime_type=mime_type)
+
+    rows = {"free text": [], "json schema": []}
+    recorded = []
+    for _ in range(args.repeats):
+        for label, prompt, config in (
+            ("free text", TEXT_PROMPT, None),
+            ("json schema", JSON_PROMPT, generation_config()),
+        ):
+            started = time.perf_counter()
+            response = client.models.generate_content(model=args.model, contents=[part, prompt], config=config)
+            elapsed = (time.perf_counter() - started) * 1000
+            usage = response.usage_metadata
+            tokens = (usage.candidates_token_count or 0) if usage else 0
+            verdict = _substring_verdict(response.text) if config is None else _parsed(response.text)[0]
+            rows[label].append((tokens, elapsed, verdict))
+            if config is not None:
+                recorded.append(response.text)
+
+    print(f"{'format':>12} {'output tok':>11} {'ms':>9} verdicts")
+    for label, samples in rows.items():
+        print(
+            f"{label:>12} {statistics.fmean(s[0] for s in samples):>11.0f} "
+            f"{statistics.fmean(s[1] for s in samples):>9.0f} {','.join(str(s[2]) for s in samples)}"
+        )
+
+    if args.record:
+        with open(CORPUS, "a") as handle:
+            for index, text in enumerate(recorded):
+                verdict, confidence = _parsed(text)
+                name = f"live-{os.path.basename(args.image)}-{int(time.time())}-{index}"
+                entry = {"id": name, "format": "json", "text": text, "verdict": verdict, "confidence": confidence}
+                handle.write(json.dumps(entry) + "\n")
+        print(f"\nrecorded {len(recorded)} replies in {CORPUS}; check the expected values before committing")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--live", action="store_true", help="compare free text and JSON output on the real API")
+    parser.add_argument("--image", help="image sent with --live")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--model", default="gemini-2.0-flash")
+    parser.add_argument("--record", action="store_true", help="append the live JSON replies to the corpus")
+    args = parser.parse_args()
+
+    failures = replay(args.corpus)
+    if args.live:
+        print()
+        live(args)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
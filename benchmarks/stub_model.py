@@ -0,0 +1,78 @@
+"""Local stand-in for the google-genai client so benchmarks never touch the network."""
+
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+DEFAULT_TEXT = (
+    '{"verdict": "REAL", "confidence": 91, "findings": {'
+    '"lighting": {"anomaly": false, "detail": "Shadows match the key light."}, '
+    '"facial_artifacts": {"anomaly": false, "detail": "Clean edges and eye reflections."}, '
+    '"texture_noise": {"anomaly": false, "detail": "Uniform sensor noise."}}, '
+    '"summary": "Lighting, texture and edges are consistent."}'
+)
+
+
+class StubModels:
+    def __init__(self, latency: float, text: str) -> None:
+        self.latency = latency
+        self.text = text
+        self.calls = 0
+
+    def generate_content(self, model: str, contents: Any, config: Optional[Any] = None) -> Any:
+        self.calls += 1
+        time.sleep(self.latency)
+        usage = SimpleNamespace(prompt_token_count=300, candidates_token_count=40, total_token_count=340)
+        return SimpleNamespace(text=self.text, usage_metadata=usage)
+
+
+class StubFiles:
+    """Files API stand-in: uploads are read through and counted, never kept; handles are ACTIVE at once."""
+
+    def __init__(self) -> None:
+        self.uploads = 0
+        self.bytes_uploaded = 0
+        self._files: Dict[str, Any] = {}
+
+    def upload(self, file: Any, config: Optional[Dict[str, Any]] = None) -> Any:
+        size = 0
+        for chunk in iter(lambda: file.read(256 * 1024), b""):
+            size += len(chunk)
+        self.uploads += 1
+        self.bytes_uploaded += size
+        name = f"files/stub-{self.uploads}"
+        mime_type = (config or {}).get("mime_type", "application/octet-stream")
+        handle = SimpleNamespace(
+            name=name, uri=f"https://stub.invalid/{name}", mime_type=mime_type, size_bytes=size, state="ACTIVE"
+        )
+        self._files[name] = handle
+        return handle
+
+    def get(self, name: str) -> Any:
+        if name not in self._files:
+            raise LookupError(f"404 NOT_FOUND: {name}")
+        return self._files[name]
+
+    def delete(self, name: str) -> None:
+        self._files.pop(name, None)
+
+
+class StubClient:
+    latency = 0.5
+    text = DEFAULT_TEXT
+    instances = 0
+
+    def __init__(self, api_key: Optional[str] = None, **_: Any) -> None:
+        type(self).instances += 1
+        self.api_key = api_key
+        self.models = StubModels(self.latency, self.text)
+        self.files = StubFiles()
+
+
+def install(module: Any, latency: float = 0.5, text: str = DEFAULT_TEXT) -> type:
+    """Point ``module.genai`` at a stub client class with the given latency and reply."""
+    client_cls = type("StubClient", (StubClient,), {"latency": latency, "text": text, "instances": 0})
+    module.genai = SimpleNamespace(Client=client_cls)
+    if hasattr(module, "GENAI_AVAILABLE"):
+        module.GENAI_AVAILABLE = True
+    return client_cls
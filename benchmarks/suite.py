@@ -0,0 +1,415 @@
+"""Latency, throughput and memory of the API and Streamlit paths, checked against stored baselines.
+
+Usage: python -m benchmarks.suite [--levels 1,4,16] [--rounds 4] [--latency 0.2] [--error-rate 0.05]
+                                  [--target NAME ...] [--save-baseline] [--tolerance 0.3]
+
+api/index.py and api_backend.py run in-process (over httpx's ASGI transport) and
+app.py through Streamlit's AppTest harness. All three reach the HTTPS Gemini
+stub through the real SDK, so retries, fallbacks, client pooling and response
+parsing are all exercised. The stub answers after ``--latency`` seconds and
+fails ``--error-rate`` of generate calls with a 503 (seeded, so the same calls
+fail on every run).
+
+Each level sends ``level * rounds`` requests, ``level`` at a time (app.py only
+runs level 1: AppTest drives one session at a time). The workload
+mixes camera-sized JPEGs with short MP4 clips (``--video-share``), each with
+unique bytes so no cache short-circuits the model. Reports p50/p95/p99 latency,
+requests/second, failures and peak RSS per level. After the sweep, a few
+sequential requests run under tracemalloc: "alloc KiB" is the mean peak of
+traced memory per request and "blocks kept" the allocations still alive afterwards
+(a leak shows up there).
+
+Results are compared with benchmarks/data/baselines.json when it was recorded
+with the same settings; the script exits with status 1 if any number is worse
+than the baseline by more than ``--tolerance``. Baselines are machine-specific:
+record them with ``--save-baseline`` on the machine (or CI runner) that checks
+them. Needs the openssl CLI; videos need ``av`` and ``numpy`` (without them the
+workload is images only).
+"""
+
+import argparse
+import asyncio
+import gc
+import importlib
+import io
+import json
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+from unittest import mock
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Every request carries new bytes and one key from one address: measure the model
+# path, not the caches, the local pre-screen or admission control.
+os.environ.setdefault("DEEPFAKE_CACHE_BACKEND", "none")
+os.environ.setdefault("DEEPFAKE_PHASH_ENABLED", "0")
+os.environ.setdefault("DEEPFAKE_PRESCREEN", "0")
+os.environ.setdefault("DEEPFAKE_KEY_RATE", "0")
+os.environ.setdefault("DEEPFAKE_IP_RATE", "0")
+os.environ.setdefault("DEEPFAKE_KEY_TOKENS_PER_MINUTE", "0")
+
+from benchmarks.https_stub import StubGeminiServer  # noqa: E402
+from benchmarks.preprocess import _synthetic_photo  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(ROOT, "benchmarks", "data", "baselines.json")
+TARGETS = ("api/index.py", "api_backend.py", "app.py")
+# AppTest sessions share Streamlit's runtime and cannot run side by side.
+SEQUENTIAL = ("app.py",)
+# Metrics where bigger is worse; "rps" is the one where smaller is worse.
+HIGHER_IS_WORSE = ("p50_ms", "p95_ms", "p99_ms", "peak_rss_mb", "alloc_kib", "blocks_kept")
+# Differences below these never count as regressions (timer and allocator noise).
+NOISE_FLOOR = {"p50_ms": 5.0, "p95_ms": 10.0, "p99_ms": 15.0, "rps": 0.5, "peak_rss_mb": 16.0,
+               "alloc_kib": 64.0, "blocks_kept": 200.0}
+
+Item = Tuple[str, bytes, str]
+
+
+def _short_clip(seconds: int, seed: int) -> bytes:
+    """A small 480x270 MP4 with scene changes, a moving patch and a tone track (well under upload limits)."""
+    import av  # type: ignore
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    buffer = io.BytesIO()
+    with av.open(buffer, "w", format="mp4") as output:
+        video = output.add_stream("libx264", rate=15)
+        video.width, video.height, video.pix_fmt = 480, 270, "yuv420p"
+        audio = output.add_stream("aac", rate=22050)
+        colours = rng.integers(0, 255, size=(seconds + 1, 3), dtype=np.uint8)
+        for index in range(seconds * 15):
+            pixels = np.empty((270, 480, 3), np.uint8)
+            pixels[:] = colours[index // 15]
+            left = (index * 9) % 420
+            pixels[100:160, left:left + 60] = rng.integers(0, 255, (60, 60, 3), dtype=np.uint8)
+            for packet in video.encode(av.VideoFrame.from_ndarray(pixels, format="rgb24")):
+                output.mux(packet)
+        for packet in video.encode():
+            output.mux(packet)
+        tone = (np.sin(np.arange(seconds * 22050) * 2 * np.pi * 440 / 22050) * 0.3).astype(np.float32)
+        for start in range(0, len(tone) - 1024, 1024):
+            frame = av.AudioFrame.from_ndarray(tone[start:start + 1024].reshape(1, -1), format="fltp", layout="mono")
+            frame.sample_rate = 22050
+            for packet in audio.encode(frame):
+                output.mux(packet)
+        for packet in audio.encode():
+            output.mux(packet)
+    return buffer.getvalue()
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        # No procfs (macOS): fall back to the process-lifetime peak (in bytes there).
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+class _RssSampler:
+    """Highest resident set size seen while the block runs, sampled every 10ms."""
+
+    def __init__(self) -> None:
+        self.peak = _rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(0.01):
+            self.peak = max(self.peak, _rss_mb())
+
+    def __enter__(self) -> "_RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_mb())
+
+
+class Workload:
+    """Deterministic mix of images and videos; every item gets unique trailing bytes."""
+
+    def __init__(self, video_share: float, megapixels: float, video_seconds: int) -> None:
+        self.images = [_synthetic_photo(megapixels * scale, seed) for seed, scale in enumerate((0.25, 1.0))]
+        self.videos: List[bytes] = []
+        self.video_share = video_share
+        if video_share > 0:
+            try:
+                self.videos = [_short_clip(video_seconds, seed=1)]
+            except ImportError:
+                print("av/numpy not installed: image-only workload")
+        self._serial = 0
+        self._lock = threading.Lock()
+
+    def item(self, index: int) -> Item:
+        with self._lock:
+            self._serial += 1
+            tag = f"bench:{self._serial}".encode()
+        # Every n-th request is a video, so the mix is the same at every level
+        every = round(1 / self.video_share) if self.videos else 0
+        if every and index % every == every - 1:
+            return "clip.mp4", self.videos[0] + tag, "video/mp4"
+        image = self.images[index % len(self.images)]
+        return "photo.jpg", image + tag, "image/jpeg"
+
+
+class _Upload(io.BytesIO):
+    """Enough of Streamlit's UploadedFile for app.py: a file object with a name, size and type."""
+
+    def __init__(self, name: str, data: bytes, mime_type: str) -> None:
+        super().__init__(data)
+        self.name = name
+        self.type = mime_type
+        self.size = len(data)
+        self.file_id = name
+
+
+def _point_at_stub(pool, stub: StubGeminiServer) -> None:
+    from google import genai
+
+    pool.factory = lambda api_key: genai.Client(api_key=api_key, http_options=stub.client_options())
+    pool.clear()
+
+
+def _api_target(module_name: str, path: str, key_in: str, stub: StubGeminiServer) -> Callable:
+    module = importlib.import_module(module_name)
+    _point_at_stub(module.client_pool, stub)
+
+    def run(items: List[Item], concurrency: int) -> List[Tuple[bool, float]]:
+        async def drive() -> List[Tuple[bool, float]]:
+            transport = httpx.ASGITransport(app=module.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+                semaphore = asyncio.Semaphore(concurrency)
+
+                async def one(item: Item) -> Tuple[bool, float]:
+                    name, data, mime_type = item
+                    async with semaphore:
+                        started = time.perf_counter()
+                        files = {"file": (name, data, mime_type)}
+                        if key_in == "form":
+                            response = await client.post(path, files=files, data={"api_key": "bench"})
+                        else:
+                            response = await client.post(path, files=files, params={"api_key": "bench"})
+                        return response.status_code == 200, time.perf_counter() - started
+
+                return await asyncio.gather(*(one(item) for item in items))
+
+        return asyncio.run(drive())
+
+    return run
+
+
+def _streamlit_target(stub: StubGeminiServer) -> Callable:
+    import streamlit as st
+    from streamlit import config
+    from streamlit.logger import set_log_level
+    from streamlit.testing.v1 import AppTest
+
+    from detector.clients import default_client_pool
+
+    _point_at_stub(default_client_pool(), stub)
+    # Bare-mode script runs warn about missing session context and deprecated arguments.
+    # Parse the config first: that resets the log level.
+    config.get_config_options()
+    set_log_level("error")
+    script = os.path.join(ROOT, "app.py")
+
+    def uploader(*args: object, **kwargs: object) -> Optional[_Upload]:
+        # Every rerun gets a fresh file object, as with a real upload
+        item = st.session_state.get("bench_upload")
+        return _Upload(*item) if item else None
+
+    mock.patch("streamlit.file_uploader", uploader).start()
+
+    def one(item: Item) -> Tuple[bool, float]:
+        # A fresh session per request: key entered, file chosen, analysis button clicked
+        app = AppTest.from_file(script, default_timeout=300)
+        app.session_state["show_welcome"] = False
+        app.session_state["bench_upload"] = item
+        app.run()
+        app.sidebar.text_input[0].input("bench").run()
+        button = next(button for button in app.button if "Forensic Analysis" in button.label)
+        started = time.perf_counter()
+        button.click().run()
+        elapsed = time.perf_counter() - started
+        return not app.exception and not app.error, elapsed
+
+    def run(items: List[Item], concurrency: int) -> List[Tuple[bool, float]]:
+        return [one(item) for item in items]
+
+    return run
+
+
+def _target(name: str, stub: StubGeminiServer) -> Callable:
+    if name == "api/index.py":
+        return _api_target("api.index", "/api/analyze", "form", stub)
+    if name == "api_backend.py":
+        return _api_target("api_backend", "/analyze", "query", stub)
+    return _streamlit_target(stub)
+
+
+def _measure_level(run: Callable, workload: Workload, level: int, total: int) -> Dict[str, float]:
+    items = [workload.item(index) for index in range(total)]
+    gc.collect()
+    with _RssSampler() as rss:
+        started = time.perf_counter()
+        samples = run(items, level)
+        elapsed = time.perf_counter() - started
+    latencies = sorted(seconds * 1000 for ok, seconds in samples if ok)
+    return {
+        "requests": total,
+        "failures": sum(not ok for ok, _ in samples),
+        "p50_ms": statistics.median(latencies) if latencies else 0.0,
+        "p95_ms": _percentile(latencies, 0.95),
+        "p99_ms": _percentile(latencies, 0.99),
+        "rps": total / elapsed,
+        "peak_rss_mb": rss.peak,
+    }
+
+
+def _measure_allocations(run: Callable, workload: Workload, requests: int) -> Dict[str, float]:
+    # One round of the mix first, so lazy imports and pooled clients are not counted
+    run([workload.item(index) for index in range(4)], 1)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        peaks = []
+        before = tracemalloc.take_snapshot()
+        for index in range(requests):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            run([workload.item(index)], 1)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    kept = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    return {"alloc_kib": statistics.mean(peaks) / 1024, "blocks_kept": max(0, kept) / requests}
+
+
+def _regressions(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    found = []
+    for target, levels in results.items():
+        for level, row in levels.items():
+            reference = baseline.get(target, {}).get(level)
+            if not reference:
+                continue
+            for metric, value in row.items():
+                if metric not in reference or metric in ("requests", "failures"):
+                    continue
+                expected = reference[metric]
+                if metric == "rps":
+                    worse = value < expected * (1 - tolerance) and expected - value > NOISE_FLOOR[metric]
+                elif metric in HIGHER_IS_WORSE:
+                    worse = value > expected * (1 + tolerance) and value - expected > NOISE_FLOOR[metric]
+                else:
+                    continue
+                if worse:
+                    found.append(f"{target} [{level}] {metric}: {value:.1f} vs baseline {expected:.1f}")
+            if row.get("failures", 0) > reference.get("failures", 0):
+                found.append(
+                    f"{target} [{level}] failures: {row['failures']} vs baseline {reference['failures']}"
+                )
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--rounds", type=int, default=4, help="requests per level = level * rounds")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub seconds per reply")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="share of generate calls failing with 503")
+    parser.add_argument("--video-share", type=float, default=0.25, help="share of requests that are videos")
+    parser.add_argument("--megapixels", type=float, default=4.0, help="size of the larger test photo")
+    parser.add_argument("--video-seconds", type=int, default=4)
+    parser.add_argument("--alloc-requests", type=int, default=8, help="sequential requests traced for allocations")
+    parser.add_argument("--target", choices=TARGETS, action="append", help="run only these (repeatable)")
+    parser.add_argument("--baseline", default=BASELINES, help="baseline file to compare with (or write)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative slowdown before failing")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",")]
+    settings = {
+        "levels": levels, "rounds": args.rounds, "latency": args.latency, "error_rate": args.error_rate,
+        "video_share": args.video_share, "megapixels": args.megapixels, "video_seconds": args.video_seconds,
+        "alloc_requests": args.alloc_requests,
+    }
+    workload = Workload(args.video_share, args.megapixels, args.video_seconds)
+    results: Dict[str, Dict[str, dict]] = {}
+
+    with StubGeminiServer(latency=args.latency, error_rate=args.error_rate) as stub:
+        print(
+            f"stub latency {args.latency:g}s, {args.error_rate:.0%} errors; "
+            f"{len(workload.images)} photos, {len(workload.videos)} clip(s), video share {args.video_share:.0%}"
+        )
+        for name in args.target or TARGETS:
+            try:
+                run = _target(name, stub)
+            except ImportError as error:
+                print(f"\n{name}: skipped ({error})")
+                continue
+            rows = results[name] = {}
+            print(f"\n{name}")
+            print(
+                f"{'in flight':>10} {'requests':>9} {'failures':>9} {'p50 ms':>8} {'p95 ms':>8} "
+                f"{'p99 ms':>8} {'req/s':>7} {'peak RSS MB':>12}"
+            )
+            for level in levels:
+                if name in SEQUENTIAL and level > 1:
+                    continue
+                row = rows[str(level)] = _measure_level(run, workload, level, level * args.rounds)
+                print(
+                    f"{level:>10} {row['requests']:>9} {row['failures']:>9} {row['p50_ms']:>8.0f} "
+                    f"{row['p95_ms']:>8.0f} {row['p99_ms']:>8.0f} {row['rps']:>7.2f} {row['peak_rss_mb']:>12.0f}"
+                )
+            if args.alloc_requests > 0:
+                row = rows["alloc"] = _measure_allocations(run, workload, args.alloc_requests)
+                print(f"{'traced':>10} alloc {row['alloc_kib']:.0f} KiB/request, {row['blocks_kept']:.0f} blocks kept")
+        print(f"\nstub counters: {stub.counters}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as handle:
+            json.dump({"settings": settings, "python": sys.version.split()[0], "results": results}, handle, indent=2)
+            handle.write("\n")
+        print(f"baseline written to {os.path.relpath(args.baseline)}")
+        return
+
+    stored: Optional[dict] = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as handle:
+            stored = json.load(handle)
+    if stored is None:
+        print("no baseline stored; record one with --save-baseline")
+        return
+    if stored.get("settings") != settings:
+        print("baseline was recorded with other settings; not compared")
+        return
+    regressions = _regressions(results, stored["results"], args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\nwithin {args.tolerance:.0%} of the baseline")
+
+
+if __name__ == "__main__":
+    main()
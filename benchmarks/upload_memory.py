@@ -0,0 +1,124 @@
+"""Peak Python heap while many uploads of growing size stream into the analyze endpoints.
+
+Usage: python -m benchmarks.upload_memory [--concurrency 8] [--sizes-mb 1,4,64,512]
+
+Bodies are generated lazily and streamed in 256KB chunks, with and without a
+Content-Length header, so the client side holds almost nothing; the traced
+peak is what the server buffers. Oversize bodies should be cut off with 413
+and the peak should stay flat as the upload size grows. Any other non-2xx
+answer aborts the run: a peak measured on failing requests means nothing.
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import sys
+import time
+import tracemalloc
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# One key and one address drive every request; admission control would throttle them.
+os.environ.setdefault("DEEPFAKE_KEY_RATE", "0")
+os.environ.setdefault("DEEPFAKE_IP_RATE", "0")
+os.environ.setdefault("DEEPFAKE_KEY_TOKENS_PER_MINUTE", "0")
+
+from benchmarks import stub_model  # noqa: E402
+
+BOUNDARY = "benchboundary7f3a"
+CHUNK = 256 * 1024
+JPEG_HEAD = b"\xff\xd8\xff\xe0"
+
+TARGETS = {
+    "api/index.py": ("api.index", "/api/analyze"),
+    "api_backend.py": ("api_backend", "/analyze"),
+}
+
+
+def _parts(size: int, salt: int) -> "tuple[bytes, bytes]":
+    head = (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="api_key"\r\n\r\nbench\r\n'
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="big.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + JPEG_HEAD + salt.to_bytes(8, "big")
+    tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+    return head, tail
+
+
+async def _body(size: int, salt: int):
+    head, tail = _parts(size, salt)
+    yield head
+    remaining = size - len(JPEG_HEAD) - 8
+    filler = b"\x00" * CHUNK
+    while remaining > 0:
+        step = min(CHUNK, remaining)
+        yield filler[:step]
+        remaining -= step
+        await asyncio.sleep(0)
+    yield tail
+
+
+async def _run(
+    app, path: str, size: int, concurrency: int, declare_length: bool, first_salt: int = 0
+) -> "tuple[float, dict, float]":
+    transport = httpx.ASGITransport(app=app)
+    statuses: dict = {}
+    failures: list = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+
+        async def one(salt: int) -> None:
+            head, tail = _parts(size, salt)
+            headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+            if declare_length:
+                headers["content-length"] = str(len(head) + size - len(JPEG_HEAD) - 8 + len(tail))
+            response = await client.post(path, content=_body(size, salt), headers=headers, params={"api_key": "bench"})
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if not response.is_success and response.status_code != 413:
+                failures.append(f"{response.status_code} {response.text[:200]}")
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(one(first_salt + salt) for salt in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    if failures:
+        raise SystemExit(f"{path} answered {len(failures)} upload(s) of {size / (1024 * 1024):g}MB with: {failures[0]}")
+    return peak / (1024 * 1024), statuses, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sizes-mb", default="1,4,64,512")
+    parser.add_argument("--target", choices=sorted(TARGETS), action="append")
+    args = parser.parse_args()
+
+    sizes = [float(size) for size in args.sizes_mb.split(",")]
+    # Every run gets fresh salts: the targets share one process-wide verdict cache, and a
+    # repeated body would be answered from it instead of going through the model stub
+    runs = 0
+    for name in args.target or sorted(TARGETS):
+        module_name, path = TARGETS[name]
+        module = importlib.import_module(module_name)
+        stub_model.install(module, latency=0.0)
+        print(f"\n{name}  ({args.concurrency} concurrent uploads)")
+        print(f"{'size MB':>8} {'length':>9} {'peak heap MB':>13} {'seconds':>8}  statuses")
+        for size_mb in sizes:
+            for declare_length in (True, False):
+                size = int(size_mb * 1024 * 1024)
+                peak, statuses, elapsed = asyncio.run(
+                    _run(module.app, path, size, args.concurrency, declare_length, runs * args.concurrency)
+                )
+                runs += 1
+                label = "declared" if declare_length else "chunked"
+                print(f"{size_mb:>8g} {label:>9} {peak:>13.1f} {elapsed:>8.2f}  {statuses}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Whole clip versus sampled keyframes (plus audio excerpt) for videos of growing length.
+
+Usage: python -m benchmarks.video_sampling [--durations 10,30,60] [--max-frames 16]
+
+Synthetic 720p clips with a scene cut every few seconds and a tone track are
+encoded with PyAV, sampled, and both payloads are sent through the real SDK to
+the local HTTPS stub. Reports decode time, frames kept and request bytes.
+Needs the optional ``av`` and ``numpy`` packages.
+"""
+
+import argparse
+import io
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.https_stub import StubGeminiServer  # noqa: E402
+from detector.video import sample_video  # noqa: E402
+
+PROMPT = "Analyze this video for deepfake artifacts."
+FPS = 30
+SCENE_SECONDS = 4
+
+
+def _synthetic_clip(seconds: int, seed: int = 0) -> bytes:
+    import av  # type: ignore
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    buffer = io.BytesIO()
+    with av.open(buffer, "w", format="mp4") as output:
+        video = output.add_stream("libx264", rate=FPS)
+        video.width, video.height, video.pix_fmt = 1280, 720, "yuv420p"
+        audio = output.add_stream("aac", rate=44100)
+        colours = rng.integers(0, 255, size=(seconds // SCENE_SECONDS + 1, 3), dtype=np.uint8)
+        for index in range(seconds * FPS):
+            pixels = np.empty((720, 1280, 3), np.uint8)
+            pixels[:] = colours[index // (SCENE_SECONDS * FPS)]
+            left = (index * 7) % 1200
+            pixels[300:400, left:left + 80] = 255
+            pixels += rng.integers(0, 8, pixels.shape, dtype=np.uint8)
+            for packet in video.encode(av.VideoFrame.from_ndarray(pixels, format="rgb24")):
+                output.mux(packet)
+        for packet in video.encode():
+            output.mux(packet)
+        offset = 0
+        for _ in range(seconds * 44100 // 1024):
+            tone = np.sin(2 * math.pi * 440 * (np.arange(1024) + offset) / 44100).astype(np.float32) * 0.3
+            offset += 1024
+            frame = av.AudioFrame.from_ndarray(tone.reshape(1, -1), format="fltp", layout="mono")
+            frame.sample_rate = 44100
+            for packet in audio.encode(frame):
+                output.mux(packet)
+        for packet in audio.encode():
+            output.mux(packet)
+    return buffer.getvalue()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--durations", default="10,30,60")
+    parser.add_argument("--max-frames", type=int, default=16)
+    parser.add_argument("--audio-seconds", type=float, default=6)
+    args = parser.parse_args()
+
+    from google import genai
+    from google.genai import types
+
+    with StubGeminiServer() as server:
+        client = genai.Client(api_key="bench", http_options=server.client_options())
+        client.models.generate_content(model="stub-model", contents="ping")
+
+        def send(contents: list) -> "tuple[float, int]":
+            before = server.counters["generate_bytes"]
+            started = time.perf_counter()
+            client.models.generate_content(model="stub-model", contents=contents)
+            return (time.perf_counter() - started) * 1000, server.counters["generate_bytes"] - before
+
+        print(
+            f"{'clip s':>7} {'clip MB':>8} {'decode ms':>10} {'frames':>7} {'kept':>5} "
+            f"{'whole MB sent':>14} {'sampled MB sent':>16} {'whole ms':>9} {'sampled ms':>11}"
+        )
+        for seconds in (int(value) for value in args.durations.split(",")):
+            clip = _synthetic_clip(seconds)
+            sample = sample_video(clip, "video/mp4", max_frames=args.max_frames, audio_seconds=args.audio_seconds)
+            whole_ms, whole_bytes = send([types.Part.from_bytes(data=clip, mime_type="video/mp4"), PROMPT])
+            sampled_ms, sampled_bytes = send([*sample.parts(), PROMPT + sample.prompt_note()])
+            stats = sample.stats
+            print(
+                f"{seconds:>7} {len(clip) / 1e6:>8.2f} {stats['decode_ms']:>10.0f} {stats['frames_decoded']:>7} "
+                f"{stats['frames_selected']:>5} {whole_bytes / 1e6:>14.2f} {sampled_bytes / 1e6:>16.2f} "
+                f"{whole_ms:>9.1f} {sampled_ms:>11.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Shared analysis building blocks for the Streamlit app and both FastAPI backends."""
@@ -0,0 +1,292 @@
+"""Admission control in front of the analysis endpoints: per-key and per-IP rate limits, token budgets.
+
+Every request is charged against two token buckets, one for the client address
+and one for its API key. It must also find that key's budget of Gemini tokens
+not yet spent. Otherwise it is rejected at once with :class:`RateLimitError`
+(a 429 with ``Retry-After``), before the upload is processed or a model slot
+is taken.
+
+The token budget is charged with the ``usage_metadata`` of each model reply.
+Admission asks for a running average of the key's recent analyses, so a key
+only just under its budget is refused a large request it could not afford.
+
+Admitted requests mark their tenant (a hash of the API key) in
+:data:`detector.concurrency.current_tenant`, which the model executor uses to
+share its slots round-robin between keys.
+
+Bucket state lives in memory by default. ``DEEPFAKE_RATE_BACKEND=redis`` keeps
+it in Redis so that every worker enforces the same limits.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from detector.cache import CACHE_URL
+from detector.concurrency import current_tenant
+
+RATE_BACKEND = os.environ.get("DEEPFAKE_RATE_BACKEND", "memory").lower()
+RATE_URL = os.environ.get("DEEPFAKE_RATE_URL", CACHE_URL)
+# Requests per minute and burst size; a rate of 0 turns that limit off.
+KEY_RATE = float(os.environ.get("DEEPFAKE_KEY_RATE", "30"))
+KEY_BURST = int(os.environ.get("DEEPFAKE_KEY_BURST", "10"))
+IP_RATE = float(os.environ.get("DEEPFAKE_IP_RATE", "60"))
+IP_BURST = int(os.environ.get("DEEPFAKE_IP_BURST", "20"))
+KEY_TOKENS_PER_MINUTE = float(os.environ.get("DEEPFAKE_KEY_TOKENS_PER_MINUTE", "250000"))
+TOKEN_ESTIMATE = float(os.environ.get("DEEPFAKE_TOKEN_ESTIMATE", "2000"))
+# Take the client address from X-Forwarded-For (only behind a proxy that sets it, e.g. Vercel).
+TRUST_FORWARDED_FOR = os.environ.get("DEEPFAKE_TRUST_FORWARDED_FOR", "0").lower() in ("1", "true", "yes")
+MAX_BUCKETS = int(os.environ.get("DEEPFAKE_RATE_MAX_BUCKETS", "100000"))
+FAIR_QUEUE = os.environ.get("DEEPFAKE_FAIR_QUEUE", "1").lower() in ("1", "true", "yes")
+
+
+class RateLimitError(RuntimeError):
+    """A request refused by admission control; ``retry_after`` is in seconds."""
+
+    def __init__(self, message: str, retry_after: float, scope: str) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.scope = scope
+
+
+def tenant_id(api_key: str) -> str:
+    """Stable identifier for an API key that does not reveal it."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def client_address(request: Any) -> str:
+    """Address a Starlette request came from."""
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for", "")
+        if forwarded.strip():
+            return forwarded.split(",", 1)[0].strip()
+    return request.client.host if request.client is not None else "unknown"
+
+
+def usage_tokens(response: Any) -> int:
+    """Total tokens billed for a ``generate_content`` reply or the last chunk of a stream."""
+    usage = getattr(response, "usage_metadata", None)
+    return int(getattr(usage, "total_token_count", None) or 0)
+
+
+def retry_after_header(seconds: Optional[float]) -> Optional[Dict[str, str]]:
+    """``Retry-After`` header for a wait in seconds (rounded up), or ``None``."""
+    return {"Retry-After": str(math.ceil(seconds))} if seconds else None
+
+
+class MemoryBuckets:
+    """Token buckets in a bounded in-process dict (oldest idle bucket evicted first)."""
+
+    def __init__(self, max_buckets: int = MAX_BUCKETS) -> None:
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(
+        self, key: str, rate: float, capacity: float, cost: float, required: Optional[float] = None, force: bool = False
+    ) -> float:
+        """Refill, then spend ``cost`` if at least ``required`` (default ``cost``) is there.
+
+        Returns 0 when spent, else the seconds until the bucket holds enough.
+        ``force`` always spends, letting the balance go negative.
+        """
+        required = cost if required is None else required
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0.0
+            if force or tokens >= required:
+                tokens -= cost
+            else:
+                wait = (required - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+# Same arithmetic as MemoryBuckets.take, atomically and on the Redis server's clock.
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local required = tonumber(ARGV[4])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if ARGV[5] == "1" or tokens >= required then
+    tokens = tokens - cost
+else
+    wait = (required - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil((capacity - tokens) / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """Token buckets shared by every worker, updated by a Lua script so concurrent takes cannot race.
+
+    ``client`` may be any object speaking the redis-py ``eval`` API (e.g. ``fakeredis`` with Lua).
+    """
+
+    def __init__(self, client: Any = None, url: str = RATE_URL, prefix: str = "deepfake:rate:") -> None:
+        if client is None:
+            import redis  # type: ignore
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def take(
+        self, key: str, rate: float, capacity: float, cost: float, required: Optional[float] = None, force: bool = False
+    ) -> float:
+        required = cost if required is None else required
+        args = (rate, capacity, cost, required, "1" if force else "0")
+        wait = self.client.eval(_TAKE_SCRIPT, 1, self.prefix + key, *args)
+        return float(wait.decode("ascii") if isinstance(wait, bytes) else wait)
+
+    def __len__(self) -> int:
+        """Live buckets; a SCAN over the keyspace, so :meth:`AdmissionController.stats` does not call it."""
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+
+def _buckets_from_env() -> Any:
+    if RATE_BACKEND == "redis":
+        return RedisBuckets()
+    return MemoryBuckets()
+
+
+class AdmissionController:
+    """Per-IP and per-key request buckets plus a per-key token budget.
+
+    If the bucket store fails (Redis unreachable), requests are let through
+    and counted under ``errors``: losing the limiter must not take the API down.
+    """
+
+    def __init__(
+        self,
+        buckets: Any = None,
+        key_rate: float = KEY_RATE,
+        key_burst: int = KEY_BURST,
+        ip_rate: float = IP_RATE,
+        ip_burst: int = IP_BURST,
+        tokens_per_minute: float = KEY_TOKENS_PER_MINUTE,
+        token_estimate: float = TOKEN_ESTIMATE,
+        fair: bool = FAIR_QUEUE,
+    ) -> None:
+        self._buckets = buckets
+        self.key_rate = key_rate
+        self.key_burst = max(1, key_burst)
+        self.ip_rate = ip_rate
+        self.ip_burst = max(1, ip_burst)
+        self.tokens_per_minute = tokens_per_minute
+        self.token_estimate = token_estimate
+        self.fair = fair
+        # Running average of tokens per analysis, per tenant (this process only).
+        self.estimates: "OrderedDict[str, float]" = OrderedDict()
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"ip": 0, "key": 0, "tokens": 0}
+        self.errors = 0
+        self.tokens_recorded = 0
+        self._lock = threading.Lock()
+
+    @property
+    def buckets(self) -> Any:
+        with self._lock:
+            if self._buckets is None:
+                self._buckets = _buckets_from_env()
+            return self._buckets
+
+    def _take(self, key: str, rate: float, capacity: float, cost: float, **options: Any) -> float:
+        try:
+            return self.buckets.take(key, rate, capacity, cost, **options)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            return 0.0
+
+    def _reject(self, scope: str, wait: float, message: str) -> RateLimitError:
+        with self._lock:
+            self.rejected[scope] += 1
+        return RateLimitError(message, retry_after=max(1.0, wait), scope=scope)
+
+    def estimate(self, tenant: str) -> float:
+        with self._lock:
+            return self.estimates.get(tenant, self.token_estimate)
+
+    def admit(self, api_key: str, client_ip: Optional[str] = None, cost: int = 1) -> str:
+        """Charge ``cost`` requests to the key (and the address, if given); returns the tenant.
+
+        Raises :class:`RateLimitError` when a bucket or the key's token budget is exhausted.
+        """
+        tenant = tenant_id(api_key)
+        if client_ip is not None and self.ip_rate > 0:
+            wait = self._take(f"ip:{client_ip}", self.ip_rate / 60, self.ip_burst, cost)
+            if wait:
+                raise self._reject("ip", wait, "Too many requests from this address, retry later")
+        if self.key_rate > 0:
+            wait = self._take(f"key:{tenant}", self.key_rate / 60, self.key_burst, cost)
+            if wait:
+                raise self._reject("key", wait, "Too many requests for this API key, retry later")
+        if self.tokens_per_minute > 0:
+            needed = min(self.estimate(tenant) * cost, self.tokens_per_minute)
+            wait = self._take(f"tokens:{tenant}", self.tokens_per_minute / 60, self.tokens_per_minute, 0, required=needed)
+            if wait:
+                raise self._reject("tokens", wait, "Token budget for this API key is spent, retry later")
+        if self.fair:
+            current_tenant.set(tenant)
+        with self._lock:
+            self.admitted += 1
+        return tenant
+
+    def record_usage(self, api_key: str, tokens: int) -> None:
+        """Charge a model reply's tokens to the key's budget and update its running estimate."""
+        if tokens <= 0:
+            return
+        tenant = tenant_id(api_key)
+        if self.tokens_per_minute > 0:
+            self._take(f"tokens:{tenant}", self.tokens_per_minute / 60, self.tokens_per_minute, tokens, force=True)
+        with self._lock:
+            self.tokens_recorded += tokens
+            previous = self.estimates.pop(tenant, None)
+            self.estimates[tenant] = tokens if previous is None else 0.8 * previous + 0.2 * tokens
+            while len(self.estimates) > MAX_BUCKETS:
+                self.estimates.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Counters for the health endpoint; ``buckets`` is only counted for the in-memory store."""
+        store = self.buckets
+        buckets = len(store) if isinstance(store, MemoryBuckets) else None
+        with self._lock:
+            return {
+                "backend": type(store).__name__,
+                "buckets": buckets,
+                "key_rate_per_minute": self.key_rate,
+                "ip_rate_per_minute": self.ip_rate,
+                "key_tokens_per_minute": self.tokens_per_minute,
+                "fair_queue": self.fair,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "errors": self.errors,
+                "tokens_recorded": self.tokens_recorded,
+                "mean_tokens_per_analysis": (
+                    round(sum(self.estimates.values()) / len(self.estimates)) if self.estimates else None
+                ),
+            }
+
+
+admission = AdmissionController()
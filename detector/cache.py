@@ -0,0 +1,287 @@
+"""Content-addressed verdict cache shared by the Streamlit app and both APIs.
+
+Keys combine a hash of the uploaded bytes, the prompt text and the model name, so
+changing either the prompt or the model naturally misses old entries.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+CACHE_BACKEND = os.environ.get("DEEPFAKE_CACHE_BACKEND", "memory").lower()
+CACHE_TTL = float(os.environ.get("DEEPFAKE_CACHE_TTL", "3600"))
+CACHE_MAX_ENTRIES = int(os.environ.get("DEEPFAKE_CACHE_MAX_ENTRIES", "1024"))
+CACHE_PATH = os.environ.get("DEEPFAKE_CACHE_PATH", "/tmp/deepfake_verdicts.sqlite3")
+CACHE_URL = os.environ.get("DEEPFAKE_CACHE_URL", "redis://localhost:6379/0")
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def prompt_scope(prompt: str, model: str, version: str = "") -> str:
+    """Identifies a (prompt, model, prompt version) triple; verdicts are only reusable within one scope."""
+    return hashlib.sha256(f"{model}\0{prompt}\0{version}".encode("utf-8")).hexdigest()
+
+
+def verdict_key(digest: str, prompt: str, model: str, version: str = "") -> str:
+    """Cache key for one content digest under one prompt scope; see :func:`content_hash`."""
+    parts = (prompt_scope(prompt, model, version), digest)
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """In-process LRU dict with per-entry expiry."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """On-disk cache that survives restarts; LRU order is tracked by last access time."""
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS verdicts_accessed ON verdicts (accessed_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM verdicts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE verdicts SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO verdicts (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            self._conn.execute("DELETE FROM verdicts WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM verdicts WHERE key IN ("
+                "SELECT key FROM verdicts ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM verdicts")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+
+
+class RedisBackend:
+    """Redis-compatible store shared across workers.
+
+    ``client`` may be any object speaking the redis-py API for ``get``, ``set``,
+    ``delete``, ``zadd``, ``zcard``, ``zrange`` and ``zrem`` (e.g. ``fakeredis``).
+    Expiry is delegated to Redis; LRU order is kept in a sorted set.
+    """
+
+    def __init__(
+        self,
+        client: Any = None,
+        url: str = CACHE_URL,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        prefix: str = "deepfake:verdict:",
+    ) -> None:
+        if client is None:
+            import redis  # type: ignore
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self._lru_key = prefix + "lru"
+
+    @staticmethod
+    def _text(value: Any) -> Optional[str]:
+        if value is None:
+            return None
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._text(self.client.get(self.prefix + key))
+        if value is None:
+            self.client.zrem(self._lru_key, key)
+            return None
+        self.client.zadd(self._lru_key, {key: time.time()})
+        return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+        self.client.zadd(self._lru_key, {key: time.time()})
+        excess = self.client.zcard(self._lru_key) - self.max_entries
+        if excess > 0:
+            for stale in self.client.zrange(self._lru_key, 0, excess - 1):
+                stale = self._text(stale)
+                self.client.delete(self.prefix + stale)
+                self.client.zrem(self._lru_key, stale)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+        self.client.zrem(self._lru_key, key)
+
+    def clear(self) -> None:
+        for key in self.client.zrange(self._lru_key, 0, -1):
+            self.client.delete(self.prefix + self._text(key))
+        self.client.delete(self._lru_key)
+
+    def __len__(self) -> int:
+        return self.client.zcard(self._lru_key)
+
+
+class VerdictCache:
+    """JSON-serialising front end over a backend, with hit/miss counters."""
+
+    def __init__(self, backend: Any, ttl: float = CACHE_TTL) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            raw = self.backend.get(key)
+        except Exception:
+            self.errors += 1
+            raw = None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key: str, value: dict) -> None:
+        try:
+            self.backend.set(key, json.dumps(value), self.ttl)
+        except Exception:
+            self.errors += 1
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(key)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        try:
+            size = len(self.backend)
+        except Exception:
+            size = None
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class NullBackend:
+    """Backend used when caching is disabled; never stores anything."""
+
+    def get(self, key: str) -> Optional[str]:
+        return None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return 0
+
+
+def _backend_from_env() -> Any:
+    if CACHE_BACKEND in ("", "none", "off"):
+        return NullBackend()
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteBackend()
+    if CACHE_BACKEND == "redis":
+        return RedisBackend()
+    return MemoryBackend()
+
+
+_verdict_cache: Optional[VerdictCache] = None
+_verdict_cache_lock = threading.Lock()
+
+
+def get_verdict_cache() -> VerdictCache:
+    global _verdict_cache
+    with _verdict_cache_lock:
+        if _verdict_cache is None:
+            _verdict_cache = VerdictCache(_backend_from_env())
+        return _verdict_cache
+
+
+def set_verdict_cache(cache: VerdictCache) -> None:
+    """Swap the process-wide cache, e.g. for a fake Redis in benchmarks."""
+    global _verdict_cache
+    with _verdict_cache_lock:
+        _verdict_cache = cache
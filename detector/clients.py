@@ -0,0 +1,264 @@
+"""Keyed pool of reusable ``genai.Client`` instances, one per distinct API key.
+
+Building a client per request throws away its HTTP connection pool and TLS
+sessions. Clients here are shared across concurrent requests (the SDK's httpx
+transport is thread-safe), evicted LRU-first beyond ``max_clients`` and closed
+after ``idle_timeout`` seconds without use. A client that is evicted while a
+request still holds it is only closed once the last lease is returned.
+
+The SDK itself is imported on first use through ``genai_sdk``: ``google.genai``
+(mostly its ``types`` module) is the largest single import of a cold start, and
+routes such as health checks never need it.
+"""
+
+import hashlib
+import importlib
+import importlib.util
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+CLIENT_POOL_SIZE = int(os.environ.get("DEEPFAKE_CLIENT_POOL_SIZE", "32"))
+CLIENT_IDLE_TIMEOUT = float(os.environ.get("DEEPFAKE_CLIENT_IDLE_TIMEOUT", "300"))
+# off: import on first analyze; background: import in a daemon thread at startup;
+# eager: import during module load (for runtimes that snapshot the initialised process)
+GENAI_PREWARM = os.environ.get("DEEPFAKE_GENAI_PREWARM", "off").strip().lower()
+
+
+class GenaiLoader:
+    """Imports ``google.genai`` on first use and remembers how long that took."""
+
+    def __init__(self, name: str = "google.genai") -> None:
+        self.name = name
+        self.module: Any = None
+        self.error: Optional[BaseException] = None
+        self.load_seconds: Optional[float] = None
+        self.prewarmed = False
+        self._installed: Optional[bool] = None
+        self._lock = threading.Lock()
+
+    def installed(self) -> bool:
+        """Whether the SDK can be imported, without importing it."""
+        if self._installed is None:
+            try:
+                self._installed = importlib.util.find_spec(self.name) is not None
+            except (ImportError, ValueError):
+                self._installed = False
+        return self._installed and self.error is None
+
+    def load(self) -> Any:
+        if self.module is not None:
+            return self.module
+        with self._lock:
+            if self.error is not None:
+                raise self.error
+            if self.module is None:
+                started = time.perf_counter()
+                try:
+                    self.module = importlib.import_module(self.name)
+                except Exception as error:
+                    self.error = error
+                    raise
+                finally:
+                    self.load_seconds = time.perf_counter() - started
+        return self.module
+
+    def prewarm(self) -> None:
+        """Import the SDK and build one throwaway client, pulling in its lazily imported transport."""
+        try:
+            client = self.load().Client(api_key="prewarm")
+        except Exception:
+            return
+        close = getattr(client, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+        self.prewarmed = True
+
+    def start_prewarm(self, mode: str = GENAI_PREWARM) -> None:
+        if mode == "eager":
+            self.prewarm()
+        elif mode == "background":
+            threading.Thread(target=self.prewarm, name="genai-prewarm", daemon=True).start()
+
+    def stats(self) -> dict:
+        return {
+            "installed": self.installed(),
+            "loaded": self.module is not None,
+            "load_ms": round(self.load_seconds * 1000, 1) if self.load_seconds is not None else None,
+            "prewarm": GENAI_PREWARM,
+            "prewarmed": self.prewarmed,
+            "error": str(self.error) if self.error is not None else None,
+        }
+
+
+genai_sdk = GenaiLoader()
+
+
+def _default_factory(api_key: str) -> Any:
+    return genai_sdk.load().Client(api_key=api_key)
+
+
+class _Entry:
+    __slots__ = ("client", "leases", "last_used", "uses", "retired")
+
+    def __init__(self, client: Any) -> None:
+        self.client = client
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.uses = 0
+        self.retired = False
+
+
+class Lease:
+    """A borrowed client plus whether it was already warm when handed out."""
+
+    __slots__ = ("entry", "reused")
+
+    def __init__(self, entry: _Entry, reused: bool) -> None:
+        self.entry = entry
+        self.reused = reused
+
+    @property
+    def client(self) -> Any:
+        return self.entry.client
+
+    @property
+    def uses(self) -> int:
+        return self.entry.uses
+
+
+class ClientPool:
+    def __init__(
+        self,
+        factory: Optional[Callable[[str], Any]] = None,
+        max_clients: int = CLIENT_POOL_SIZE,
+        idle_timeout: float = CLIENT_IDLE_TIMEOUT,
+    ) -> None:
+        self.factory = factory or _default_factory
+        self.max_clients = max(1, max_clients)
+        self.idle_timeout = idle_timeout
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self.expired = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _slot(api_key: str) -> str:
+        # Never keep raw keys around as dict keys (they show up in debuggers and dumps).
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    def _close(self, entry: _Entry) -> None:
+        close = getattr(entry.client, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+
+    def _retire(self, slot: str) -> Optional[_Entry]:
+        entry = self._entries.pop(slot)
+        entry.retired = True
+        return entry if entry.leases == 0 else None
+
+    def _sweep(self, now: float) -> list:
+        closable = []
+        if self.idle_timeout > 0:
+            for slot, entry in list(self._entries.items()):
+                if entry.leases == 0 and now - entry.last_used > self.idle_timeout:
+                    self.expired += 1
+                    closable.append(self._retire(slot))
+        while len(self._entries) > self.max_clients:
+            slot = next(iter(self._entries))
+            self.evicted += 1
+            closable.append(self._retire(slot))
+        return [entry for entry in closable if entry is not None]
+
+    def acquire(self, api_key: str) -> "Lease":
+        """Borrow the client for ``api_key``; hand the lease back with ``release``.
+
+        A new client is built outside the lock (building one may import the SDK),
+        so other keys are not held up; if two threads race, the loser's client is closed.
+        """
+        slot = self._slot(api_key)
+        with self._lock:
+            entry = self._entries.get(slot)
+        built = None if entry is not None else _Entry(self.factory(api_key))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(slot)
+            reused = entry is not None
+            if entry is None:
+                entry = built
+                self._entries[slot] = entry
+                self.created += 1
+            else:
+                self._entries.move_to_end(slot)
+                self.reused += 1
+            entry.leases += 1
+            entry.uses += 1
+            entry.last_used = now
+            closable = self._sweep(now)
+        if built is not None and built is not entry:
+            closable.append(built)
+        for stale in closable:
+            self._close(stale)
+        return Lease(entry, reused)
+
+    def release(self, lease: "Lease") -> None:
+        entry = lease.entry
+        with self._lock:
+            entry.leases = max(0, entry.leases - 1)
+            entry.last_used = time.monotonic()
+            closable = entry.retired and entry.leases == 0
+        if closable:
+            self._close(entry)
+
+    @contextmanager
+    def lease(self, api_key: str) -> Iterator["Lease"]:
+        lease = self.acquire(api_key)
+        try:
+            yield lease
+        finally:
+            self.release(lease)
+
+    def clear(self) -> None:
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._close(entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.created + self.reused
+            return {
+                "clients": len(self._entries),
+                "max_clients": self.max_clients,
+                "in_use": sum(entry.leases for entry in self._entries.values()),
+                "created": self.created,
+                "reused": self.reused,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "reuse_rate": round(self.reused / requests, 4) if requests else 0.0,
+            }
+
+
+_default_pool: Optional[ClientPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def default_client_pool() -> ClientPool:
+    """Process-wide pool backed by ``google.genai``; survives Streamlit reruns."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ClientPool()
+        return _default_pool
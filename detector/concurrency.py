@@ -0,0 +1,236 @@
+"""Run blocking Gemini SDK calls off the event loop with a per-worker concurrency cap.
+
+When the cap is reached, waiting calls are granted slots round-robin across
+tenants (see :data:`current_tenant`), so one key with a deep queue cannot starve
+the others.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Deque, Iterable, Optional, Tuple
+
+MODEL_WORKERS = int(os.environ.get("DEEPFAKE_MODEL_WORKERS", "8"))
+MAX_CONCURRENT_CALLS = int(os.environ.get("DEEPFAKE_MAX_CONCURRENT_CALLS", str(MODEL_WORKERS)))
+QUEUE_TIMEOUT = float(os.environ.get("DEEPFAKE_QUEUE_TIMEOUT", "30"))
+
+
+# Who a model call is made for (a hashed API key); set per request by detector.admission.
+current_tenant: ContextVar[str] = ContextVar("deepfake_tenant", default="")
+
+
+class ModelCapacityError(RuntimeError):
+    """Raised when a model call waited longer than the queue timeout for a free slot."""
+
+
+class FairSemaphore:
+    """Counting semaphore whose waiters are queued per tenant and served round-robin."""
+
+    def __init__(self, value: int) -> None:
+        self._value = value
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    def waiting_tenants(self) -> int:
+        return len(self._queues)
+
+    async def acquire(self, tenant: str = "") -> None:
+        if self._value > 0 and not self._queues:
+            self._value -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(tenant, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # the slot arrived just as we gave up; pass it on
+            else:
+                queue = self._queues.get(tenant)
+                if queue is not None and waiter in queue:
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[tenant]
+            raise
+
+    def release(self) -> None:
+        while self._queues:
+            tenant, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(tenant)  # this tenant goes behind the others
+            else:
+                del self._queues[tenant]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._value += 1
+
+
+class ModelExecutor:
+    """Bounded thread pool plus a fair semaphore guarding in-flight model calls.
+
+    The SDK's ``generate_content`` is synchronous, so calling it from an ``async def``
+    route stalls every other request on the worker. Calls are dispatched to a
+    dedicated pool instead, and the semaphore keeps excess requests waiting on the
+    loop (cheaply) rather than piling up threads.
+    """
+
+    def __init__(
+        self,
+        workers: int = MODEL_WORKERS,
+        max_concurrent: int = MAX_CONCURRENT_CALLS,
+        queue_timeout: float = QUEUE_TIMEOUT,
+    ) -> None:
+        self.workers = max(1, workers)
+        self.max_concurrent = max(1, max_concurrent)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, FairSemaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="gemini")
+            return self._pool
+
+    def _semaphore(self) -> FairSemaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = FairSemaphore(self.max_concurrent)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def _acquire(self) -> FairSemaphore:
+        semaphore = self._semaphore()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(current_tenant.get()), timeout=self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ModelCapacityError("Server busy: too many analyses in progress, retry shortly") from None
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return semaphore
+
+    def _release(self, semaphore: FairSemaphore) -> None:
+        self.in_flight -= 1
+        self.completed += 1
+        semaphore.release()
+
+    def _release_from_thread(self, loop: asyncio.AbstractEventLoop, semaphore: FairSemaphore) -> None:
+        try:
+            loop.call_soon_threadsafe(self._release, semaphore)
+        except RuntimeError:
+            pass  # the loop has gone away, and its semaphore with it
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run ``fn`` on the pool once a slot is free.
+
+        The slot is released when the pool thread is done, not when the caller
+        stops waiting: a cancelled request whose call already started keeps its
+        slot until the call returns, so the limit holds for running threads.
+        """
+        semaphore = await self._acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._executor().submit(partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release(semaphore)
+            raise
+        future.add_done_callback(lambda _: self._release_from_thread(loop, semaphore))
+        return await asyncio.wrap_future(future)
+
+    async def stream(self, fn: Callable[..., Iterable[Any]], *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        """Like :meth:`run` for calls returning a blocking iterator; items are yielded as they arrive.
+
+        A pool thread drains the iterator into a queue. If the consumer stops early
+        (say the client disconnected), the thread closes the iterator after its
+        current item, and the slot is only released once that thread is done.
+        """
+        semaphore = await self._acquire()
+        loop = asyncio.get_running_loop()
+        queue: "asyncio.Queue[Tuple[Any, Optional[BaseException]]]" = asyncio.Queue()
+        stop = threading.Event()
+        end = object()
+
+        def push(item: Any, error: Optional[BaseException] = None) -> None:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+            except RuntimeError:
+                stop.set()  # the loop has gone away
+
+        def drain() -> None:
+            iterator = None
+            try:
+                iterator = iter(fn(*args, **kwargs))
+                for item in iterator:
+                    if stop.is_set():
+                        break
+                    push(item)
+            except BaseException as error:
+                push(end, error)
+                return
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+            push(end)
+
+        try:
+            worker = loop.run_in_executor(self._executor(), drain)
+        except BaseException:
+            self._release(semaphore)
+            raise
+        worker.add_done_callback(lambda _: self._release(semaphore))
+        try:
+            while True:
+                item, error = await queue.get()
+                if error is not None:
+                    raise error
+                if item is end:
+                    return
+                yield item
+        finally:
+            stop.set()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "waiting_tenants": sum(semaphore.waiting_tenants() for semaphore in list(self._semaphores.values())),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+
+model_executor = ModelExecutor()
+
+
+async def run_model_call(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    return await model_executor.run(fn, *args, **kwargs)
+
+
+def stream_model_call(fn: Callable[..., Iterable[Any]], *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+    return model_executor.stream(fn, *args, **kwargs)
@@ -0,0 +1,305 @@
+"""Gemini context caching for the fixed forensic instructions.
+
+The instructions are sent as a system instruction, apart from the media and the
+per-request note. With ``DEEPFAKE_CONTEXT_CACHE`` on, they are stored once per
+(API key, model, prompt version) with ``client.caches.create``, and requests then
+reference the cached content by name. That way the instructions are neither
+re-sent nor re-tokenized, and cached input tokens are billed at a discount. A
+cache within ``CONTEXT_CACHE_REFRESH`` seconds of expiring has its TTL extended;
+handles past their expiry are swept, together with their per-key locks.
+A cache the server no longer knows is dropped, and the call is repeated once
+with the instructions inline.
+
+Caching is best effort and off by default. Gemini refuses to cache less than a
+model-specific minimum (about ``DEEPFAKE_CONTEXT_CACHE_MIN_TOKENS``), so shorter
+instructions are sent inline without trying. The shipped forensic prompt is
+well below it, and the response schema cannot move into the cache (it stays in
+the request config), so the feature only pays off with a much longer custom
+prompt. When ``create`` fails (the model has no caching, or the key has no
+quota), that (API key, model) pair goes inline for ``CONTEXT_CACHE_RETRY``
+seconds.
+
+Everything here is synchronous SDK work, like :mod:`detector.files`.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+CONTEXT_CACHE = os.environ.get("DEEPFAKE_CONTEXT_CACHE", "0").lower() in ("1", "true", "yes")
+CONTEXT_CACHE_TTL = float(os.environ.get("DEEPFAKE_CONTEXT_CACHE_TTL", "3600"))
+CONTEXT_CACHE_REFRESH = float(os.environ.get("DEEPFAKE_CONTEXT_CACHE_REFRESH", "300"))
+CONTEXT_CACHE_RETRY = float(os.environ.get("DEEPFAKE_CONTEXT_CACHE_RETRY", "600"))
+CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get("DEEPFAKE_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+_CHARS_PER_TOKEN = 4  # rough size estimate; the real count is only known after create
+_SWEEP_INTERVAL = 60.0
+
+
+def estimated_tokens(text: str) -> int:
+    return len(text) // _CHARS_PER_TOKEN
+
+
+def is_missing_cache_error(error: Exception) -> bool:
+    """True for the 404 / NOT_FOUND the API returns when referenced cached content expired or was deleted.
+
+    A 403 means the key may not use the cache (or the API); retrying inline would hide that.
+    """
+    return getattr(error, "code", None) == 404 or str(getattr(error, "status", "") or "").upper() == "NOT_FOUND"
+
+
+class CachedInstructions:
+    __slots__ = ("name", "model", "version", "expires_at", "tokens", "uses")
+
+    def __init__(self, name: str, model: str, version: str, expires_at: float, tokens: int) -> None:
+        self.name = name
+        self.model = model
+        self.version = version
+        self.expires_at = expires_at
+        self.tokens = tokens
+        self.uses = 0
+
+    def expiring(self, margin: float, now: Optional[float] = None) -> bool:
+        return (now or time.time()) >= self.expires_at - margin
+
+
+class ContextCacheRegistry:
+    """Cached-content handles per (API key, model, prompt version), plus token and latency accounting."""
+
+    def __init__(
+        self,
+        enabled: bool = CONTEXT_CACHE,
+        ttl: float = CONTEXT_CACHE_TTL,
+        refresh: float = CONTEXT_CACHE_REFRESH,
+        retry: float = CONTEXT_CACHE_RETRY,
+        min_tokens: int = CONTEXT_CACHE_MIN_TOKENS,
+    ) -> None:
+        self.enabled = enabled
+        self.ttl = ttl
+        self.refresh = refresh
+        self.retry = retry
+        self.min_tokens = min_tokens
+        self.created = 0
+        self.refreshed = 0
+        self.recreated = 0
+        self.create_failures = 0
+        self.too_small = 0
+        self.cached_calls = 0
+        self.inline_calls = 0
+        self.cached_tokens = 0
+        self.prompt_tokens = 0
+        self._cached_seconds = 0.0
+        self._inline_seconds = 0.0
+        self._entries: Dict[Tuple[str, str, str], CachedInstructions] = {}
+        self._unavailable: Dict[Tuple[str, str], float] = {}
+        self._locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+        self.last_error: Optional[str] = None
+        self._swept_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _slot(api_key: str, model: str, version: str) -> Tuple[str, str, str]:
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest(), model, version
+
+    def _sweep(self) -> None:
+        """Drop expired handles, their idle per-key locks and lapsed retry blocks; call with ``_lock`` held."""
+        now, clock = time.time(), time.monotonic()
+        if clock - self._swept_at < _SWEEP_INTERVAL:
+            return
+        self._swept_at = clock
+        for slot in [slot for slot, entry in self._entries.items() if entry.expires_at <= now]:
+            del self._entries[slot]
+        for slot in [slot for slot, lock in self._locks.items() if slot not in self._entries and not lock.locked()]:
+            del self._locks[slot]
+        for pair in [pair for pair, until in self._unavailable.items() if until <= clock]:
+            del self._unavailable[pair]
+
+    def _key_lock(self, slot: Tuple[str, str, str]) -> threading.Lock:
+        with self._lock:
+            self._sweep()
+            lock = self._locks.get(slot)
+            if lock is None:
+                lock = self._locks[slot] = threading.Lock()
+            return lock
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def discard(self, api_key: str, model: str, version: str) -> None:
+        slot = self._slot(api_key, model, version)
+        with self._lock:
+            self._entries.pop(slot, None)
+            lock = self._locks.get(slot)
+            if lock is not None and not lock.locked():
+                del self._locks[slot]
+
+    def ensure(
+        self, client: Any, api_key: str, model: str, instructions: str, version: str
+    ) -> Optional[CachedInstructions]:
+        """A live cache of ``instructions`` for this key and model, or ``None`` to send them inline."""
+        if not self.enabled:
+            return None
+        if estimated_tokens(instructions) < self.min_tokens:
+            self._count("too_small")
+            return None
+        slot = self._slot(api_key, model, version)
+        with self._key_lock(slot):
+            with self._lock:
+                entry = self._entries.get(slot)
+                blocked_until = self._unavailable.get(slot[:2], 0.0)
+            if entry is None and time.monotonic() < blocked_until:
+                return None
+            if entry is not None and entry.expiring(self.refresh):
+                entry = self._extend(client, entry)
+            if entry is None:
+                entry = self._create(client, model, instructions, version)
+                if entry is None:
+                    with self._lock:
+                        self._unavailable[slot[:2]] = time.monotonic() + self.retry
+                    return None
+            with self._lock:
+                self._entries[slot] = entry
+                self._unavailable.pop(slot[:2], None)
+                entry.uses += 1
+            return entry
+
+    def _create(self, client: Any, model: str, instructions: str, version: str) -> Optional[CachedInstructions]:
+        try:
+            cached = client.caches.create(
+                model=model,
+                config={
+                    "system_instruction": instructions,
+                    "ttl": f"{int(self.ttl)}s",
+                    "display_name": f"deepfake-forensic-{version}"[:128],
+                },
+            )
+        except Exception as error:
+            with self._lock:
+                self.create_failures += 1
+                self.last_error = str(error)[:200]
+            return None
+        usage = getattr(cached, "usage_metadata", None)
+        tokens = int(getattr(usage, "total_token_count", None) or estimated_tokens(instructions))
+        self._count("created")
+        return CachedInstructions(cached.name, model, version, time.time() + self.ttl, tokens)
+
+    def _extend(self, client: Any, entry: CachedInstructions) -> Optional[CachedInstructions]:
+        """Push the expiry out again; ``None`` (recreate) if the cache is already gone."""
+        try:
+            client.caches.update(name=entry.name, config={"ttl": f"{int(self.ttl)}s"})
+        except Exception:
+            self._count("recreated")
+            return None
+        entry.expires_at = time.time() + self.ttl
+        self._count("refreshed")
+        return entry
+
+    @staticmethod
+    def _config(entry: Optional[CachedInstructions], instructions: str, config: Dict[str, Any]) -> Dict[str, Any]:
+        if entry is not None:
+            return {**config, "cached_content": entry.name}
+        return {**config, "system_instruction": instructions}
+
+    def record(self, response: Any, seconds: float, entry: Optional[CachedInstructions]) -> None:
+        """Account one reply: input tokens served from the cache and time to the (first) response."""
+        usage = getattr(response, "usage_metadata", None)
+        with self._lock:
+            self.prompt_tokens += int(getattr(usage, "prompt_token_count", None) or 0)
+            if entry is not None:
+                self.cached_calls += 1
+                self._cached_seconds += seconds
+                self.cached_tokens += int(getattr(usage, "cached_content_token_count", None) or entry.tokens)
+            else:
+                self.inline_calls += 1
+                self._inline_seconds += seconds
+
+    def generate(
+        self,
+        client: Any,
+        api_key: str,
+        model: str,
+        instructions: str,
+        version: str,
+        config: Dict[str, Any],
+        call: Callable[[Dict[str, Any]], Any],
+    ) -> Any:
+        """``call(config)`` with the instructions cached (or inline); repeated inline if the cache vanished."""
+        entry = self.ensure(client, api_key, model, instructions, version)
+        started = time.perf_counter()
+        try:
+            response = call(self._config(entry, instructions, config))
+        except Exception as error:
+            if entry is None or not is_missing_cache_error(error):
+                raise
+            self.discard(api_key, model, version)
+            self._count("recreated")
+            entry = None
+            started = time.perf_counter()
+            response = call(self._config(None, instructions, config))
+        self.record(response, time.perf_counter() - started, entry)
+        return response
+
+    def stream(
+        self,
+        client: Any,
+        api_key: str,
+        model: str,
+        instructions: str,
+        version: str,
+        config: Dict[str, Any],
+        call: Callable[[Dict[str, Any]], Iterator[Any]],
+    ) -> Iterator[Any]:
+        """Streaming :meth:`generate`; the inline retry only happens before the first chunk."""
+        entry = self.ensure(client, api_key, model, instructions, version)
+        for attempt in range(2):
+            started = time.perf_counter()
+            first: Optional[float] = None
+            last = None
+            try:
+                for chunk in call(self._config(entry, instructions, config)):
+                    if first is None:
+                        first = time.perf_counter() - started
+                    last = chunk
+                    yield chunk
+            except Exception as error:
+                if first is not None or attempt or entry is None or not is_missing_cache_error(error):
+                    raise
+                self.discard(api_key, model, version)
+                self._count("recreated")
+                entry = None
+                continue
+            self.record(last, first or 0.0, entry)
+            return
+
+    def stats(self) -> dict:
+        with self._lock:
+            cached_ms = self._cached_seconds / self.cached_calls * 1000 if self.cached_calls else None
+            inline_ms = self._inline_seconds / self.inline_calls * 1000 if self.inline_calls else None
+            return {
+                "enabled": self.enabled,
+                "caches": len(self._entries),
+                "created": self.created,
+                "refreshed": self.refreshed,
+                "recreated": self.recreated,
+                "create_failures": self.create_failures,
+                "too_small": self.too_small,
+                "last_error": self.last_error,
+                "cached_calls": self.cached_calls,
+                "inline_calls": self.inline_calls,
+                "cached_tokens": self.cached_tokens,
+                "cached_token_share": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+                "tokens_saved_per_request": round(self.cached_tokens / self.cached_calls, 1)
+                if self.cached_calls
+                else 0.0,
+                "mean_cached_ms": round(cached_ms, 1) if cached_ms is not None else None,
+                "mean_inline_ms": round(inline_ms, 1) if inline_ms is not None else None,
+                # Time to (first) response without the cache minus with it, averaged per call
+                "latency_saved_ms_per_request": round(inline_ms - cached_ms, 1)
+                if cached_ms is not None and inline_ms is not None
+                else None,
+            }
+
+
+context_caches = ContextCacheRegistry()
@@ -0,0 +1,903 @@
+"""One analysis pipeline behind the Streamlit app and both FastAPI backends.
+
+:class:`AnalysisEngine` turns an :class:`AnalysisRequest` (media, its type and
+digest, and the caller's API key) into an :class:`AnalysisResult`. These stages
+run in order, and each is a constructor argument that can be swapped alone:
+
+  cache       verdict cache, keyed by content digest, prompt and model
+  index       near-duplicate lookup by perceptual hash
+  screen      local pre-screen that settles obvious images without the model
+  split       cut long videos into segments analysed in parallel
+  preprocess  downscale photos and sample video keyframes
+  router      cheap model tiers first, escalating unsure answers (see
+              :mod:`detector.routing`; off unless tiers are configured)
+  caller      retries and fallback models around the pooled client's call
+              (large untouched uploads are sent through the Files API; the
+              instructions go as a system instruction, context-cached when
+              large enough, see :mod:`detector.context_cache`)
+  parse       the model's JSON report as typed fields
+
+:meth:`AnalysisEngine.analyze` and :meth:`AnalysisEngine.stream` run the
+pipeline from async code and move blocking stages onto the worker pools. The
+stages are public methods too, so the Streamlit script can drive them
+synchronously and render between them.
+
+Stage modules are imported the first time a stage runs: importing the engine
+does not load Pillow, PyAV, the Files API or the perceptual index.
+"""
+
+import asyncio
+import hashlib
+import io
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from detector.metrics import stage
+from detector.report import REPORT_INSTRUCTIONS, ForensicReport
+
+# Bump when the meaning of a verdict changes in a way the prompt text and report
+# schema do not show (parsing, preprocessing). Part of every prompt version.
+PROMPT_REVISION = 4
+
+FORENSIC_PROMPT = f"""You are an expert forensic digital media analyst specializing in deepfake detection. Analyze the provided media for inconsistencies in:
+
+1. **Lighting & Shadows:** Check if light sources on the subject match the background.
+2. **Facial Artifacts:** Look for 'ghosting' around edges, unnatural eye reflections, or irregular blinking patterns.
+3. **Texture & Noise:** Identify inconsistent skin textures or 'digital noise' that suggests GAN/Diffusion generation.
+4. **Audio-Visual Sync:** (For Video) Check if lip movements align perfectly with the phonemes in the audio.
+
+{REPORT_INSTRUCTIONS}"""
+
+# The user turn after the media; the instructions above are the system instruction.
+ANALYSIS_REQUEST = "Analyze the media above and write the forensic report."
+
+SUPPORTED_TYPES = frozenset(
+    {"image/jpeg", "image/jpg", "image/png", "video/mp4", "video/quicktime", "video/x-msvideo"}
+)
+SUPPORTED_EXTENSIONS = ("mp4", "mov", "avi", "jpg", "jpeg", "png")
+
+# ``(name, data)`` pairs from :meth:`AnalysisEngine.stream`: "verdict" (dict), "delta" (text),
+# "timing" (dict) and finally "result" (AnalysisResult).
+Event = Tuple[str, Any]
+_READ_CHUNK = 256 * 1024
+
+
+class _SharedFileView(io.RawIOBase):
+    """Read-only view of a file shared by concurrent stages: its own position, reads under the shared lock."""
+
+    def __init__(self, file: Any, lock: threading.Lock, size: int) -> None:
+        self._file = file
+        self._lock = lock
+        self._size = size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def readinto(self, buffer: Any) -> int:
+        with self._lock:
+            self._file.seek(self._position)
+            chunk = self._file.read(len(buffer))
+        buffer[: len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+
+class AnalysisRequest:
+    """Media to analyse: a seekable binary file with its size, SHA-256 digest and MIME type.
+
+    Stages never read the whole file up front: each takes its own reader from
+    :meth:`open` and reads what it decodes, so a spooled upload stays on disk.
+    """
+
+    def __init__(
+        self, file: Any, size: int, digest: str, mime_type: str, api_key: str, data: Optional[bytes] = None
+    ) -> None:
+        self.file = file
+        self.size = size
+        self.digest = digest
+        self.mime_type = mime_type
+        self.api_key = api_key
+        self._data = data
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, mime_type: str, api_key: str) -> "AnalysisRequest":
+        from detector.cache import content_hash
+
+        return cls(io.BytesIO(data), len(data), content_hash(data), mime_type, api_key, data)
+
+    @classmethod
+    def from_upload(cls, upload: Any, api_key: str) -> "AnalysisRequest":
+        """From a :class:`detector.uploads.IngestedUpload` (already hashed and sniffed)."""
+        return cls(upload.file, upload.size, upload.digest, upload.mime_type, api_key)
+
+    def open(self) -> Any:
+        """A private seekable reader over the content; stages running in parallel each take their own."""
+        if self._data is not None:
+            return io.BytesIO(self._data)
+        return io.BufferedReader(_SharedFileView(self.file, self._lock, self.size), _READ_CHUNK)
+
+
+class AnalysisResult(BaseModel):
+    """Verdict and report for one analysis; the API responses are built from these fields."""
+
+    verdict: str
+    confidence: str
+    analysis: str
+    is_fake: bool
+    cached: bool = False
+    similarity: Optional[float] = None
+    model: Optional[str] = None
+    findings: Optional[Dict[str, Any]] = None
+    metadata: Optional[Dict[str, Any]] = None
+    sampling: Optional[Dict[str, Any]] = None
+    regions: Optional[Dict[str, Any]] = None
+    segments: Optional[Dict[str, Any]] = None
+    routing: Optional[Dict[str, Any]] = None
+    prescreened: bool = False
+
+    def verdict_fields(self) -> Dict[str, Any]:
+        """What the verdict cache keeps: everything that belongs to the content, not to this lookup."""
+        return self.model_dump(exclude={"cached", "similarity"})
+
+
+def error_status(error: BaseException) -> Tuple[int, str, Optional[float]]:
+    """``(status, detail, retry_after)`` to answer with when an analysis failed."""
+    from detector.admission import RateLimitError
+    from detector.concurrency import ModelCapacityError
+    from detector.report import ReportError
+    from detector.resilience import http_status
+
+    if isinstance(error, ModelCapacityError):
+        return 503, str(error), None
+    if isinstance(error, ReportError):
+        return 502, str(error), None
+    if isinstance(error, RateLimitError):
+        return 429, str(error), error.retry_after
+    upstream = http_status(error)
+    if upstream is not None:
+        return upstream
+    return 500, f"Analysis failed: {error}", None
+
+
+def prompt_version(prompt: str, revision: int = PROMPT_REVISION) -> str:
+    """``r<revision>-<hash>`` of the instructions and report schema.
+
+    Keys the upstream context cache and every local verdict cache, so changing
+    either invalidates both.
+    """
+    schema = ForensicReport.model_json_schema()
+    digest = hashlib.sha256(f"{prompt}\0{schema}".encode("utf-8")).hexdigest()
+    return f"r{revision}-{digest[:12]}"
+
+
+def _verdict_cache() -> Any:
+    from detector.cache import get_verdict_cache
+
+    return get_verdict_cache()
+
+
+def _perceptual_index() -> Any:
+    from detector.phash import get_perceptual_index
+
+    return get_perceptual_index()
+
+
+def _screen(media: Any, mime_type: str) -> Any:
+    from detector.prescreen import screen_media
+
+    return screen_media(media, mime_type)
+
+
+def _split(media: Any, mime_type: str) -> Any:
+    from detector.segments import plan_for
+
+    return plan_for(media, mime_type)
+
+
+def _preprocess(media: Any, mime_type: str) -> Any:
+    from detector.preprocess import prepare
+
+    return prepare(media, mime_type)
+
+
+def _parse(text: Optional[str]) -> Any:
+    from detector.report import parse_report
+
+    return parse_report(text)
+
+
+def _usage_tokens(response: Any) -> int:
+    from detector.admission import usage_tokens
+
+    return usage_tokens(response)
+
+
+class AnalysisEngine:
+    """The analysis pipeline with its stages; see the module docstring for the order.
+
+    ``clients`` is a :class:`detector.clients.ClientPool` and ``caller`` a
+    :class:`detector.resilience.ModelCaller` (the process-wide ones by default).
+    ``cache`` and ``index`` return the verdict cache and perceptual index (or
+    ``None`` to skip near-duplicates). ``screen``, ``split`` and ``preprocess``
+    take ``(media, mime_type)``, media being a seekable binary file; ``split`` returns segment ``(start, end)`` spans,
+    empty for a single call. ``parse`` takes the reply text. ``record_usage`` is
+    called with ``(api_key, tokens)`` after each model reply. ``context_cache`` is
+    a :class:`detector.context_cache.ContextCacheRegistry` and ``router`` a
+    :class:`detector.routing.ModelRouter`.
+    """
+
+    def __init__(
+        self,
+        clients: Any = None,
+        caller: Any = None,
+        prompt: str = FORENSIC_PROMPT,
+        model: Optional[str] = None,
+        cache: Callable[[], Any] = _verdict_cache,
+        index: Callable[[], Any] = _perceptual_index,
+        screen: Callable[[Any, str], Any] = _screen,
+        split: Callable[[Any, str], Any] = _split,
+        preprocess: Callable[[Any, str], Any] = _preprocess,
+        parse: Callable[[Optional[str]], Any] = _parse,
+        record_usage: Optional[Callable[[str, int], None]] = None,
+        context_cache: Any = None,
+        router: Any = None,
+    ) -> None:
+        self._clients = clients
+        self._caller = caller
+        self._context_cache = context_cache
+        self._router = router
+        self.prompt = prompt
+        self.prompt_version = prompt_version(prompt)
+        self._model = model
+        self.cache = cache
+        self.index = index
+        self.screen = screen
+        self.split = split
+        self.preprocess = preprocess
+        self.parse = parse
+        self.record_usage = record_usage
+
+    @property
+    def clients(self) -> Any:
+        if self._clients is None:
+            from detector.clients import default_client_pool
+
+            self._clients = default_client_pool()
+        return self._clients
+
+    @property
+    def caller(self) -> Any:
+        if self._caller is None:
+            from detector.resilience import model_caller
+
+            self._caller = model_caller
+        return self._caller
+
+    @property
+    def context_cache(self) -> Any:
+        if self._context_cache is None:
+            from detector.context_cache import context_caches
+
+            self._context_cache = context_caches
+        return self._context_cache
+
+    @property
+    def router(self) -> Any:
+        if self._router is None:
+            from detector.routing import model_router
+
+            self._router = model_router
+        return self._router
+
+    @property
+    def model(self) -> str:
+        """Model the cache keys follow: the primary one; fallbacks are recorded per result."""
+        if self._model is None:
+            from detector.resilience import PRIMARY_MODEL
+
+            self._model = PRIMARY_MODEL
+        return self._model
+
+    def _key_model(self) -> str:
+        # A routed verdict may come from a cheaper tier: key it by the whole policy
+        return f"{self.router.signature()}>{self.model}" if self.router.enabled else self.model
+
+    def cache_key(self, request: AnalysisRequest) -> str:
+        from detector.cache import verdict_key
+
+        return verdict_key(request.digest, self.prompt, self._key_model(), self.prompt_version)
+
+    def _scope(self) -> str:
+        from detector.cache import prompt_scope
+
+        return prompt_scope(self.prompt, self._key_model(), self.prompt_version)
+
+    # --- lookup: cache, near-duplicates, pre-screen ---------------------------------
+
+    def cached(self, request: AnalysisRequest) -> Optional[AnalysisResult]:
+        with stage("cache", request.mime_type, request.size):
+            fields = self.cache().get(self.cache_key(request))
+        return AnalysisResult(cached=True, **fields) if fields is not None else None
+
+    def hashes(self, request: AnalysisRequest) -> List[int]:
+        from detector.phash import media_hashes
+
+        return media_hashes(request.open(), request.mime_type)
+
+    def near_duplicate(self, index: Any, hashes: List[int]) -> Optional[AnalysisResult]:
+        match = index.lookup(hashes, scope=self._scope(), version=self.prompt_version) if hashes else None
+        if match is None:
+            return None
+        stored, similarity = match
+        # The index keeps only the verdict; the report comes from the verdict cache while it is there.
+        fields = self.cache().get(stored["key"]) if stored.get("key") else None
+        if fields is None:
+            fields = {
+                "verdict": stored["verdict"],
+                "confidence": stored["confidence"],
+                "is_fake": stored["is_fake"],
+                "model": stored.get("model"),
+                "analysis": "Near-duplicate of a file analysed earlier; its full report is no longer cached.",
+            }
+        # Metadata and sampling reports belong to the original file, not to its near-duplicates.
+        fields = {**fields, "metadata": None, "sampling": None, "regions": None, "segments": None, "routing": None}
+        return AnalysisResult(cached=True, similarity=similarity, **fields)
+
+    def settle(self, request: AnalysisRequest, screening: Any) -> Optional[AnalysisResult]:
+        """The pre-screen's verdict as a result (and cached), or ``None`` to escalate."""
+        if screening is None or not screening.decided:
+            return None
+        # Not added to the near-duplicate index: a lightly edited copy is exactly
+        # what the pre-screen cannot vouch for.
+        result = AnalysisResult(
+            verdict=screening.verdict,
+            confidence=f"{screening.confidence:.0%}",
+            analysis=screening.analysis(),
+            is_fake=screening.verdict == "FAKE",
+            prescreened=True,
+        )
+        self.cache().set(self.cache_key(request), result.verdict_fields())
+        return result
+
+    def lookup(self, request: AnalysisRequest) -> Tuple[Optional[AnalysisResult], List[int]]:
+        """Answer without the model if possible (blocking).
+
+        Returns ``(None, hashes)`` when the model has to look; pass ``hashes`` on so its verdict is indexed.
+        """
+        result = self.cached(request)
+        if result is not None:
+            return result, []
+        hashes: List[int] = []
+        index = self.index()
+        if index is not None:
+            with stage("phash", request.mime_type, request.size):
+                hashes = self.hashes(request)
+                result = self.near_duplicate(index, hashes)
+            if result is not None:
+                return result, []
+        if request.mime_type.startswith("image/"):
+            with stage("prescreen", request.mime_type, request.size):
+                result = self.settle(request, self.screen(request.open(), request.mime_type))
+            if result is not None:
+                return result, []
+        return None, hashes
+
+    async def lookup_async(self, request: AnalysisRequest) -> Tuple[Optional[AnalysisResult], List[int]]:
+        """:meth:`lookup` with the cache, index, hashing and the pre-screen off the event loop."""
+        from detector.preprocess import preprocess_executor
+
+        result = await asyncio.to_thread(self.cached, request)
+        if result is not None:
+            return result, []
+        hashes: List[int] = []
+        index = await asyncio.to_thread(self.index)
+        if index is not None:
+            with stage("phash", request.mime_type, request.size):
+                hashes = await asyncio.to_thread(self.hashes, request)
+                result = await asyncio.to_thread(self.near_duplicate, index, hashes)
+            if result is not None:
+                return result, []
+        if request.mime_type.startswith("image/"):
+            with stage("prescreen", request.mime_type, request.size):
+                screening = await preprocess_executor.run(self.screen, request.open(), request.mime_type)
+                result = await asyncio.to_thread(self.settle, request, screening)
+            if result is not None:
+                return result, []
+        return None, hashes
+
+    # --- preprocess, model call, parse, store ---------------------------------------
+
+    def plan(self, request: AnalysisRequest) -> List[Tuple[float, float]]:
+        """Segment spans for a long video; empty when it goes to the model in one call."""
+        if not request.mime_type.startswith("video/"):
+            return []
+        with stage("split", request.mime_type, request.size):
+            return self.split(request.open(), request.mime_type)
+
+    async def plan_async(self, request: AnalysisRequest) -> List[Tuple[float, float]]:
+        from detector.preprocess import preprocess_executor
+
+        if not request.mime_type.startswith("video/"):
+            return []
+        with stage("split", request.mime_type, request.size):
+            return await preprocess_executor.run(self.split, request.open(), request.mime_type)
+
+    def prepare(self, request: AnalysisRequest) -> Any:
+        with stage("preprocess", request.mime_type, request.size):
+            return self.preprocess(request.open(), request.mime_type)
+
+    async def prepare_async(self, request: AnalysisRequest) -> Any:
+        from detector.preprocess import preprocess_executor
+
+        with stage("preprocess", request.mime_type, request.size):
+            return await preprocess_executor.run(self.preprocess, request.open(), request.mime_type)
+
+    def generate(
+        self,
+        request: AnalysisRequest,
+        prepared: Any,
+        client: Any,
+        stream: bool = False,
+        max_output_tokens: Optional[int] = None,
+    ) -> Callable:
+        """``fn(model)`` for :attr:`caller`: one ``generate_content`` call (or stream) on ``client``.
+
+        The instructions travel as the (context-cached) system instruction; the
+        contents are the media and :data:`ANALYSIS_REQUEST` plus the media's note.
+        Untouched payloads over the Files API threshold are uploaded once and sent by reference.
+        ``max_output_tokens`` overrides the report's output budget (routing tiers use a tight one).
+        """
+        from detector.files import generate_with_remote_file, stream_with_remote_file, use_files_api
+        from detector.report import generation_config
+
+        config = generation_config() if max_output_tokens is None else generation_config(max_output_tokens)
+        note = ANALYSIS_REQUEST + prepared.prompt_note()
+        contexts = self.context_cache
+        run = contexts.stream if stream else contexts.generate
+        if not prepared.transformed and use_files_api(request.size):
+            remote = stream_with_remote_file if stream else generate_with_remote_file
+
+            def call(model: str) -> Any:
+                def send(config: Dict[str, Any]) -> Any:
+                    return remote(
+                        client,
+                        request.api_key,
+                        model,
+                        request.digest,
+                        request.open(),
+                        request.mime_type,
+                        note,
+                        request.size,
+                        config=config,
+                    )
+
+                return run(client, request.api_key, model, self.prompt, self.prompt_version, config, send)
+
+            return call
+
+        def call(model: str) -> Any:
+            method = client.models.generate_content_stream if stream else client.models.generate_content
+            contents = [*prepared.parts(), note]
+
+            def send(config: Dict[str, Any]) -> Any:
+                return method(model=model, contents=contents, config=config)
+
+            return run(client, request.api_key, model, self.prompt, self.prompt_version, config, send)
+
+        return call
+
+    def complete(
+        self,
+        request: AnalysisRequest,
+        prepared: Any,
+        text: Optional[str],
+        model: str,
+        hashes: List[int],
+        steps: Optional[List[Dict[str, Any]]] = None,
+        started: float = 0.0,
+    ) -> AnalysisResult:
+        """Parse the model's reply into a result and store it.
+
+        ``steps`` and ``started`` come from :meth:`cascade` when the routing tiers escalated to this reply.
+        """
+        with stage("parse", request.mime_type, request.size):
+            report = self.parse(text)
+        routing = self.router.conclude(steps, started, report, model) if steps is not None else None
+        return self.finish(request, prepared, report, model, hashes, routing)
+
+    def finish(
+        self,
+        request: AnalysisRequest,
+        prepared: Any,
+        report: Any,
+        model: str,
+        hashes: List[int],
+        routing: Optional[Dict[str, Any]] = None,
+    ) -> AnalysisResult:
+        """A parsed report as the stored result; findings that name a face crop get its box."""
+        from detector.regions import locate_findings
+
+        fields = report.result_fields()
+        fields["findings"] = locate_findings(fields["findings"], prepared.regions)
+        result = AnalysisResult(
+            **fields,
+            model=model,
+            metadata=prepared.metadata or None,
+            sampling=prepared.stats,
+            regions=prepared.regions,
+            routing=routing,
+        )
+        self.store(request, result, hashes)
+        return result
+
+    def store(self, request: AnalysisRequest, result: AnalysisResult, hashes: List[int]) -> None:
+        with stage("store", request.mime_type, request.size):
+            fields = result.verdict_fields()
+            self.cache().set(self.cache_key(request), fields)
+            index = self.index()
+            if index is not None and hashes:
+                index.add(
+                    hashes,
+                    {
+                        "key": self.cache_key(request),
+                        "verdict": result.verdict,
+                        "confidence": result.confidence,
+                        "is_fake": result.is_fake,
+                        "model": result.model,
+                        "scope": self._scope(),
+                        "version": self.prompt_version,
+                    },
+                )
+
+    def _record(self, request: AnalysisRequest, tokens: int) -> None:
+        if self.record_usage is not None:
+            self.record_usage(request.api_key, tokens)
+
+    def _discarded(self, request: AnalysisRequest) -> Callable[[Any], None]:
+        """Records the usage of a reply that lost a hedge race: its tokens were spent all the same."""
+        return lambda response: self._record(request, _usage_tokens(response))
+
+    @staticmethod
+    def _answer_events(clock: Any, result: AnalysisResult) -> List[Event]:
+        """A result that did not stream from the model (local, or a routing tier) as one verdict and one delta."""
+        clock.chunk()
+        clock.verdict()
+        verdict = {key: getattr(result, key) for key in ("verdict", "confidence", "is_fake")}
+        return [("verdict", verdict), ("delta", result.analysis)]
+
+    @staticmethod
+    def _chunk_events(reader: Any, clock: Any, chunk: Any) -> List[Event]:
+        clock.chunk()
+        pieces = reader.feed(chunk.text or "")
+        events: List[Event] = []
+        update = reader.verdict_update()
+        if update is not None:
+            clock.verdict()
+            events.append(("verdict", update))
+        events.extend(("delta", piece) for piece in pieces)
+        return events
+
+    # --- model calls ---------------------------------------------------------------------
+    # The client lease happens inside these blocking calls, on the model executor: the first
+    # request with a key builds its client (and may import the SDK), which must not stall the loop.
+
+    def call(self, request: AnalysisRequest, prepared: Any) -> Tuple[Any, str]:
+        """Blocking call to the regular models: ``(response, model)``."""
+        with stage("client", request.mime_type, request.size):
+            lease = self.clients.acquire(request.api_key)
+        try:
+            generate = self.generate(request, prepared, lease.client)
+            with stage("model", request.mime_type, request.size):
+                return self.caller.call(generate, discarded=self._discarded(request))
+        finally:
+            self.clients.release(lease)
+
+    def stream_call(self, request: AnalysisRequest, prepared: Any) -> Iterator[Tuple[str, Any]]:
+        """Blocking stream from the regular models: ``(model, chunk)`` pairs."""
+        with stage("client", request.mime_type, request.size):
+            lease = self.clients.acquire(request.api_key)
+        try:
+            generate = self.generate(request, prepared, lease.client, stream=True)
+            with stage("model", request.mime_type, request.size):
+                yield from self.caller.stream(generate)
+        finally:
+            self.clients.release(lease)
+
+    # --- routed model calls ------------------------------------------------------------
+
+    def ask(self, request: AnalysisRequest, prepared: Any, tier: Any = None) -> Tuple[Any, str]:
+        """Blocking model call and parse: ``(report, model)`` from a routing ``tier``, or the regular models."""
+        with stage("client", request.mime_type, request.size):
+            lease = self.clients.acquire(request.api_key)
+        try:
+            if tier is None:
+                generate = self.generate(request, prepared, lease.client)
+            else:
+                generate = self.generate(request, prepared, lease.client, max_output_tokens=tier.max_output_tokens)
+            with stage("model", request.mime_type, request.size):
+                models = [tier.model] if tier is not None else None
+                response, model = self.caller.call(generate, models=models, discarded=self._discarded(request))
+        finally:
+            self.clients.release(lease)
+        self._record(request, _usage_tokens(response))
+        with stage("parse", request.mime_type, request.size):
+            return self.parse(response.text), model
+
+    def routed(self, request: AnalysisRequest, prepared: Any) -> Tuple[Any, str, Optional[Dict[str, Any]]]:
+        """Blocking ``(report, model, routing trace)``: through the router's tiers when it has any."""
+        if not self.router.enabled:
+            return (*self.ask(request, prepared), None)
+        return self.router.route(lambda tier: self.ask(request, prepared, tier))
+
+    def cascade(self, request: AnalysisRequest, prepared: Any) -> Tuple[Any, Optional[str], List[Dict[str, Any]]]:
+        """Blocking: the router's cheap tiers only, for streams that then stream the regular models."""
+        return self.router.cascade(lambda tier: self.ask(request, prepared, tier))
+
+    # --- segmented videos ---------------------------------------------------------------
+
+    def _segment_call(self, request: AnalysisRequest, prepared: Any) -> Tuple[Any, str]:
+        """Blocking model call for one sampled segment: ``(report, model)``."""
+        report, model, _ = self.routed(request, prepared)
+        return report, model
+
+    def _segment_events(self, run: Any, clock: Any, outcome: Tuple) -> List[Event]:
+        """Record one finished segment: ``segment`` and ``delta`` events, plus ``verdict`` once settled."""
+        index, report, model, seconds, error = outcome
+        settled = run.decision() is not None
+        entry = run.add(index, report, model, seconds) if error is None else run.fail(index, error, seconds)
+        clock.chunk()
+        events: List[Event] = [("segment", dict(entry)), ("delta", run.line(entry) + "\n")]
+        if not settled and run.decision() is not None:
+            clock.verdict()
+            fields = run.verdict_fields()
+            events.append(("verdict", {key: fields[key] for key in ("verdict", "confidence", "is_fake")}))
+        return events
+
+    def _segment_result(self, request: AnalysisRequest, run: Any, hashes: List[int]) -> AnalysisResult:
+        from detector.segments import record_run
+
+        run.cancel_pending()
+        report = run.report()
+        record_run(report)
+        result = AnalysisResult(**run.verdict_fields(), analysis=run.analysis(), model=run.model(), segments=report)
+        if not run.partial:
+            # A verdict from part of the clip is answered but not cached: a retry may analyse all of it
+            self.store(request, result, hashes)
+        return result
+
+    async def analyze_segments(
+        self, request: AnalysisRequest, spans: List[Tuple[float, float]], hashes: List[int]
+    ) -> AsyncIterator[Event]:
+        """Analyse ``spans`` of a video concurrently; events as segments finish, then timing and result.
+
+        Sampling runs on the preprocessing pool and each model call takes a model
+        executor slot. Segments still queued or in flight when the verdict is
+        settled are cancelled.
+        """
+        from detector.concurrency import run_model_call
+        from detector.preprocess import preprocess_executor
+        from detector.segments import SEGMENT_CONCURRENCY, SegmentRun, sample_segment
+        from detector.streaming import StreamClock
+
+        clock = StreamClock()
+        run = SegmentRun(spans)
+        gate = asyncio.Semaphore(max(1, SEGMENT_CONCURRENCY))
+
+        async def one(index: int, start: float, end: float) -> Tuple:
+            async with gate:
+                began = time.perf_counter()
+                try:
+                    with stage("preprocess", request.mime_type, request.size):
+                        prepared = await preprocess_executor.run(
+                            sample_segment, request.open(), request.mime_type, start, end
+                        )
+                    report, model = await run_model_call(self._segment_call, request, prepared)
+                    return index, report, model, time.perf_counter() - began, None
+                except Exception as error:
+                    return index, None, None, time.perf_counter() - began, error
+
+        tasks = [asyncio.create_task(one(index, start, end)) for index, (start, end) in enumerate(spans)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                for event in self._segment_events(run, clock, await finished):
+                    yield event
+                if run.decision() is not None:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        result = await asyncio.to_thread(self._segment_result, request, run, hashes)
+        yield "timing", clock.timings()
+        yield "result", result
+
+    def stream_segments(
+        self, request: AnalysisRequest, spans: List[Tuple[float, float]], hashes: List[int]
+    ) -> Iterator[Event]:
+        """Blocking :meth:`analyze_segments` on a private thread pool, for the Streamlit script."""
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        from detector.segments import SEGMENT_CONCURRENCY, SegmentRun, sample_segment
+        from detector.streaming import StreamClock
+
+        clock = StreamClock()
+        run = SegmentRun(spans)
+        settled = threading.Event()
+
+        def one(index: int, start: float, end: float) -> Tuple:
+            began = time.perf_counter()
+            try:
+                with stage("preprocess", request.mime_type, request.size):
+                    prepared = sample_segment(request.open(), request.mime_type, start, end)
+                if settled.is_set():
+                    raise RuntimeError("cancelled")  # sampled after the verdict was settled; never read
+                report, model = self._segment_call(request, prepared)
+                return index, report, model, time.perf_counter() - began, None
+            except Exception as error:
+                return index, None, None, time.perf_counter() - began, error
+
+        pool = ThreadPoolExecutor(max_workers=max(1, SEGMENT_CONCURRENCY), thread_name_prefix="segment")
+        try:
+            futures = [pool.submit(one, index, start, end) for index, (start, end) in enumerate(spans)]
+            for future in as_completed(futures):
+                yield from self._segment_events(run, clock, future.result())
+                if run.decision() is not None:
+                    settled.set()
+                    break
+        finally:
+            # Queued segments are dropped; calls already in flight finish in the background
+            pool.shutdown(wait=False, cancel_futures=True)
+        result = self._segment_result(request, run, hashes)
+        yield "timing", clock.timings()
+        yield "result", result
+
+    # --- whole analyses ----------------------------------------------------------------
+
+    async def analyze(self, request: AnalysisRequest) -> AnalysisResult:
+        """Run every stage; the model call goes through the model executor's slots."""
+        result, hashes = await self.lookup_async(request)
+        if result is not None:
+            return result
+        spans = await self.plan_async(request)
+        if spans:
+            return await self._segments_result(request, spans, hashes)
+        return await self._model_result(request, await self.prepare_async(request), hashes)
+
+    def resolve(self, request: AnalysisRequest, hashes: List[int], screening: Any) -> Optional[AnalysisResult]:
+        """:meth:`lookup` with the near-duplicate ``hashes`` and pre-screen outcome already computed."""
+        result = self.cached(request)
+        if result is None and hashes:
+            index = self.index()
+            if index is not None:
+                result = self.near_duplicate(index, hashes)
+        if result is None and request.mime_type.startswith("image/"):
+            result = self.settle(request, screening)
+        return result
+
+    async def analyze_precomputed(
+        self,
+        request: AnalysisRequest,
+        hashes: List[int],
+        screening: Any,
+        spans: List[Tuple[float, float]],
+        prepared: Any,
+    ) -> AnalysisResult:
+        """:meth:`analyze` for media whose CPU stages ran elsewhere, e.g. in the bulk scanner's worker processes.
+
+        ``hashes``, ``screening``, ``spans`` and ``prepared`` are what the index,
+        ``screen``, ``split`` and ``preprocess`` stages returned for it
+        (``prepared`` may be ``None`` when the screening or spans settle it).
+        """
+        result = await asyncio.to_thread(self.resolve, request, hashes, screening)
+        if result is not None:
+            return result
+        if spans:
+            return await self._segments_result(request, spans, hashes)
+        return await self._model_result(request, prepared, hashes)
+
+    async def _segments_result(
+        self, request: AnalysisRequest, spans: List[Tuple[float, float]], hashes: List[int]
+    ) -> AnalysisResult:
+        result = None
+        async for event, data in self.analyze_segments(request, spans, hashes):
+            if event == "result":
+                result = data
+        return result
+
+    async def _model_result(self, request: AnalysisRequest, prepared: Any, hashes: List[int]) -> AnalysisResult:
+        from detector.concurrency import run_model_call
+
+        if self.router.enabled:
+            report, model, routing = await run_model_call(self.routed, request, prepared)
+            return await asyncio.to_thread(self.finish, request, prepared, report, model, hashes, routing)
+        response, model = await run_model_call(self.call, request, prepared)
+        await asyncio.to_thread(self._record, request, _usage_tokens(response))
+        return await asyncio.to_thread(self.complete, request, prepared, response.text, model, hashes)
+
+    async def stream(self, request: AnalysisRequest) -> AsyncIterator[Event]:
+        """:meth:`analyze` as events while the report is written (see :data:`Event`).
+
+        ``verdict`` comes as soon as it is parsed, and again if the confidence
+        completes in a later chunk. Local answers, and answers from a routing
+        tier, arrive as one verdict and one delta; only the regular models stream.
+        """
+        from detector.concurrency import run_model_call, stream_model_call
+        from detector.streaming import ReportStream, StreamClock
+
+        clock = StreamClock()
+        result, hashes = await self.lookup_async(request)
+        spans = await self.plan_async(request) if result is None else []
+        if spans:
+            async for event in self.analyze_segments(request, spans, hashes):
+                yield event
+            return
+        steps = None
+        if result is None:
+            prepared = await self.prepare_async(request)
+            started = time.perf_counter()
+            if self.router.enabled:
+                report, model, steps = await run_model_call(self.cascade, request, prepared)
+                if report is not None:
+                    routing = self.router.conclude(steps, started)
+                    result = await asyncio.to_thread(self.finish, request, prepared, report, model, hashes, routing)
+        if result is None:
+            reader = ReportStream()
+            tokens = 0
+            async for model, chunk in stream_model_call(self.stream_call, request, prepared):
+                tokens = _usage_tokens(chunk) or tokens  # the last chunk carries the totals
+                for event in self._chunk_events(reader, clock, chunk):
+                    yield event
+            await asyncio.to_thread(self._record, request, tokens)
+            result = await asyncio.to_thread(
+                self.complete, request, prepared, reader.text, model, hashes, steps, started
+            )
+        else:
+            for event in self._answer_events(clock, result):
+                yield event
+        yield "timing", clock.timings()
+        yield "result", result
+
+    def stream_report(self, request: AnalysisRequest, prepared: Any, hashes: List[int]) -> Iterator[Event]:
+        """Blocking model stream for already prepared media: verdict and delta events, timing, result.
+
+        Transient errors before the first chunk are retried, then the fallback models.
+        Routing tiers are asked first and, when one answers, it comes as one verdict and one delta.
+        """
+        from detector.streaming import ReportStream, StreamClock
+
+        clock = StreamClock()
+        steps = None
+        started = time.perf_counter()
+        if self.router.enabled:
+            report, model, steps = self.cascade(request, prepared)
+            if report is not None:
+                result = self.finish(request, prepared, report, model, hashes, self.router.conclude(steps, started))
+                yield from self._answer_events(clock, result)
+                yield "timing", clock.timings()
+                yield "result", result
+                return
+        reader = ReportStream()
+        tokens = 0
+        for model, chunk in self.stream_call(request, prepared):
+            tokens = _usage_tokens(chunk) or tokens
+            yield from self._chunk_events(reader, clock, chunk)
+        self._record(request, tokens)
+        result = self.complete(request, prepared, reader.text, model, hashes, steps, started)
+        yield "timing", clock.timings()
+        yield "result", result
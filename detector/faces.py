@@ -0,0 +1,51 @@
+"""Optional face detection used to steer frame selection.
+
+Backed by OpenCV's bundled Haar cascade when ``opencv-python-headless<5`` is
+installed; without it :func:`detect_faces` returns no faces and callers fall
+back to whole-frame heuristics.
+"""
+
+import threading
+from typing import Any, List, Optional, Tuple
+
+Box = Tuple[int, int, int, int]
+
+_cascade: Any = None
+_cascade_lock = threading.Lock()
+_local = threading.local()
+
+
+def _classifier() -> Optional[Any]:
+    global _cascade
+    try:
+        import cv2  # type: ignore
+    except ImportError:
+        return None
+    if not hasattr(cv2, "CascadeClassifier"):
+        # OpenCV 5 moved the Haar cascades out of the main package.
+        return None
+    with _cascade_lock:
+        if _cascade is None:
+            _cascade = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+    # CascadeClassifier is not thread-safe; keep one per thread.
+    classifier = getattr(_local, "classifier", None)
+    if classifier is None:
+        classifier = _local.classifier = cv2.CascadeClassifier(_cascade)
+    return classifier
+
+
+def faces_available() -> bool:
+    return _classifier() is not None
+
+
+def detect_faces(image: Any, min_size: int = 24) -> List[Box]:
+    """Face boxes ``(left, top, right, bottom)`` in a PIL image, largest first."""
+    classifier = _classifier()
+    if classifier is None:
+        return []
+    import numpy as np
+
+    pixels = np.asarray(image.convert("L"))
+    found = classifier.detectMultiScale(pixels, scaleFactor=1.15, minNeighbors=5, minSize=(min_size, min_size))
+    boxes = [(int(x), int(y), int(x + w), int(y + h)) for x, y, w, h in found]
+    return sorted(boxes, key=lambda box: (box[2] - box[0]) * (box[3] - box[1]), reverse=True)
@@ -0,0 +1,259 @@
+"""Large-media path through the Gemini Files API.
+
+Inline ``Part.from_bytes`` re-sends the whole video in every request body. Above
+``FILES_API_THRESHOLD`` bytes the content is uploaded once with
+``client.files.upload``, the returned handle is remembered per (API key, content
+digest) until shortly before it expires, and ``generate_content`` references it
+by URI. Google keeps uploaded files for up to 48 hours; a threshold of ``-1``
+sends everything inline instead. Retries and repeat analyses of the same
+content reuse the handle; a handle the server reports as not found is dropped
+and re-uploaded once. Expired handles and their per-content locks are swept,
+so the registry holds at most the uploads of the last 47 hours.
+
+Everything here is synchronous SDK work; callers in async code run it through
+:func:`detector.concurrency.run_model_call`.
+"""
+
+import datetime
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+FILES_API_THRESHOLD = int(float(os.environ.get("DEEPFAKE_FILES_API_THRESHOLD_MB", "4")) * 1024 * 1024)
+FILE_ACTIVE_TIMEOUT = float(os.environ.get("DEEPFAKE_FILE_ACTIVE_TIMEOUT", "120"))
+FILE_POLL_INTERVAL = float(os.environ.get("DEEPFAKE_FILE_POLL_INTERVAL", "1"))
+# Uploaded files live for 48 hours; stop reusing a handle well before that.
+DEFAULT_FILE_TTL = 47 * 3600
+EXPIRY_MARGIN = 10 * 60
+_SWEEP_INTERVAL = 60.0
+
+
+class RemoteFile:
+    __slots__ = ("name", "uri", "mime_type", "expires_at", "uses")
+
+    def __init__(self, name: str, uri: str, mime_type: str, expires_at: float) -> None:
+        self.name = name
+        self.uri = uri
+        self.mime_type = mime_type
+        self.expires_at = expires_at
+        self.uses = 0
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return (now or time.time()) >= self.expires_at - EXPIRY_MARGIN
+
+
+def _state_name(state: Any) -> str:
+    return str(getattr(state, "name", state) or "").upper().rsplit(".", 1)[-1]
+
+
+def _expiry_timestamp(value: Any) -> float:
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.timestamp()
+    if isinstance(value, str) and value:
+        try:
+            return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return time.time() + DEFAULT_FILE_TTL
+
+
+def is_missing_file_error(error: Exception) -> bool:
+    """True for the 404 / NOT_FOUND the API returns when a referenced file expired or was deleted.
+
+    A 403 means the key may not use the file (or the API); re-uploading would not help.
+    """
+    return getattr(error, "code", None) == 404 or str(getattr(error, "status", "") or "").upper() == "NOT_FOUND"
+
+
+class RemoteFileRegistry:
+    """Remembers uploaded file handles per (API key, content digest) with expiry tracking."""
+
+    def __init__(self) -> None:
+        self.uploads = 0
+        self.reused = 0
+        self.reuploads = 0
+        self.bytes_uploaded = 0
+        self._files: Dict[Tuple[str, str], RemoteFile] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._swept_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _slot(api_key: str, digest: str) -> Tuple[str, str]:
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest(), digest
+
+    def _sweep(self) -> None:
+        """Drop expired handles and the idle locks of content without a handle; call with ``_lock`` held."""
+        clock = time.monotonic()
+        if clock - self._swept_at < _SWEEP_INTERVAL:
+            return
+        self._swept_at = clock
+        now = time.time()
+        for slot in [slot for slot, remote in self._files.items() if remote.expired(now)]:
+            del self._files[slot]
+        for slot in [slot for slot, lock in self._locks.items() if slot not in self._files and not lock.locked()]:
+            del self._locks[slot]
+
+    def _key_lock(self, slot: Tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            self._sweep()
+            lock = self._locks.get(slot)
+            if lock is None:
+                lock = self._locks[slot] = threading.Lock()
+            return lock
+
+    def get(self, api_key: str, digest: str) -> Optional[RemoteFile]:
+        slot = self._slot(api_key, digest)
+        with self._lock:
+            remote = self._files.get(slot)
+            if remote is not None and remote.expired():
+                del self._files[slot]
+                return None
+            return remote
+
+    def discard(self, api_key: str, digest: str, reupload: bool = False) -> None:
+        """Forget the handle; ``reupload`` counts it as dropped because the server lost the file."""
+        with self._lock:
+            self._files.pop(self._slot(api_key, digest), None)
+            self.reuploads += int(reupload)
+
+    def ensure(
+        self,
+        client: Any,
+        api_key: str,
+        digest: str,
+        source: Any,
+        mime_type: str,
+        size: int = 0,
+    ) -> RemoteFile:
+        """Return a live handle for the content, uploading ``source`` only if needed.
+
+        Concurrent callers for the same content wait on one upload instead of racing.
+        """
+        slot = self._slot(api_key, digest)
+        with self._key_lock(slot):
+            remote = self.get(api_key, digest)
+            if remote is not None:
+                with self._lock:
+                    self.reused += 1
+                    remote.uses += 1
+                return remote
+            if hasattr(source, "seek"):
+                source.seek(0)
+            uploaded = client.files.upload(
+                file=source,
+                config={"mime_type": mime_type, "display_name": digest[:40]},
+            )
+            uploaded = self._wait_until_active(client, uploaded)
+            remote = RemoteFile(
+                name=uploaded.name,
+                uri=uploaded.uri,
+                mime_type=getattr(uploaded, "mime_type", None) or mime_type,
+                expires_at=_expiry_timestamp(getattr(uploaded, "expiration_time", None)),
+            )
+            remote.uses = 1
+            with self._lock:
+                self._files[slot] = remote
+                self.uploads += 1
+                self.bytes_uploaded += size
+            return remote
+
+    @staticmethod
+    def _wait_until_active(client: Any, uploaded: Any) -> Any:
+        # Videos are processed server-side before they can be referenced.
+        deadline = time.monotonic() + FILE_ACTIVE_TIMEOUT
+        while _state_name(getattr(uploaded, "state", None)) == "PROCESSING":
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Uploaded file {uploaded.name} still processing after {FILE_ACTIVE_TIMEOUT:g}s")
+            time.sleep(FILE_POLL_INTERVAL)
+            uploaded = client.files.get(name=uploaded.name)
+        if _state_name(getattr(uploaded, "state", None)) == "FAILED":
+            raise RuntimeError(f"Gemini could not process uploaded file {uploaded.name}")
+        return uploaded
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "uploads": self.uploads,
+                "reused": self.reused,
+                "reuploads": self.reuploads,
+                "bytes_uploaded": self.bytes_uploaded,
+            }
+
+
+remote_files = RemoteFileRegistry()
+
+
+def use_files_api(size: int, threshold: int = FILES_API_THRESHOLD) -> bool:
+    return threshold >= 0 and size > threshold
+
+
+def generate_with_remote_file(
+    client: Any,
+    api_key: str,
+    model: str,
+    digest: str,
+    source: Any,
+    mime_type: str,
+    prompt: str,
+    size: int = 0,
+    registry: Optional[RemoteFileRegistry] = None,
+    config: Optional[Any] = None,
+) -> Any:
+    """Upload (or reuse) the content as a remote file, then run ``generate_content`` on it."""
+    from google.genai import types  # type: ignore
+
+    registry = registry or remote_files
+
+    def generate() -> Any:
+        remote = registry.ensure(client, api_key, digest, source, mime_type, size)
+        part = types.Part.from_uri(file_uri=remote.uri, mime_type=remote.mime_type)
+        return client.models.generate_content(model=model, contents=[part, prompt], config=config)
+
+    try:
+        return generate()
+    except Exception as error:
+        if not is_missing_file_error(error):
+            raise
+        registry.discard(api_key, digest, reupload=True)
+    return generate()
+
+
+def stream_with_remote_file(
+    client: Any,
+    api_key: str,
+    model: str,
+    digest: str,
+    source: Any,
+    mime_type: str,
+    prompt: str,
+    size: int = 0,
+    registry: Optional[RemoteFileRegistry] = None,
+    config: Optional[Any] = None,
+) -> Iterator[Any]:
+    """Streaming counterpart of :func:`generate_with_remote_file`, yielding response chunks.
+
+    A remote file that expired is re-uploaded only if the stream failed before its
+    first chunk; after that the error is raised to the caller.
+    """
+    from google.genai import types  # type: ignore
+
+    registry = registry or remote_files
+    for attempt in range(2):
+        remote = registry.ensure(client, api_key, digest, source, mime_type, size)
+        part = types.Part.from_uri(file_uri=remote.uri, mime_type=remote.mime_type)
+        started = False
+        try:
+            for chunk in client.models.generate_content_stream(model=model, contents=[part, prompt], config=config):
+                started = True
+                yield chunk
+            return
+        except Exception as error:
+            if started or attempt or not is_missing_file_error(error):
+                raise
+            registry.discard(api_key, digest, reupload=True)
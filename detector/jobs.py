@@ -0,0 +1,333 @@
+"""Persistent background jobs for long analyses: submit, poll, fetch, optional webhook.
+
+Jobs live in SQLite so they survive worker restarts. A worker claims a job by
+taking a time-limited lease, identified by a fresh token; if the process dies
+mid-analysis the lease runs out and another worker picks the job up again
+(at-least-once processing). Completing, failing or re-queueing a job only takes
+effect while the caller still holds its lease, so a worker whose lease lapsed
+cannot overwrite the result of the worker that took over.
+
+Every job belongs to the tenant (API key hash) that submitted it, and only that
+tenant can read it. Submissions from the same tenant carrying a dedup key that
+matches a queued, running or finished job (with the same webhook, if any)
+return that job instead of creating a new one.
+
+The uploaded content is kept in ``JOBS_DIR`` until the job finishes. The API key
+is stored alongside it for the same reason and cleared on completion.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional
+
+JOBS_DB_PATH = os.environ.get("DEEPFAKE_JOBS_DB", "/tmp/deepfake_jobs.sqlite3")
+JOBS_DIR = os.environ.get("DEEPFAKE_JOBS_DIR", "/tmp/deepfake_jobs")
+JOB_WORKERS = int(os.environ.get("DEEPFAKE_JOB_WORKERS", "2"))
+JOB_LEASE_SECONDS = float(os.environ.get("DEEPFAKE_JOB_LEASE_SECONDS", "600"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("DEEPFAKE_JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.environ.get("DEEPFAKE_JOB_POLL_INTERVAL", "1"))
+WEBHOOK_TIMEOUT = float(os.environ.get("DEEPFAKE_WEBHOOK_TIMEOUT", "10"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobError(Exception):
+    """A job failure that should not be retried (e.g. bad input or an invalid key)."""
+
+
+class JobStore:
+    def __init__(self, path: str = JOBS_DB_PATH, spool_dir: str = JOBS_DIR) -> None:
+        self.path = path
+        self.spool_dir = spool_dir
+        os.makedirs(spool_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, dedup_key TEXT, content_path TEXT, "
+            "mime_type TEXT, size INTEGER, digest TEXT, api_key TEXT, webhook_url TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL, available_at REAL NOT NULL, "
+            "result TEXT, error TEXT, webhook_status TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column in ("tenant", "lease_owner"):
+            if column not in columns:  # databases created before these columns existed
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, available_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key)")
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def find_duplicate(self, dedup_key: str, tenant: str, webhook_url: Optional[str] = None) -> Optional[dict]:
+        """The tenant's latest live job for ``dedup_key``; one with another webhook only when none is given."""
+        if webhook_url:
+            row = self._execute(
+                "SELECT * FROM jobs WHERE dedup_key = ? AND tenant = ? AND status != ? AND webhook_url = ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (dedup_key, tenant, FAILED, webhook_url),
+            ).fetchone()
+        else:
+            row = self._execute(
+                "SELECT * FROM jobs WHERE dedup_key = ? AND tenant = ? AND status != ? ORDER BY created_at DESC LIMIT 1",
+                (dedup_key, tenant, FAILED),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def create(
+        self,
+        source: Any,
+        mime_type: str,
+        size: int,
+        digest: str,
+        api_key: str,
+        dedup_key: Optional[str] = None,
+        webhook_url: Optional[str] = None,
+        tenant: Optional[str] = None,
+    ) -> dict:
+        """Persist the content and a queued job owned by ``tenant``; ``source`` is a readable binary file."""
+        job_id = uuid.uuid4().hex
+        content_path = os.path.join(self.spool_dir, job_id)
+        source.seek(0)
+        with open(content_path, "wb") as handle:
+            shutil.copyfileobj(source, handle, 1024 * 1024)
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, status, dedup_key, content_path, mime_type, size, digest, api_key, "
+            "webhook_url, tenant, available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job_id, QUEUED, dedup_key, content_path, mime_type, size, digest, api_key, webhook_url, tenant,
+                now, now, now,
+            ),
+        )
+        return self.get(job_id)
+
+    def get(self, job_id: str, tenant: Optional[str] = None) -> Optional[dict]:
+        """The job, or ``None``; with ``tenant``, also ``None`` when another tenant owns it."""
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or (tenant is not None and row["tenant"] != tenant):
+            return None
+        return dict(row)
+
+    def claim(self, lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[dict]:
+        """Lease the oldest runnable job: queued, or running with an expired lease.
+
+        The returned job's ``lease_owner`` token must be passed back (inside the
+        job) to :meth:`complete` or :meth:`fail`.
+        """
+        now = time.time()
+        owner = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?) "
+                    "ORDER BY available_at LIMIT 1",
+                    (QUEUED, now, RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, lease_owner = ?, "
+                    "updated_at = ? WHERE id = ?",
+                    (RUNNING, now + lease_seconds, owner, now, row["id"]),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"])
+
+    def _finish(self, job: dict, status: str, result: Optional[dict], error: Optional[str]) -> bool:
+        updated = self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, api_key = NULL, content_path = NULL, "
+            "lease_until = NULL, lease_owner = NULL, updated_at = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+            (
+                status, json.dumps(result) if result is not None else None, error, time.time(),
+                job["id"], RUNNING, job.get("lease_owner"),
+            ),
+        ).rowcount
+        if not updated:
+            return False  # the lease lapsed and another worker owns the job (and its content) now
+        if job.get("content_path"):
+            try:
+                os.remove(job["content_path"])
+            except OSError:
+                pass
+        return True
+
+    def complete(self, job: dict, result: dict) -> bool:
+        """Store the result; ``False`` when the lease was lost and nothing changed."""
+        return self._finish(job, DONE, result, None)
+
+    def fail(self, job: dict, error: str, retry: bool, max_attempts: int = JOB_MAX_ATTEMPTS) -> bool:
+        """Re-queue with backoff or fail for good; ``False`` when the lease was lost and nothing changed."""
+        if retry and job["attempts"] < max_attempts:
+            delay = min(60.0, 2.0 ** job["attempts"])
+            return bool(
+                self._execute(
+                    "UPDATE jobs SET status = ?, error = ?, lease_until = NULL, lease_owner = NULL, available_at = ?, "
+                    "updated_at = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+                    (QUEUED, error, time.time() + delay, time.time(), job["id"], RUNNING, job.get("lease_owner")),
+                ).rowcount
+            )
+        return self._finish(job, FAILED, None, error)
+
+    def set_webhook_status(self, job_id: str, status: str) -> None:
+        self._execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (status, job_id))
+
+    def counts(self) -> dict:
+        rows = self._execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+def public_view(job: dict) -> dict:
+    """Job fields safe to return to clients (never the API key or spool path)."""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "result": json.loads(job["result"]) if job.get("result") else None,
+        "error": job.get("error") if job["status"] != DONE else None,
+        "webhook_status": job.get("webhook_status"),
+    }
+
+
+async def deliver_webhook(url: str, payload: dict, attempts: int = 3) -> str:
+    """POST ``payload`` to ``url``; redirects are not followed.
+
+    The host is checked again right before sending, since its DNS may have
+    changed since submission to point at a private address.
+    """
+    import httpx
+    from fastapi import HTTPException
+
+    from detector.uploads import check_public_url
+
+    try:
+        await check_public_url(url)
+    except HTTPException as error:
+        return f"refused ({error.detail})"
+    last = "not sent"
+    async with httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT) as client:
+        for attempt in range(attempts):
+            try:
+                response = await client.post(url, json=payload)
+                if response.status_code < 300:
+                    return f"delivered ({response.status_code})"
+                last = f"failed ({response.status_code})"
+                if response.status_code < 500:
+                    return last
+            except Exception as error:
+                last = f"failed ({type(error).__name__})"
+            await asyncio.sleep(0.5 * 2**attempt)
+    return last
+
+
+class JobRunner:
+    """Async worker pool draining a :class:`JobStore` with bounded concurrency.
+
+    ``process(job)`` returns the JSON-serialisable result; raising :class:`JobError`
+    fails the job immediately, any other exception is retried with backoff.
+    """
+
+    def __init__(
+        self,
+        store_factory: Callable[[], JobStore],
+        process: Callable[[dict], Awaitable[dict]],
+        workers: int = JOB_WORKERS,
+        poll_interval: float = JOB_POLL_INTERVAL,
+    ) -> None:
+        self._store_factory = store_factory
+        self._store: Optional[JobStore] = None
+        self._store_lock = threading.Lock()
+        self.process = process
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self._tasks: list = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+
+    @property
+    def store(self) -> JobStore:
+        with self._store_lock:
+            if self._store is None:
+                self._store = self._store_factory()
+            return self._store
+
+    def ensure_started(self) -> None:
+        """Start the workers on the running loop (idempotent; also resumes persisted jobs)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and all(not task.done() for task in self._tasks):
+            return
+        self._loop = loop
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def call(self, method: Callable[..., Any], *args: Any) -> Any:
+        """``method(store, *args)`` in a worker thread, so SQLite never blocks the event loop."""
+        return await asyncio.to_thread(lambda: method(self.store, *args))
+
+    def notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        # On Python 3.11, wait_for can swallow a cancel that races with the wakeup;
+        # the flag ends the worker loop even then.
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            job = await self.call(JobStore.claim)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: dict) -> None:
+        try:
+            if job["attempts"] > JOB_MAX_ATTEMPTS:
+                # Only reachable when earlier attempts died with the process and their leases lapsed.
+                raise JobError(f"Gave up after {JOB_MAX_ATTEMPTS} attempts")
+            result = await self.process(job)
+        except asyncio.CancelledError:
+            raise
+        except JobError as error:
+            owned = await self.call(JobStore.fail, job, str(error), False)
+        except Exception as error:
+            owned = await self.call(JobStore.fail, job, f"{type(error).__name__}: {error}", True)
+        else:
+            owned = await self.call(JobStore.complete, job, result)
+        if not owned:
+            return  # another worker took the job over after our lease lapsed; it reports the outcome
+
+        finished = await self.call(JobStore.get, job["id"])
+        if finished and finished["status"] in (DONE, FAILED) and job.get("webhook_url"):
+            status = await deliver_webhook(job["webhook_url"], public_view(finished))
+            await self.call(JobStore.set_webhook_status, job["id"], status)
@@ -0,0 +1,369 @@
+"""Prometheus metrics and optional OpenTelemetry spans for the analysis pipeline.
+
+Each step of an analysis (ingest, cache, phash, prescreen, preprocess, client,
+model, parse, store) runs inside :func:`stage`. The step's duration goes into
+``deepfake_stage_duration_seconds``, labelled with the media kind, a size bucket
+and the outcome. If ``opentelemetry-api`` is installed, each step is also
+wrapped in a span. Exporters are configured with the usual ``OTEL_*`` variables,
+or by running under ``opentelemetry-instrument``.
+
+:class:`MetricsMiddleware` counts requests in flight and their latency per
+route. :func:`render` adds gauges and counters read from the ``stats()`` of the
+executors, caches, pre-screen, admission and resilience layers when scraped.
+Everything is per process, like those stats.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+TRACING_ENABLED = os.environ.get("DEEPFAKE_TRACING", "1").lower() in ("1", "true", "yes")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_SIZE_BUCKETS = ((256 * 1024, "lt256KB"), (1 << 20, "lt1MB"), (4 << 20, "lt4MB"), (16 << 20, "lt16MB"))
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, str], float]
+# (name, kind, help, [(labels, value), ...]) as reported by a collector
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def size_bucket(size: Optional[int]) -> str:
+    if size is None:
+        return "unknown"
+    for limit, name in _SIZE_BUCKETS:
+        if size < limit:
+            return name
+    return "ge16MB"
+
+
+def media_kind(mime_type: Optional[str]) -> str:
+    kind = (mime_type or "").split("/", 1)[0]
+    return kind if kind in ("image", "video") else "other"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        inner = ",".join(f'{key}="{_escape(str(item))}"' for key, item in labels.items())
+        name = f"{name}{{{inner}}}"
+    if value == int(value) and abs(value) < 1e15:
+        return f"{name} {int(value)}"
+    return f"{name} {value:.6g}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        super().__init__(name, help)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [(self.name, dict(key), value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts, sum, count)
+        self._series: Dict[Labels, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, count = self._series.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            self._series[key] = (counts, total + value, count + 1)
+
+    def samples(self) -> List[Sample]:
+        rows: List[Sample] = []
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in series:
+            labels = dict(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                rows.append((f"{self.name}_bucket", {**labels, "le": f"{bound:g}"}, cumulative))
+            rows.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, count))
+            rows.append((f"{self.name}_sum", labels, total))
+            rows.append((f"{self.name}_count", labels, count))
+        return rows
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: List[_Metric] = []
+        self.collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._add(Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._add(Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, buckets))
+
+    def _add(self, metric: Any) -> Any:
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable[[], Iterable[Family]]) -> None:
+        """Register ``fn`` returning :data:`Family` tuples; it is called on every scrape."""
+        self.collectors.append(fn)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}"]
+            lines += [_format(name, labels, value) for name, labels, value in metric.samples()]
+        # Collectors may report the same family (say, once per executor); each is written once.
+        families: Dict[str, Tuple[str, str, List[Tuple[Dict[str, str], float]]]] = {}
+        for collect in self.collectors:
+            try:
+                collected = list(collect())
+            except Exception:
+                continue  # a broken stats source must not take the scrape down
+            for name, kind, help, samples in collected:
+                families.setdefault(name, (kind, help, []))[2].extend(samples)
+        for name, (kind, help, samples) in families.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            lines += [_format(name, labels, value) for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram("deepfake_stage_duration_seconds", "Time spent in each analysis pipeline stage.")
+http_seconds = registry.histogram("deepfake_http_request_duration_seconds", "HTTP request latency by route.")
+http_in_flight = registry.gauge("deepfake_http_requests_in_flight", "HTTP requests being handled.")
+
+_tracer: Any = None
+_tracer_resolved = False
+
+
+def tracer() -> Any:
+    """OpenTelemetry tracer, or ``None`` when tracing is off or the package is missing."""
+    global _tracer, _tracer_resolved
+    if not _tracer_resolved:
+        if TRACING_ENABLED:
+            try:
+                from opentelemetry import trace  # type: ignore
+            except ImportError:
+                pass
+            else:
+                _tracer = trace.get_tracer("deepfake-detector")
+        _tracer_resolved = True
+    return _tracer
+
+
+class StageTimer:
+    """Labels of one stage; ``mime_type`` and ``size`` may be filled in once known."""
+
+    def __init__(self, name: str, mime_type: Optional[str], size: Optional[int]) -> None:
+        self.name = name
+        self.mime_type = mime_type
+        self.size = size
+        self.outcome = "ok"
+
+
+@contextmanager
+def stage(name: str, mime_type: Optional[str] = None, size: Optional[int] = None) -> Iterator[StageTimer]:
+    """Time one pipeline stage (and trace it as a span when OpenTelemetry is available)."""
+    timer = StageTimer(name, mime_type, size)
+    active = tracer()
+    span_context = active.start_as_current_span(f"deepfake.{name}") if active is not None else None
+    span = span_context.__enter__() if span_context is not None else None
+    started = time.perf_counter()
+    error: Optional[BaseException] = None
+    try:
+        yield timer
+    except BaseException as raised:
+        error = raised
+        timer.outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        media, bucket = media_kind(timer.mime_type), size_bucket(timer.size)
+        stage_seconds.observe(elapsed, stage=name, media=media, size=bucket, outcome=timer.outcome)
+        if span_context is not None:
+            span.set_attribute("deepfake.media", media)
+            span.set_attribute("deepfake.size_bucket", bucket)
+            span.set_attribute("deepfake.outcome", timer.outcome)
+            if error is None:
+                span_context.__exit__(None, None, None)
+            else:
+                span_context.__exit__(type(error), error, error.__traceback__)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: in-flight gauge and latency histogram per route template and status."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+
+        async def send_wrapper(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            http_seconds.observe(
+                time.perf_counter() - started, route=route, method=scope["method"], status=str(status["code"])
+            )
+
+
+def _counter_family(name: str, help: str, values: Dict[str, float], label: str) -> Family:
+    return name, "counter", help, [({label: key}, value) for key, value in values.items()]
+
+
+def _pipeline_stats() -> Iterator[Family]:
+    """Families read from the detector package's shared stats when scraped."""
+    from detector.admission import admission
+    from detector.cache import get_verdict_cache
+    from detector.concurrency import model_executor
+    from detector.context_cache import context_caches
+    from detector.phash import loaded_perceptual_index
+    from detector.preprocess import preprocess_executor
+    from detector.prescreen import prescreen_stats
+    from detector.resilience import model_caller
+    from detector.routing import model_router
+
+    for label, executor in (("model", model_executor), ("preprocess", preprocess_executor)):
+        stats = executor.stats()
+        yield "deepfake_executor_in_flight", "gauge", "Calls running on an executor.", [
+            ({"executor": label}, stats["in_flight"])
+        ]
+        yield "deepfake_executor_waiting", "gauge", "Calls waiting for an executor slot.", [
+            ({"executor": label}, stats["waiting"])
+        ]
+        yield "deepfake_executor_rejected_total", "counter", "Calls that timed out waiting for a slot.", [
+            ({"executor": label}, stats["rejected"])
+        ]
+
+    calls = model_caller.stats()
+    yield _counter_family(
+        "deepfake_upstream_errors_total", "Failed Gemini attempts by HTTP status.", calls["errors"], "status"
+    )
+    events = {name: calls[name] for name in ("retries", "fallbacks", "hedges", "hedge_wins", "fail_fast", "failures")}
+    yield _counter_family("deepfake_model_call_events_total", "Retries, fallbacks and hedges.", events, "event")
+    yield "deepfake_circuit_open", "gauge", "1 while a model's circuit breaker is open.", [
+        ({"model": model}, float(info["breaker"] == "open")) for model, info in calls["models"].items()
+    ]
+
+    cache = get_verdict_cache().stats()
+    lookups = {"hit": cache["hits"], "miss": cache["misses"]}
+    yield _counter_family("deepfake_cache_lookups_total", "Verdict cache lookups.", lookups, "result")
+    yield "deepfake_cache_hit_ratio", "gauge", "Verdict cache hit rate.", [({}, cache["hit_rate"])]
+    index = loaded_perceptual_index()  # a scrape must not load the index
+    if index is not None:
+        matches = {"hit": index.hits, "miss": index.misses}
+        yield _counter_family("deepfake_phash_lookups_total", "Near-duplicate index lookups.", matches, "result")
+
+    screened = prescreen_stats()
+    outcomes = {
+        "real": screened["decided_real"],
+        "fake": screened["decided_fake"],
+        "undecided": screened["screened"] - screened["decided_real"] - screened["decided_fake"],
+    }
+    yield _counter_family("deepfake_prescreen_total", "Images run through the local pre-screen.", outcomes, "outcome")
+    yield "deepfake_prescreen_short_circuit_ratio", "gauge", "Share of pre-screened images settled locally.", [
+        ({}, screened["short_circuit_rate"])
+    ]
+
+    contexts = context_caches.stats()
+    calls = {"cached": contexts["cached_calls"], "inline": contexts["inline_calls"]}
+    yield _counter_family("deepfake_context_cache_calls_total", "Model calls by instruction source.", calls, "source")
+    yield "deepfake_context_cached_tokens_total", "counter", "Input tokens served from context caches.", [
+        ({}, contexts["cached_tokens"])
+    ]
+
+    routing = model_router.stats()
+    if routing["enabled"]:
+        tiers = routing["per_tier"]
+        answered = {tier: stats["answered"] for tier, stats in tiers.items()}
+        yield _counter_family("deepfake_routing_answers_total", "Routed analyses by answering tier.", answered, "tier")
+        yield "deepfake_routing_escalations_total", "counter", "Tier answers passed on, by reason.", [
+            ({"tier": tier, "reason": reason}, count)
+            for tier, stats in tiers.items()
+            for reason, count in stats["escalated"].items()
+        ]
+
+    limits = admission.stats()
+    yield "deepfake_admitted_total", "counter", "Requests let through admission control.", [({}, limits["admitted"])]
+    yield _counter_family("deepfake_rejected_total", "Requests refused by admission control.", limits["rejected"], "scope")
+    yield "deepfake_tokens_total", "counter", "Gemini tokens recorded from replies.", [({}, limits["tokens_recorded"])]
+
+
+registry.collector(_pipeline_stats)
+
+
+def client_pool_collector(pool: Any) -> Callable[[], Iterator[Family]]:
+    """Collector for a backend's :class:`detector.clients.ClientPool`."""
+
+    def collect() -> Iterator[Family]:
+        stats = pool.stats()
+        yield "deepfake_clients", "gauge", "Pooled Gemini clients.", [
+            ({"state": "pooled"}, stats["clients"]),
+            ({"state": "in_use"}, stats["in_use"]),
+        ]
+        created = {"created": stats["created"], "reused": stats["reused"]}
+        yield _counter_family("deepfake_client_leases_total", "Client leases by outcome.", created, "outcome")
+
+    return collect
+
+
+def render() -> str:
+    """The Prometheus text exposition of every registered metric."""
+    return registry.render()
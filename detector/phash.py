@@ -0,0 +1,430 @@
+"""Perceptual-hash index so re-encoded, resized or lightly cropped copies reuse a known verdict.
+
+Images are hashed with a 64-bit pHash (or dHash); videos are hashed per sampled
+keyframe. Lookups use multi-index hashing: each hash is split into ``CHUNKS``
+16-bit chunks and, by the pigeonhole principle, any hash within ``max_distance``
+bits shares at least one chunk within ``max_distance // CHUNKS`` bits. Only those
+few buckets are scanned, which keeps lookups under a millisecond at a
+million stored hashes for the default distance.
+
+Items are stored in SQLite (``DEEPFAKE_PHASH_PATH``), one row each with its
+packed hashes and a compact verdict: what the lookup needs, not the report.
+Each row records when it was stored and the prompt version it answered; like
+the verdict cache, a match older than ``DEEPFAKE_CACHE_TTL`` or from another
+prompt version is ignored, and such rows are deleted when the index is
+compacted (on load, and whenever it passes ``DEEPFAKE_PHASH_MAX_HASHES``).
+"""
+
+import json
+import math
+import os
+import sqlite3
+import struct
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from detector.cache import CACHE_TTL
+
+PHASH_ENABLED = os.environ.get("DEEPFAKE_PHASH_ENABLED", "1").lower() not in ("0", "false", "no")
+PHASH_ALGORITHM = os.environ.get("DEEPFAKE_PHASH_ALGORITHM", "phash").lower()
+PHASH_MAX_DISTANCE = int(os.environ.get("DEEPFAKE_PHASH_MAX_DISTANCE", "6"))
+PHASH_PATH = os.environ.get("DEEPFAKE_PHASH_PATH", "/tmp/deepfake_phash.sqlite3")
+PHASH_MAX_HASHES = int(os.environ.get("DEEPFAKE_PHASH_MAX_HASHES", "1000000"))
+PHASH_VIDEO_FRAMES = int(os.environ.get("DEEPFAKE_PHASH_VIDEO_FRAMES", "8"))
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+_HASH = struct.Struct("<Q")
+_REFRESH_INTERVAL = 1.0  # seconds between looks for items other processes added
+
+_DCT_SIZE = 32
+_DCT_KEEP = 8
+_dct_matrix: Optional[List[List[float]]] = None
+
+
+def _dct_rows() -> List[List[float]]:
+    global _dct_matrix
+    if _dct_matrix is None:
+        n = _DCT_SIZE
+        _dct_matrix = [
+            [math.cos(math.pi * (2 * x + 1) * u / (2 * n)) for x in range(n)] for u in range(_DCT_KEEP)
+        ]
+    return _dct_matrix
+
+
+def _bits_to_int(bits: Iterable[bool]) -> int:
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def dhash(image: Any) -> int:
+    """64-bit difference hash of a PIL image."""
+    from PIL import Image
+
+    pixels = list(image.convert("L").resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    return _bits_to_int(pixels[row * 9 + col] > pixels[row * 9 + col + 1] for row in range(8) for col in range(8))
+
+
+def phash(image: Any) -> int:
+    """64-bit DCT hash of a PIL image (low 8x8 frequencies of a 32x32 greyscale DCT)."""
+    from PIL import Image
+
+    n = _DCT_SIZE
+    pixels = list(image.convert("L").resize((n, n), Image.Resampling.LANCZOS).getdata())
+    rows = [pixels[y * n:(y + 1) * n] for y in range(n)]
+    dct = _dct_rows()
+    # Separable DCT restricted to the 8 lowest frequencies: D = C * P * C^T.
+    partial = [[sum(c[x] * rows[y][x] for x in range(n)) for c in dct] for y in range(n)]
+    coefficients = [sum(dct[u][y] * partial[y][v] for y in range(n)) for u in range(_DCT_KEEP) for v in range(_DCT_KEEP)]
+    median = sorted(coefficients[1:])[len(coefficients[1:]) // 2]
+    return _bits_to_int(value > median for value in coefficients)
+
+
+def hash_image(image: Any, algorithm: str = PHASH_ALGORITHM) -> int:
+    return dhash(image) if algorithm == "dhash" else phash(image)
+
+
+def video_keyframes(source: Any, max_frames: int = PHASH_VIDEO_FRAMES) -> List[Any]:
+    """Evenly sampled keyframes as PIL images; empty if PyAV is not installed or decoding fails."""
+    try:
+        import av  # type: ignore
+    except ImportError:
+        return []
+    from detector.preprocess import media_file
+
+    frames: List[Any] = []
+    try:
+        with av.open(media_file(source)) as container:
+            stream = container.streams.video[0]
+            stream.codec_context.skip_frame = "NONKEY"
+            for frame in container.decode(stream):
+                frames.append(frame.to_image())
+                if len(frames) >= max_frames * 8:
+                    break
+    except Exception:
+        return []
+    if len(frames) <= max_frames:
+        return frames
+    step = len(frames) / max_frames
+    return [frames[int(i * step)] for i in range(max_frames)]
+
+
+def media_hashes(source: Any, mime_type: str, algorithm: str = PHASH_ALGORITHM) -> List[int]:
+    """Perceptual hashes for an upload (bytes or a seekable file).
+
+    One hash for an image, one per sampled keyframe for a video.
+    """
+    if mime_type.startswith("video/"):
+        return [hash_image(frame, algorithm) for frame in video_keyframes(source)]
+    try:
+        from PIL import Image
+
+        from detector.preprocess import media_file
+
+        with Image.open(media_file(source)) as image:
+            return [hash_image(image, algorithm)]
+    except Exception:
+        return []
+
+
+def _neighbours(value: int, radius: int) -> Iterable[int]:
+    yield value
+    if radius >= 1:
+        for i in range(CHUNK_BITS):
+            flipped = value ^ (1 << i)
+            yield flipped
+            if radius >= 2:
+                for j in range(i + 1, CHUNK_BITS):
+                    yield flipped ^ (1 << j)
+
+
+class PerceptualIndex:
+    """Multi-index hash table mapping 64-bit perceptual hashes to stored verdicts.
+
+    With a ``path`` the items live in SQLite, one row per item holding its hashes
+    and verdict, so every process sharing the file sees the same item ids. Rows
+    added by other processes are picked up at most ``_REFRESH_INTERVAL`` seconds
+    later. Expired items, items hashed with another algorithm and (once known)
+    items from another prompt version are deleted on load, and whenever the
+    index grows past ``max_hashes`` the oldest items go too.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = PHASH_PATH,
+        max_distance: int = PHASH_MAX_DISTANCE,
+        algorithm: str = PHASH_ALGORITHM,
+        ttl: float = CACHE_TTL,
+        max_hashes: int = PHASH_MAX_HASHES,
+    ) -> None:
+        if max_distance // CHUNKS > 2:
+            raise ValueError(f"max_distance must be below {3 * CHUNKS}")
+        self.path = path
+        self.max_distance = max_distance
+        self.algorithm = algorithm
+        self.ttl = ttl
+        self.max_hashes = max_hashes
+        self.hits = 0
+        self.misses = 0
+        self.compactions = 0
+        self._version: Optional[str] = None  # prompt version of the latest item added here
+        self._refreshed_at = 0.0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._reset_memory()
+        if path:
+            self._open()
+            self.compact()
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def _reset_memory(self) -> None:
+        self.hashes = array("Q")
+        self.owners = array("Q")
+        self.verdicts: Dict[int, dict] = {}
+        self._buckets: List[Dict[int, array]] = [{} for _ in range(CHUNKS)]
+        self._last_id = 0
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # AUTOINCREMENT: ids of deleted items are never handed out again, so no process can
+        # confuse a new item with one it still holds in memory.
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY AUTOINCREMENT, algorithm TEXT NOT NULL, "
+            "scope TEXT, version TEXT, stored_at REAL NOT NULL, hashes BLOB NOT NULL, verdict TEXT NOT NULL)"
+        )
+
+    def _insert(self, value: int, owner: int) -> None:
+        position = len(self.hashes)
+        self.hashes.append(value)
+        self.owners.append(owner)
+        for chunk in range(CHUNKS):
+            key = (value >> (chunk * CHUNK_BITS)) & CHUNK_MASK
+            bucket = self._buckets[chunk].get(key)
+            if bucket is None:
+                bucket = self._buckets[chunk][key] = array("I")
+            bucket.append(position)
+
+    def _load_rows(self, rows: Iterable[Tuple[int, Optional[str], Optional[str], float, bytes, str]]) -> None:
+        for item_id, scope, version, stored_at, blob, text in rows:
+            self._last_id = max(self._last_id, item_id)
+            try:
+                verdict = json.loads(text)
+            except ValueError:
+                continue  # a damaged row only loses its own item
+            verdict.update(scope=scope, version=version, stored_at=stored_at)
+            self.verdicts[item_id] = verdict
+            usable = len(blob) - len(blob) % _HASH.size
+            for (value,) in _HASH.iter_unpack(blob[:usable]):
+                self._insert(value, item_id)
+
+    def _refresh(self, force: bool = False) -> None:
+        """Load the items other processes added since the last look."""
+        if self._conn is None:
+            return
+        clock = time.monotonic()
+        if not force and clock - self._refreshed_at < _REFRESH_INTERVAL:
+            return
+        self._refreshed_at = clock
+        rows = self._conn.execute(
+            "SELECT id, scope, version, stored_at, hashes, verdict FROM items WHERE id > ? AND algorithm = ? "
+            "ORDER BY id",
+            (self._last_id, self.algorithm),
+        ).fetchall()
+        self._load_rows(rows)
+
+    def add(self, hashes: List[int], verdict: dict) -> None:
+        """Store ``verdict`` under every hash in ``hashes`` (one per image or keyframe), stamped with the time.
+
+        ``scope`` and ``version`` in ``verdict`` are stored as columns; the rest
+        should be only what a lookup needs, not the whole report.
+        """
+        if not hashes:
+            return
+        verdict = dict(verdict)
+        scope, version = verdict.pop("scope", None), verdict.pop("version", None)
+        stored_at = verdict.pop("stored_at", None) or time.time()
+        blob = b"".join(_HASH.pack(value) for value in hashes)
+        text = json.dumps(verdict)
+        with self._lock:
+            self._version = version or self._version
+            if self._conn is None:
+                item_id = self._last_id + 1
+            else:
+                # Under the write lock no other process can add an item between our catch-up
+                # and our insert, so every id below ours is already loaded.
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._refresh(force=True)
+                    item_id = self._conn.execute(
+                        "INSERT INTO items (algorithm, scope, version, stored_at, hashes, verdict) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (self.algorithm, scope, version, stored_at, blob, text),
+                    ).lastrowid
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            self._load_rows([(item_id, scope, version, stored_at, blob, text)])
+            if self.max_hashes and len(self.hashes) > self.max_hashes:
+                self.compact()
+
+    def compact(self) -> None:
+        """Drop expired items, other prompt versions' items and, past ``max_hashes``, the oldest ones.
+
+        Deletes them from the file too, then rebuilds the in-memory tables.
+        """
+        with self._lock:
+            self._refresh(force=True)
+            now = time.time()
+            keep = {
+                owner for owner, verdict in self.verdicts.items() if self._usable(verdict, None, self._version, now)
+            }
+            cutoff = 0
+            counts = Counter(owner for owner in self.owners if owner in keep)
+            if self.max_hashes and sum(counts.values()) > self.max_hashes:
+                # Keep the newest items up to three quarters of the cap, so compaction stays rare.
+                budget = self.max_hashes * 3 // 4
+                for owner in sorted(counts, reverse=True):
+                    budget -= counts[owner]
+                    if budget < 0:
+                        cutoff = owner
+                        break
+            live = [
+                (value, owner) for value, owner in zip(self.hashes, self.owners) if owner in keep and owner > cutoff
+            ]
+            verdicts = {owner: self.verdicts[owner] for owner in keep if owner > cutoff}
+            removed = len(self.verdicts) - len(verdicts)
+            last_id = self._last_id
+            if self._conn is not None:
+                self._conn.execute(
+                    "DELETE FROM items WHERE algorithm != ? OR stored_at < ? OR (? IS NOT NULL AND version IS NOT ?) "
+                    "OR id <= ?",
+                    (self.algorithm, now - self.ttl, self._version, self._version, cutoff),
+                )
+            self._reset_memory()
+            self._last_id = last_id
+            self.verdicts = verdicts
+            for value, owner in live:
+                self._insert(value, owner)
+            if removed:
+                self.compactions += 1
+
+    def _usable(self, verdict: dict, scope: Optional[str], version: Optional[str], now: float) -> bool:
+        if scope is not None and verdict.get("scope") != scope:
+            return False
+        if version is not None and verdict.get("version") != version:
+            return False
+        # Entries written before timestamps were recorded count as expired
+        return now - verdict.get("stored_at", 0.0) <= self.ttl
+
+    def nearest(
+        self, value: int, scope: Optional[str] = None, version: Optional[str] = None
+    ) -> Optional[Tuple[int, int]]:
+        """Closest live stored ``(verdict_id, distance)`` within ``max_distance`` of ``value``."""
+        now = time.time()
+        radius = self.max_distance // CHUNKS
+        limit = self.max_distance
+        hashes = self.hashes
+        best_position = -1
+        for chunk in range(CHUNKS):
+            buckets = self._buckets[chunk]
+            key = (value >> (chunk * CHUNK_BITS)) & CHUNK_MASK
+            for probe in _neighbours(key, radius):
+                bucket = buckets.get(probe)
+                if bucket is None:
+                    continue
+                for position in bucket:
+                    distance = (hashes[position] ^ value).bit_count()
+                    if distance > limit:
+                        continue
+                    if not self._usable(self.verdicts[self.owners[position]], scope, version, now):
+                        continue
+                    best_position, limit = position, distance - 1
+                    if distance == 0:
+                        return self.owners[position], 0
+        if best_position < 0:
+            return None
+        return self.owners[best_position], limit + 1
+
+    def lookup(
+        self, hashes: List[int], scope: Optional[str] = None, version: Optional[str] = None
+    ) -> Optional[Tuple[dict, float]]:
+        """Stored verdict and similarity (0-1) for a near-duplicate, if any.
+
+        Only verdicts stored within ``ttl`` seconds, under ``scope`` and prompt
+        ``version`` (when given), are considered.
+
+        For videos at least half of the sampled keyframes must land on the same stored
+        item; the similarity is averaged over those matching frames.
+        """
+        if not hashes:
+            return None
+        with self._lock:
+            self._refresh()
+            votes: Dict[int, List[int]] = {}
+            for value in hashes:
+                match = self.nearest(value, scope, version)
+                if match is not None:
+                    votes.setdefault(match[0], []).append(match[1])
+            if not votes:
+                self.misses += 1
+                return None
+            owner, distances = max(votes.items(), key=lambda item: (len(item[1]), -sum(item[1])))
+            if len(distances) * 2 < len(hashes):
+                self.misses += 1
+                return None
+            self.hits += 1
+            similarity = 1.0 - (sum(distances) / len(distances)) / HASH_BITS
+            return self.verdicts[owner], round(similarity, 4)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hashes": len(self.hashes),
+                "items": len(self.verdicts),
+                "hits": self.hits,
+                "misses": self.misses,
+                "max_distance": self.max_distance,
+                "algorithm": self.algorithm,
+                "ttl": self.ttl,
+                "max_hashes": self.max_hashes,
+                "compactions": self.compactions,
+                "persistent": self._conn is not None,
+            }
+
+
+_index: Optional[PerceptualIndex] = None
+_index_lock = threading.Lock()
+
+
+def loaded_perceptual_index() -> Optional[PerceptualIndex]:
+    """The process-wide index if something already loaded it; never opens or reads the index file."""
+    return _index
+
+
+def get_perceptual_index() -> Optional[PerceptualIndex]:
+    """Process-wide index, or ``None`` when disabled or the index file is unusable."""
+    global _index
+    if not PHASH_ENABLED:
+        return None
+    with _index_lock:
+        if _index is None:
+            try:
+                _index = PerceptualIndex()
+            except (OSError, sqlite3.Error):
+                _index = PerceptualIndex(path=None)
+        return _index
@@ -0,0 +1,216 @@
+"""Downscale and re-encode images before they are sent to Gemini.
+
+Phone photos of 12MP and more cost upload bandwidth and image tokens without
+helping the model, which tiles images at 768px anyway. Images whose long side
+exceeds ``MAX_IMAGE_SIDE`` (or that are simply heavy) are decoded at reduced
+scale where the codec allows it (JPEG draft mode), resized, rotated upright and
+re-encoded without EXIF/XMP/ICC blocks. The forensically useful metadata
+(camera, software, timestamps, generator text chunks) is kept in a side channel
+and appended to the prompt instead. Photos with faces go as face crops and a
+small overview instead of one downscaled frame (see :mod:`detector.regions`).
+
+Pillow releases the GIL while decoding, resampling and encoding, so the work
+runs on a small dedicated thread pool rather than on the event loop.
+"""
+
+import io
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from detector.concurrency import QUEUE_TIMEOUT, ModelExecutor
+
+PREPROCESS_ENABLED = os.environ.get("DEEPFAKE_PREPROCESS", "1").lower() not in ("0", "false", "no")
+MAX_IMAGE_SIDE = int(os.environ.get("DEEPFAKE_MAX_IMAGE_SIDE", "1536"))
+IMAGE_FORMAT = os.environ.get("DEEPFAKE_IMAGE_FORMAT", "jpeg").lower()
+IMAGE_QUALITY = int(os.environ.get("DEEPFAKE_IMAGE_QUALITY", "90"))
+# Images already within MAX_IMAGE_SIDE and below this size are sent untouched.
+PREPROCESS_MIN_BYTES = int(float(os.environ.get("DEEPFAKE_PREPROCESS_MIN_KB", "512")) * 1024)
+PREPROCESS_WORKERS = int(os.environ.get("DEEPFAKE_PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Gemini's limit for media sent inline with the request; larger files go through the Files API.
+INLINE_MAX_BYTES = 20 * 1024 * 1024
+
+_FORMATS = {"jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+# Text chunks written by image generators and editors (e.g. Stable Diffusion web UIs, ComfyUI).
+_TEXT_KEYS = ("parameters", "prompt", "workflow", "Software", "Comment", "Description", "Author")
+_TEXT_LIMIT = 300
+
+
+def media_file(source: Any) -> Any:
+    """``source`` as a seekable binary file at offset 0: bytes are wrapped, files rewound."""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def media_size(source: Any) -> int:
+    """Length of bytes or of a seekable file, leaving its position alone."""
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    position = source.tell()
+    size = source.seek(0, io.SEEK_END)
+    source.seek(position)
+    return size
+
+
+class PreparedMedia:
+    """Payload to send to the model plus the metadata recovered from the original.
+
+    Untouched media may be passed as a seekable file: it is read only when it is
+    sent inline (:attr:`data`), never when it goes through the Files API.
+    """
+
+    def __init__(
+        self,
+        data: Any,
+        mime_type: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        original_bytes: int = 0,
+        original_dimensions: Optional[Tuple[int, int]] = None,
+        transformed: bool = False,
+    ) -> None:
+        self._data = data
+        self.mime_type = mime_type
+        self.metadata = metadata or {}
+        self.original_bytes = original_bytes or media_size(data)
+        self.original_dimensions = original_dimensions
+        self.transformed = transformed
+        self.stats: Optional[Dict[str, Any]] = None
+        # Face crops sent in place of the whole picture (see detector.regions)
+        self.regions: Optional[Dict[str, Any]] = None
+
+    @property
+    def data(self) -> bytes:
+        """The payload, read from an untouched file here, up to :data:`INLINE_MAX_BYTES`."""
+        if not isinstance(self._data, (bytes, bytearray)):
+            data = media_file(self._data).read(INLINE_MAX_BYTES + 1)
+            if len(data) > INLINE_MAX_BYTES:
+                raise ValueError(f"Media too large to send inline (max {INLINE_MAX_BYTES / (1024 * 1024):g}MB)")
+            self._data = data
+        return self._data
+
+    @property
+    def payload_bytes(self) -> int:
+        return len(self._data) if isinstance(self._data, (bytes, bytearray)) else self.original_bytes
+
+    def parts(self) -> List[Any]:
+        """Content parts for ``generate_content``; the prompt goes after them."""
+        from google.genai import types  # type: ignore
+
+        return [types.Part.from_bytes(data=self.data, mime_type=self.mime_type)]
+
+    def prompt_note(self) -> str:
+        """Text appended to the prompt so the model still sees what preprocessing removed."""
+        lines = []
+        if self.transformed and self.original_dimensions:
+            width, height = self.original_dimensions
+            lines.append(
+                f"The image was downscaled from {width}x{height} and re-encoded for transport; "
+                "uniform compression artifacts come from that step, not from manipulation."
+            )
+        if self.metadata:
+            lines.append("Metadata recovered from the original file:")
+            lines.extend(f"- {key}: {value}" for key, value in self.metadata.items())
+        return "\n\n" + "\n".join(lines) if lines else ""
+
+
+def extract_metadata(image: Any) -> Dict[str, Any]:
+    """Forensically relevant EXIF fields and generator text chunks of a PIL image."""
+    from PIL import ExifTags
+
+    metadata: Dict[str, Any] = {}
+    exif = image.getexif()
+    for tag in (ExifTags.Base.Make, ExifTags.Base.Model, ExifTags.Base.Software, ExifTags.Base.DateTime):
+        if exif.get(tag):
+            metadata[tag.name] = str(exif[tag]).strip("\x00 ")
+    details = exif.get_ifd(ExifTags.IFD.Exif)
+    for tag in (ExifTags.Base.DateTimeOriginal, ExifTags.Base.LensModel):
+        if details.get(tag):
+            metadata[tag.name] = str(details[tag]).strip("\x00 ")
+    if exif.get_ifd(ExifTags.IFD.GPSInfo):
+        # Record that location data existed without passing coordinates on.
+        metadata["GPS"] = "present"
+    for key in _TEXT_KEYS:
+        value = image.info.get(key)
+        if isinstance(value, str) and value.strip() and key not in metadata:
+            metadata[key] = value.strip()[:_TEXT_LIMIT]
+    return metadata
+
+
+def prepare_image(
+    source: Any,
+    mime_type: str,
+    max_side: int = MAX_IMAGE_SIDE,
+    quality: int = IMAGE_QUALITY,
+    image_format: str = IMAGE_FORMAT,
+    min_bytes: int = PREPROCESS_MIN_BYTES,
+    face_crops: bool = False,
+) -> PreparedMedia:
+    """Downscale/re-encode ``source`` (bytes or a seekable file) when it pays off; otherwise return it unchanged.
+
+    With ``face_crops``, an image that would be downscaled and has faces is sent
+    as face crops instead (:func:`detector.regions.crop_faces`).
+    """
+    from PIL import Image, ImageOps
+
+    save_format, output_type = _FORMATS.get(image_format, _FORMATS["jpeg"])
+    size = media_size(source)
+    try:
+        with Image.open(media_file(source)) as image:
+            metadata = extract_metadata(image)
+            dimensions = image.size
+            if max(dimensions) <= max_side and size <= min_bytes:
+                return PreparedMedia(source, mime_type, metadata, size, dimensions)
+            if face_crops and max(dimensions) > max_side:
+                from detector.regions import crop_faces
+
+                # Without a face, the downscale below reuses this full-size decode.
+                regions = crop_faces(image, size, metadata)
+                if regions is not None:
+                    return regions
+
+            # A reducing gap of 1 lets JPEG draft mode decode large photos at 1/2-1/8 scale.
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS, reducing_gap=1.0)
+            upright = ImageOps.exif_transpose(image)
+            keep_alpha = save_format == "WEBP" and upright.has_transparency_data
+            if keep_alpha or upright.mode not in ("RGB", "L"):
+                upright = upright.convert("RGBA" if keep_alpha else "RGB")
+            buffer = io.BytesIO()
+            upright.save(buffer, save_format, quality=quality)
+    except Exception:
+        # Let the model see the original bytes rather than failing on an exotic file.
+        return PreparedMedia(source, mime_type, original_bytes=size)
+
+    encoded = buffer.getvalue()
+    if len(encoded) >= size and max(dimensions) <= max_side:
+        return PreparedMedia(source, mime_type, metadata, size, dimensions)
+    return PreparedMedia(encoded, output_type, metadata, size, dimensions, transformed=True)
+
+
+preprocess_executor = ModelExecutor(
+    workers=PREPROCESS_WORKERS,
+    max_concurrent=PREPROCESS_WORKERS,
+    queue_timeout=QUEUE_TIMEOUT,
+)
+
+
+def prepare(source: Any, mime_type: str) -> PreparedMedia:
+    """Crop faces from or resize images, or sample video keyframes, blocking; anything else passes through.
+
+    ``source`` is bytes or a seekable binary file.
+    """
+    if PREPROCESS_ENABLED and mime_type.startswith("image/"):
+        from detector.regions import FACE_CROPS
+
+        return prepare_image(source, mime_type, face_crops=FACE_CROPS)
+    if mime_type.startswith("video/"):
+        from detector.video import VIDEO_SAMPLING, av_available, prepare_video
+
+        if VIDEO_SAMPLING and av_available():
+            return prepare_video(source, mime_type)
+    return PreparedMedia(source, mime_type)
+
+
+async def prepare_media(source: Any, mime_type: str) -> PreparedMedia:
+    """:func:`prepare` on the worker pool."""
+    return await preprocess_executor.run(prepare, source, mime_type)
@@ -0,0 +1,313 @@
+"""CPU-only pre-screen that settles obvious images locally before Gemini is called.
+
+Cheap signals are checked first:
+
+* provenance: an IPTC ``DigitalSourceType`` in the XMP packet declaring
+  AI-generated media, and generator names as whole words in the fields that
+  name the producing software (EXIF ``Software``, XMP ``CreatorTool`` and
+  ``softwareAgent``, the PNG ``Software`` chunk), or Stable Diffusion
+  ``parameters`` / ComfyUI ``workflow`` PNG chunks. These settle the image as
+  FAKE. A source type found elsewhere in the file (e.g. a C2PA manifest, or any
+  text that happens to contain it) is only recorded and the model decides;
+* camera origin: EXIF make, model and capture time, no editing software, and
+  JPEG quantization tables that are not the standard IJG tables every library
+  writes (a camera original keeps its maker's tables; a re-save loses them).
+
+Only an image that already looks like a camera original pays for the pixel
+checks: error level analysis (re-save at a fixed quality and measure how uneven
+the per-block error is; pasted regions stand out) and noise-residual statistics
+(high-pass residual level, which is near zero for many rendered images).
+
+Camera-origin evidence can be forged by copying EXIF and quantization tables
+onto a fake, so a local REAL verdict is off unless ``DEEPFAKE_PRESCREEN_REAL``
+is set; otherwise the evidence is kept in the screening's signals and reasons
+and the model decides. A verdict is returned when its confidence reaches
+``PRESCREEN_THRESHOLD``; everything else is escalated to the model. Uses Pillow
+only, so it fits the serverless bundle.
+"""
+
+import io
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+PRESCREEN_ENABLED = os.environ.get("DEEPFAKE_PRESCREEN", "1").lower() not in ("0", "false", "no")
+PRESCREEN_THRESHOLD = float(os.environ.get("DEEPFAKE_PRESCREEN_THRESHOLD", "0.9"))
+PRESCREEN_REAL = os.environ.get("DEEPFAKE_PRESCREEN_REAL", "0").lower() in ("1", "true", "yes")
+
+GENERATOR_SIGNATURES = (
+    "stable diffusion",
+    "stable-diffusion",
+    "automatic1111",
+    "comfyui",
+    "invokeai",
+    "novelai",
+    "midjourney",
+    "dall-e",
+    "dall·e",
+    "adobe firefly",
+    "google imagen",
+    "leonardo.ai",
+    "ideogram",
+    "flux.1",
+)
+AI_SOURCE_TYPES = (b"trainedAlgorithmicMedia", b"compositeWithTrainedAlgorithmicMedia")
+_SIGNATURE = re.compile(
+    r"(?<![\w.])(" + "|".join(re.escape(name) for name in GENERATOR_SIGNATURES) + r")(?![\w])", re.IGNORECASE
+)
+_XMP_PACKET = re.compile(rb"<x:xmpmeta\b.*?</x:xmpmeta>", re.DOTALL)
+_XMP_SOURCE_TYPE = re.compile(
+    rb"DigitalSourceType\b[^<]{0,200}?digitalsourcetype/(" + b"|".join(AI_SOURCE_TYPES) + rb")\b"
+)
+_XMP_TOOL = re.compile(rb"(?:CreatorTool|softwareAgent)(?:=\"|>)([^\"<]{1,200})")
+EDITING_SOFTWARE = (
+    "photoshop", "gimp", "affinity", "pixelmator", "snapseed", "facetune", "faceapp",
+    "picsart", "lightroom", "canva", "python", "pillow", "imagemagick",
+)
+_SCAN_BYTES = 256 * 1024
+_PIXEL_CROP = 1536
+_ELA_QUALITY = 90
+_ELA_BLOCK = 16
+# Above this ratio some blocks carry a different compression history (pasted or retouched regions).
+_ELA_MAX_RATIO = 4.0
+_NOISE_RANGE = (0.6, 12.0)
+
+_IJG_LUMINANCE = (
+    16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99,
+)
+
+
+class Screening:
+    """Outcome of the pre-screen: a local verdict (or ``None`` to escalate) plus the evidence."""
+
+    def __init__(self, verdict: Optional[str], confidence: float, signals: Dict[str, Any], reasons: List[str]) -> None:
+        self.verdict = verdict
+        self.confidence = confidence
+        self.signals = signals
+        self.reasons = reasons
+
+    @property
+    def decided(self) -> bool:
+        return self.verdict is not None
+
+    def analysis(self) -> str:
+        lines = [f"VERDICT: {self.verdict}", f"CONFIDENCE: {self.confidence:.0%}", "Local pre-screen evidence:"]
+        lines.extend(f"- {reason}" for reason in self.reasons)
+        return "\n".join(lines)
+
+
+def ijg_quality(table: List[int]) -> Optional[int]:
+    """Quality whose standard IJG luminance table equals ``table``, or ``None`` for custom tables."""
+    if len(table) != 64:
+        return None
+    for quality in range(1, 101):
+        scale = 5000 // quality if quality < 50 else 200 - quality * 2
+        if all(max(1, min(255, (base * scale + 50) // 100)) == value for base, value in zip(_IJG_LUMINANCE, table)):
+            return quality
+    return None
+
+
+def _xmp(head: bytes, image: Any) -> bytes:
+    """The XMP packet, as Pillow exposes it or found in the head of the file."""
+    xmp = image.info.get("xmp") or image.info.get("XML:com.adobe.xmp")
+    if xmp:
+        return xmp.encode("utf-8", "replace") if isinstance(xmp, str) else xmp
+    match = _XMP_PACKET.search(head)
+    return match.group(0) if match else b""
+
+
+def _provenance(head: bytes, image: Any) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """(AI source type declared in the XMP, generator signature, AI source type found elsewhere) in the file.
+
+    ``head`` is the first :data:`_SCAN_BYTES` of the file.
+    """
+    xmp = _xmp(head, image)
+    declared = _XMP_SOURCE_TYPE.search(xmp)
+    source_type = declared.group(1).decode() if declared else None
+    elsewhere = None if source_type else next((value.decode() for value in AI_SOURCE_TYPES if value in head), None)
+
+    fields = [str(image.getexif().get(0x0131, ""))]  # EXIF Software
+    fields.extend(tool.decode("utf-8", "replace") for tool in _XMP_TOOL.findall(xmp))
+    if image.format == "PNG":
+        fields.append(str(image.info.get("Software", "")))
+    signature = next((match.group(1).lower() for match in map(_SIGNATURE.search, fields) if match), None)
+    if signature is None and image.format == "PNG" and ("parameters" in image.info or "workflow" in image.info):
+        signature = "diffusion parameters text chunk"
+    return source_type, signature, elsewhere
+
+
+def _pixel_crop(image: Any) -> Any:
+    # Centre crop aligned to the 8px JPEG grid, so ELA compares like with like.
+    width, height = image.size
+    crop_w, crop_h = min(width, _PIXEL_CROP) // 8 * 8, min(height, _PIXEL_CROP) // 8 * 8
+    left, top = (width - crop_w) // 2 // 8 * 8, (height - crop_h) // 2 // 8 * 8
+    return image.crop((left, top, left + crop_w, top + crop_h)).convert("RGB")
+
+
+def _percentile(histogram: List[int], fraction: float) -> int:
+    target = sum(histogram) * fraction
+    running = 0
+    for value, count in enumerate(histogram):
+        running += count
+        if running >= target:
+            return value
+    return len(histogram) - 1
+
+
+def error_level_ratio(image: Any) -> float:
+    """How uneven the per-block error is after a re-save; high means mixed compression history.
+
+    Both tails count: retouched blocks tend to show more error than the rest, blocks
+    pasted from a heavier-compressed source far less.
+    """
+    from PIL import Image, ImageChops
+
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=_ELA_QUALITY)
+    resaved = Image.open(io.BytesIO(buffer.getvalue()))
+    # Amplify before averaging so small per-pixel errors survive the 8-bit block means.
+    difference = ImageChops.difference(image, resaved).convert("L").point(lambda value: min(255, value * 16))
+    grid = (max(1, image.width // _ELA_BLOCK), max(1, image.height // _ELA_BLOCK))
+    blocks = difference.resize(grid, Image.Resampling.BOX)
+    histogram = blocks.histogram()
+    median = max(1, _percentile(histogram, 0.5))
+    return max(_percentile(histogram, 0.99) / median, median / max(1, _percentile(histogram, 0.01)))
+
+
+def noise_level(image: Any) -> float:
+    """Standard deviation of the greyscale high-pass residual (image minus its 3x3 median)."""
+    from PIL import ImageChops, ImageFilter, ImageStat
+
+    grey = image.convert("L")
+    residual = ImageChops.difference(grey, grey.filter(ImageFilter.MedianFilter(3)))
+    return ImageStat.Stat(residual).stddev[0]
+
+
+def prescreen_image(source: Any, threshold: float = PRESCREEN_THRESHOLD, real: bool = PRESCREEN_REAL) -> Screening:
+    """Decide obvious cases locally; ``verdict`` is ``None`` when the model should look.
+
+    Without ``real`` a camera original is reported with the confidence of its
+    metadata alone and escalated; the pixel checks are skipped. ``source`` is
+    bytes or a seekable file; only its head is read besides what Pillow decodes.
+    """
+    from PIL import ExifTags, Image
+
+    from detector.preprocess import media_file
+
+    try:
+        source = media_file(source)
+        head = source.read(_SCAN_BYTES)
+        image = Image.open(media_file(source))
+    except Exception:
+        return Screening(None, 0.0, {"error": "unreadable image"}, [])
+
+    with image:
+        signals: Dict[str, Any] = {"format": image.format}
+        source_type, signature, elsewhere = _provenance(head, image)
+        signals["ai_source_type"] = source_type
+        signals["generator"] = signature
+        signals["ai_source_type_elsewhere"] = elsewhere
+        if source_type:
+            reason = f"Embedded XMP declares the image as {source_type} (IPTC DigitalSourceType)"
+            return Screening("FAKE", 0.98, signals, [reason])
+        if signature:
+            return Screening("FAKE", 0.95, signals, [f"Generator signature in the file metadata: {signature}"])
+
+        exif = image.getexif()
+        details = exif.get_ifd(ExifTags.IFD.Exif)
+        software = str(exif.get(ExifTags.Base.Software, "")).lower()
+        signals["camera"] = " ".join(
+            str(exif.get(tag, "")).strip("\x00 ") for tag in (ExifTags.Base.Make, ExifTags.Base.Model)
+        ).strip() or None
+        signals["captured"] = bool(details.get(ExifTags.Base.DateTimeOriginal))
+        signals["editing_software"] = next((name for name in EDITING_SOFTWARE if name in software), None)
+        tables = getattr(image, "quantization", None) or {}
+        signals["ijg_quality"] = ijg_quality(list(tables[0])) if 0 in tables else None
+        camera_original = (
+            image.format == "JPEG"
+            and bool(tables)
+            and signals["ijg_quality"] is None
+            and signals["camera"] is not None
+            and signals["captured"]
+            and signals["editing_software"] is None
+        )
+        if not camera_original:
+            reasons = [f"{elsewhere} appears in the file outside the XMP packet"] if elsewhere else []
+            return Screening(None, 0.0, signals, reasons)
+
+        reasons = [
+            f"Camera EXIF ({signals['camera']}) with a capture timestamp and no editing software",
+            "Non-standard JPEG quantization tables, as written by camera firmware rather than a re-save",
+        ]
+        confidence = 0.7
+        if not real or elsewhere:
+            # The pixel checks could only raise the confidence of a verdict that will not be given.
+            if elsewhere:
+                reasons.append(f"{elsewhere} appears in the file outside the XMP packet")
+            return Screening(None, confidence, signals, reasons)
+        crop = _pixel_crop(image)
+    signals["ela_ratio"] = round(error_level_ratio(crop), 2)
+    signals["noise"] = round(noise_level(crop), 2)
+    if signals["ela_ratio"] <= _ELA_MAX_RATIO:
+        confidence += 0.15
+        reasons.append(f"Uniform error levels across blocks (ratio {signals['ela_ratio']})")
+    if _NOISE_RANGE[0] <= signals["noise"] <= _NOISE_RANGE[1]:
+        confidence += 0.1
+        reasons.append(f"Sensor-like noise residual (sigma {signals['noise']})")
+    confidence = round(confidence, 2)
+    return Screening("REAL" if confidence >= threshold else None, confidence, signals, reasons)
+
+
+class _Counters:
+    def __init__(self) -> None:
+        self.screened = 0
+        self.real = 0
+        self.fake = 0
+        self._lock = threading.Lock()
+
+    def record(self, screening: Screening) -> None:
+        with self._lock:
+            self.screened += 1
+            if screening.verdict == "REAL":
+                self.real += 1
+            elif screening.verdict == "FAKE":
+                self.fake += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            decided = self.real + self.fake
+            return {
+                "screened": self.screened,
+                "decided_real": self.real,
+                "decided_fake": self.fake,
+                "short_circuit_rate": round(decided / self.screened, 4) if self.screened else 0.0,
+            }
+
+
+_counters = _Counters()
+
+
+def prescreen_stats() -> dict:
+    return _counters.stats()
+
+
+def screen_media(source: Any, mime_type: str) -> Optional[Screening]:
+    """The pre-screen for images, counted in :func:`prescreen_stats`; ``None`` when it does not apply."""
+    if not PRESCREEN_ENABLED or not mime_type.startswith("image/"):
+        return None
+    screening = prescreen_image(source)
+    _counters.record(screening)
+    return screening
+
+
+async def prescreen(source: Any, mime_type: str) -> Optional[Screening]:
+    """:func:`screen_media` on the preprocessing pool."""
+    if not PRESCREEN_ENABLED or not mime_type.startswith("image/"):
+        return None
+    from detector.preprocess import preprocess_executor
+
+    return await preprocess_executor.run(screen_media, source, mime_type)
@@ -0,0 +1,303 @@
+"""Face-region crops: the faces at full detail and a small copy of the scene, instead of one downscaled frame.
+
+The cues the forensic prompt asks about (eye reflections, ghosting along the jaw
+and hairline, skin texture) sit in the faces, and downscaling a 12MP photo to
+``DEEPFAKE_MAX_IMAGE_SIDE`` throws most of their pixels away. When OpenCV finds
+faces in an image that would be downscaled, the image is sent as a bundle
+instead:
+
+* up to ``DEEPFAKE_FACE_MAX_CROPS`` crops of the largest faces, widened by
+  ``DEEPFAKE_FACE_MARGIN`` on each side, at the original resolution (shrunk
+  only past ``DEEPFAKE_FACE_CROP_SIDE``);
+* one copy of the whole image at ``DEEPFAKE_FACE_CONTEXT_SIDE`` for lighting
+  and background.
+
+Keyframes of sampled videos get the same treatment (see :mod:`detector.video`).
+Each crop is labelled with its number and box in the original's pixels, and the
+report's findings name the crop their evidence is in; :func:`locate_findings`
+turns that number back into a box. Images without a face, or without OpenCV,
+are prepared as before.
+"""
+
+import io
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from detector.faces import Box, detect_faces
+from detector.preprocess import IMAGE_QUALITY, PreparedMedia
+
+FACE_CROPS = os.environ.get("DEEPFAKE_FACE_CROPS", "1").lower() not in ("0", "false", "no")
+FACE_MAX_CROPS = int(os.environ.get("DEEPFAKE_FACE_MAX_CROPS", "3"))
+FACE_CROP_SIDE = int(os.environ.get("DEEPFAKE_FACE_CROP_SIDE", "768"))
+FACE_CONTEXT_SIDE = int(os.environ.get("DEEPFAKE_FACE_CONTEXT_SIDE", "512"))
+FACE_MARGIN = float(os.environ.get("DEEPFAKE_FACE_MARGIN", "0.3"))
+
+_DETECT_SIDE = 640
+_MIN_FACE = 48  # native pixels; a smaller face has no detail left to recover
+_OVERLAP = 0.5
+
+
+class FaceCrop:
+    """One face crop; ``box`` is ``(left, top, right, bottom)`` in the original, ``size`` what was sent."""
+
+    __slots__ = ("number", "box", "jpeg", "size", "time")
+
+    def __init__(self, number: int, box: Box, jpeg: bytes, size: Tuple[int, int], time: Optional[float] = None):
+        self.number = number
+        self.box = box
+        self.jpeg = jpeg
+        self.size = size
+        self.time = time
+
+    def label(self) -> str:
+        left, top, right, bottom = self.box
+        source = "the original" if self.time is None else f"the frame at {self.time:.2f}s"
+        text = f"Face crop {self.number}, pixels ({left}, {top})-({right}, {bottom}) of {source}"
+        if self.size == (right - left, bottom - top):
+            return text + " at full resolution:"
+        return text + f", shrunk to {self.size[0]}x{self.size[1]}:"
+
+    def describe(self) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {"crop": self.number, "box": list(self.box), "sent": list(self.size)}
+        if self.time is not None:
+            entry["time"] = round(self.time, 3)
+        return entry
+
+
+def encode_jpeg(image: Any, side: int) -> Tuple[bytes, Tuple[int, int]]:
+    """``image`` shrunk to fit ``side`` and JPEG-encoded: ``(jpeg, size)``."""
+    from PIL import Image
+
+    width, height = image.size
+    scale = min(1.0, side / max(width, height))
+    if scale < 1.0:
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=IMAGE_QUALITY)
+    return buffer.getvalue(), image.size
+
+
+def _inside(box: Box, other: Box) -> float:
+    """Share of ``box``'s area that lies in ``other``."""
+    width = min(box[2], other[2]) - max(box[0], other[0])
+    height = min(box[3], other[3]) - max(box[1], other[1])
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    return width * height / area if width > 0 and height > 0 and area else 0.0
+
+
+def face_boxes(
+    faces: List[Box],
+    scale: Tuple[float, float],
+    dimensions: Tuple[int, int],
+    limit: int = FACE_MAX_CROPS,
+    margin: float = FACE_MARGIN,
+) -> List[Box]:
+    """Crop boxes in the original's pixels for ``faces`` found on a copy ``scale`` times smaller.
+
+    Faces come largest first; those under 48 native pixels, or mostly inside a
+    box already kept, are skipped.
+    """
+    width, height = dimensions
+    boxes: List[Box] = []
+    for left, top, right, bottom in faces:
+        left, right = round(left * scale[0]), round(right * scale[0])
+        top, bottom = round(top * scale[1]), round(bottom * scale[1])
+        if right - left < _MIN_FACE:
+            break
+        dx, dy = int((right - left) * margin), int((bottom - top) * margin)
+        box = (max(0, left - dx), max(0, top - dy), min(width, right + dx), min(height, bottom + dy))
+        if any(_inside(box, kept) > _OVERLAP for kept in boxes):
+            continue
+        boxes.append(box)
+        if len(boxes) >= limit:
+            break
+    return boxes
+
+
+class FaceRegions(PreparedMedia):
+    """Face crops and a context copy standing in for a whole image."""
+
+    def __init__(
+        self,
+        crops: List[FaceCrop],
+        context: bytes,
+        context_size: Tuple[int, int],
+        faces: int,
+        detect_ms: float,
+        metadata: Optional[Dict[str, Any]],
+        original_bytes: int,
+        original_dimensions: Tuple[int, int],
+    ) -> None:
+        super().__init__(b"", "image/jpeg", metadata, original_bytes, original_dimensions, transformed=True)
+        self.crops = crops
+        self.context = context
+        self.context_size = context_size
+        self.regions = {
+            "faces": faces,
+            "crops": [crop.describe() for crop in crops],
+            "context": list(context_size),
+            "detect_ms": round(detect_ms, 1),
+            "original_bytes": original_bytes,
+            "payload_bytes": self.payload_bytes,
+            "reduction": round(1 - self.payload_bytes / original_bytes, 4) if original_bytes else 0.0,
+        }
+
+    @property
+    def payload_bytes(self) -> int:
+        return len(self.context) + sum(len(crop.jpeg) for crop in self.crops)
+
+    def parts(self) -> List[Any]:
+        from google.genai import types  # type: ignore
+
+        width, height = self.context_size
+        parts: List[Any] = [
+            types.Part.from_text(text=f"Whole image, shrunk to {width}x{height} for context:"),
+            types.Part.from_bytes(data=self.context, mime_type="image/jpeg"),
+        ]
+        for crop in self.crops:
+            parts.append(types.Part.from_text(text=crop.label()))
+            parts.append(types.Part.from_bytes(data=crop.jpeg, mime_type="image/jpeg"))
+        return parts
+
+    def prompt_note(self) -> str:
+        width, height = self.original_dimensions
+        lines = [
+            f"The {width}x{height} image was sent as {len(self.crops)} face crop(s) at full detail and a small "
+            "copy of the whole image. Judge facial artifacts and skin texture from the crops, lighting from the "
+            "whole image; the shrinking, the crop edges and the JPEG re-encoding are not evidence of manipulation. "
+            "Set each finding's crop to the number of the face crop its evidence is in."
+        ]
+        if self.metadata:
+            lines.append("Metadata recovered from the original file:")
+            lines.extend(f"- {key}: {value}" for key, value in self.metadata.items())
+        return "\n\n" + "\n".join(lines)
+
+
+class _Totals:
+    """Process-wide face-region counters for the health endpoint."""
+
+    def __init__(self) -> None:
+        self.images = 0  # images large enough to be downscaled, so searched for faces
+        self.bundled = 0
+        self.crops = 0
+        self.frame_crops = 0
+        self.detect_ms = 0.0
+        self.original_bytes = 0
+        self.payload_bytes = 0
+        self._lock = threading.Lock()
+
+    def searched(self, detect_ms: float) -> None:
+        with self._lock:
+            self.images += 1
+            self.detect_ms += detect_ms
+
+    def bundle(self, media: FaceRegions) -> None:
+        with self._lock:
+            self.bundled += 1
+            self.crops += len(media.crops)
+            self.original_bytes += media.original_bytes
+            self.payload_bytes += media.payload_bytes
+
+    def frames(self, crops: int) -> None:
+        with self._lock:
+            self.frame_crops += crops
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": FACE_CROPS,
+                "images_searched": self.images,
+                "images_bundled": self.bundled,
+                "crops": self.crops,
+                "video_frame_crops": self.frame_crops,
+                "mean_detect_ms": round(self.detect_ms / self.images, 1) if self.images else 0.0,
+                "payload_reduction": round(1 - self.payload_bytes / self.original_bytes, 4)
+                if self.original_bytes
+                else 0.0,
+            }
+
+
+_totals = _Totals()
+
+
+def region_stats() -> dict:
+    return _totals.stats()
+
+
+def record_frame_crops(crops: int) -> None:
+    _totals.frames(crops)
+
+
+def crop_faces(
+    image: Any,
+    original_bytes: int,
+    metadata: Optional[Dict[str, Any]] = None,
+    detect: Any = detect_faces,
+    record: bool = True,
+) -> Optional[FaceRegions]:
+    """Face crops and a context copy of an opened PIL image, or ``None`` to send it whole.
+
+    ``None`` when there is no face worth cropping, or the bundle would be no
+    smaller than the file. The image is decoded at full size: the crops need it,
+    and JPEG decoding costs nearly as much at reduced scale, so the caller
+    downscales the same decode when there is no face.
+    """
+    from PIL import Image, ImageOps
+
+    started = time.perf_counter()
+    image.load()
+    small = ImageOps.exif_transpose(image.reduce(max(1, max(image.size) // _DETECT_SIDE)))
+    small.thumbnail((_DETECT_SIDE, _DETECT_SIDE), Image.Resampling.BILINEAR)
+    try:
+        faces = detect(small)
+    except Exception:
+        faces = []
+    detect_ms = (time.perf_counter() - started) * 1000
+    if record:
+        _totals.searched(detect_ms)
+    if not faces:
+        return None
+
+    upright = ImageOps.exif_transpose(image)
+    boxes = face_boxes(faces, (upright.width / small.width, upright.height / small.height), upright.size)
+    if not boxes:
+        return None
+    crops = [
+        FaceCrop(number, box, *encode_jpeg(upright.crop(box), FACE_CROP_SIDE)) for number, box in enumerate(boxes, 1)
+    ]
+    context, context_size = encode_jpeg(small, FACE_CONTEXT_SIDE)
+    media = FaceRegions(crops, context, context_size, len(faces), detect_ms, metadata, original_bytes, upright.size)
+    if media.payload_bytes >= original_bytes:
+        return None
+    if record:
+        _totals.bundle(media)
+    return media
+
+
+def locate_findings(
+    findings: Optional[Dict[str, Any]], regions: Optional[Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """``findings`` with each ``crop`` number resolved to that crop's ``box`` (and frame ``time``).
+
+    References to crops that were never sent are dropped.
+    """
+    if not findings:
+        return findings
+    crops = {crop["crop"]: crop for crop in (regions or {}).get("crops", [])}
+    located = {}
+    for name, finding in findings.items():
+        finding = dict(finding)
+        crop = crops.get(finding.get("crop"))
+        if crop is None:
+            finding.pop("crop", None)
+        else:
+            finding["box"] = crop["box"]
+            if "time" in crop:
+                finding["time"] = crop["time"]
+        located[name] = finding
+    return located
@@ -0,0 +1,148 @@
+"""Typed forensic report requested from Gemini as JSON and parsed without guesswork.
+
+The model call sets ``response_mime_type="application/json"`` with
+:class:`ForensicReport` as the response schema, so the verdict and confidence are
+typed fields instead of words picked out of prose (``"not FAKE"`` used to read as
+FAKE). Output is capped at ``DEEPFAKE_MAX_OUTPUT_TOKENS``.
+
+:func:`parse_report` also accepts the labelled plain-text format older prompts
+produced (``VERDICT: FAKE`` / ``CONFIDENCE: 87%``), which keeps truncated JSON and
+text-only stubs readable. Anything without an explicit verdict raises
+:class:`ReportError` rather than defaulting to REAL.
+"""
+
+import json
+import os
+import re
+from typing import Any, Dict, Literal, Optional
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+MAX_OUTPUT_TOKENS = int(os.environ.get("DEEPFAKE_MAX_OUTPUT_TOKENS", "1024"))
+
+REPORT_INSTRUCTIONS = (
+    "Respond only with the JSON report: verdict (REAL or FAKE), confidence (0-100), one short finding per "
+    "category (set av_sync only for video with audio) and a summary of at most two sentences."
+)
+
+CATEGORY_LABELS = {
+    "lighting": "Lighting & shadows",
+    "facial_artifacts": "Facial artifacts",
+    "texture_noise": "Texture & noise",
+    "av_sync": "Audio-visual sync",
+}
+
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+VERDICT_PATTERN = re.compile(r"\bverdict(?:\W+(?:is|was))?\W{0,6}(REAL|FAKE)\b", re.IGNORECASE)
+# The number must be followed by a delimiter: at the end of cut-off JSON, "confidence": 9 may be the start of 95.
+_CONFIDENCE_LABEL = re.compile(r"\bconfidence\W{0,6}(\d{1,3}(?:\.\d+)?)(?=[ \t]*[,}%\r\n])", re.IGNORECASE)
+_PERCENT = re.compile(r"(\d{1,3}(?:\.\d+)?)\s*%")
+
+
+class ReportError(ValueError):
+    """Raised when a model response carries no readable verdict."""
+
+
+class Finding(BaseModel):
+    anomaly: bool = Field(description="True when this category shows signs of manipulation")
+    detail: str = Field(description="One short sentence of evidence")
+    crop: Optional[int] = Field(None, description="Number of the face crop the evidence is in, if crops are shown")
+
+
+class Findings(BaseModel):
+    lighting: Finding
+    facial_artifacts: Finding
+    texture_noise: Finding
+    av_sync: Optional[Finding] = None
+
+
+class ForensicReport(BaseModel):
+    verdict: Literal["REAL", "FAKE"]
+    confidence: int = Field(ge=0, le=100, description="Confidence in the verdict, 0-100")
+    findings: Optional[Findings] = None
+    summary: str = ""
+
+    @field_validator("verdict", mode="before")
+    @classmethod
+    def _upper_verdict(cls, value: Any) -> Any:
+        return value.strip().upper() if isinstance(value, str) else value
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def _percent_confidence(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            text = value.strip()
+            if text.endswith("%"):
+                return round(float(text[:-1]))
+            value = float(text) if "." in text else int(text)
+        if isinstance(value, float):
+            # Some replies give a 0-1 probability (0.87) despite the schema description; 1 and "1%" stay 1%.
+            value = round(value * 100 if value < 1 else value)
+        return value
+
+    @property
+    def is_fake(self) -> bool:
+        return self.verdict == "FAKE"
+
+    def analysis(self) -> str:
+        """Readable report for the ``analysis`` field and the Streamlit page."""
+        lines = [self.summary] if self.summary else []
+        if self.findings is not None:
+            if lines:
+                lines.append("")
+            for name, label in CATEGORY_LABELS.items():
+                finding = getattr(self.findings, name)
+                if finding is not None:
+                    marker = "anomaly" if finding.anomaly else "consistent"
+                    lines.append(f"- **{label}** ({marker}): {finding.detail}")
+        return "\n".join(lines) or f"VERDICT: {self.verdict}"
+
+    def result_fields(self) -> Dict[str, Any]:
+        """Fields shared by ``DetectionResult`` and ``AnalysisResponse``."""
+        return {
+            "verdict": self.verdict,
+            "confidence": f"{self.confidence}%" if self.confidence is not None else "N/A",
+            "analysis": self.analysis(),
+            "is_fake": self.is_fake,
+            "findings": self.findings.model_dump(exclude_none=True) if self.findings is not None else None,
+        }
+
+
+def generation_config(max_output_tokens: int = MAX_OUTPUT_TOKENS) -> Dict[str, Any]:
+    """``generate_content`` config requesting a :class:`ForensicReport` as JSON."""
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": ForensicReport,
+        "max_output_tokens": max_output_tokens,
+    }
+
+
+# Summary of a report recovered from cut-off JSON; routing escalates such reports.
+TRUNCATED_SUMMARY = "The model's JSON report was cut short; verdict and confidence were recovered from it."
+
+
+def _labelled_report(text: str) -> ForensicReport:
+    verdict = VERDICT_PATTERN.search(text)
+    if verdict is None:
+        raise ReportError("Model response has no verdict")
+    confidence = _CONFIDENCE_LABEL.search(text) or _PERCENT.search(text[verdict.end():])
+    summary = text.strip()
+    if summary.startswith("{"):
+        summary = TRUNCATED_SUMMARY
+    if confidence is None:
+        # Built without validation: the schema requires a confidence, plain text may lack one.
+        return ForensicReport.model_construct(verdict=verdict.group(1).upper(), confidence=None, summary=summary)
+    value = min(100, round(float(confidence.group(1))))
+    return ForensicReport(verdict=verdict.group(1).upper(), confidence=value, summary=summary)
+
+
+def parse_report(text: Optional[str]) -> ForensicReport:
+    """Parse a model response into a :class:`ForensicReport`."""
+    if not text or not text.strip():
+        raise ReportError("Model returned an empty response")
+    body = _FENCE.sub("", text)
+    try:
+        return ForensicReport.model_validate(json.loads(body))
+    except (ValueError, ValidationError):
+        # Truncated or schema-less output: fall back to explicit labels, never bare substrings.
+        return _labelled_report(body)
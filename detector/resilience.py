@@ -0,0 +1,450 @@
+"""Shared model-invocation layer: retries, hedged requests, model fallback, circuit breakers.
+
+Every Gemini call goes through :data:`model_caller` as ``call(lambda model: ...)``.
+The callable receives the model name to use:
+
+* transient failures (429, 5xx, dropped connections) are retried with jittered
+  exponential backoff, waiting at least as long as the server's ``Retry-After``
+  header or ``RetryInfo.retryDelay`` asks;
+* when a model keeps failing, or is unknown to the API, the next entry of
+  ``DEEPFAKE_MODELS`` is tried;
+* each model has a circuit breaker: after ``DEEPFAKE_BREAKER_FAILURES``
+  consecutive failures it is skipped for ``DEEPFAKE_BREAKER_COOLDOWN`` seconds,
+  after which a single trial call decides whether it closes again;
+* with ``DEEPFAKE_HEDGE=1`` a duplicate request is sent once the first has run
+  longer than that model's recent p95 latency, and whichever finishes first wins.
+  The loser's reply is handed to the caller's ``discarded`` callback (its tokens
+  are billed too), and no hedge is sent while every hedging thread is busy.
+
+Client errors such as a bad request or a rejected key are raised at once, since
+neither another attempt nor another model would help.
+"""
+
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from detector.concurrency import MAX_CONCURRENT_CALLS
+
+MODELS = [
+    name.strip()
+    for name in os.environ.get("DEEPFAKE_MODELS", "gemini-3-flash-preview,gemini-2.5-flash").split(",")
+    if name.strip()
+]
+PRIMARY_MODEL = MODELS[0]
+RETRY_ATTEMPTS = int(os.environ.get("DEEPFAKE_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.environ.get("DEEPFAKE_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("DEEPFAKE_RETRY_MAX_DELAY", "8"))
+HEDGE_ENABLED = os.environ.get("DEEPFAKE_HEDGE", "0").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.environ.get("DEEPFAKE_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("DEEPFAKE_HEDGE_MIN_SAMPLES", "20"))
+BREAKER_FAILURES = int(os.environ.get("DEEPFAKE_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("DEEPFAKE_BREAKER_COOLDOWN", "30"))
+# Each in-flight model call may hold a primary and a hedge thread.
+HEDGE_WORKERS = 2 * MAX_CONCURRENT_CALLS
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_RETRY_DELAY = re.compile(r"^\s*(\d+(?:\.\d+)?)s\s*$")
+
+T = TypeVar("T")
+
+
+class ModelUnavailableError(RuntimeError):
+    """Raised without calling upstream when every configured model's circuit is open."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """HTTP status of an SDK ``APIError`` (``None`` for transport errors and everything else)."""
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) and 100 <= code < 600 else None
+
+
+def is_transient(error: BaseException) -> bool:
+    code = status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    try:
+        import httpx
+    except ImportError:
+        return isinstance(error, (ConnectionError, TimeoutError))
+    return isinstance(error, (ConnectionError, TimeoutError, httpx.TransportError))
+
+
+def _tries_next_model(error: BaseException) -> bool:
+    # Unknown or retired model names come back as 404; other 4xx are the caller's fault.
+    return is_transient(error) or status_code(error) == 404
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait, from ``Retry-After`` or ``RetryInfo.retryDelay``."""
+    response = getattr(error, "response", None)
+    header = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(header).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for detail in details.get("error", {}).get("details", []) or []:
+            match = _RETRY_DELAY.match(str(detail.get("retryDelay", ""))) if isinstance(detail, dict) else None
+            if match:
+                return float(match.group(1))
+    return None
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff for retry number ``attempt`` (1-based)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open for ``cooldown`` s -> one half-open trial."""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN) -> None:
+        self.threshold = max(1, failures)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def remaining(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self.trial_running:
+                return False
+            self.trial_running = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or (self.opened_at is None and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                self.trips += 1
+            self.trial_running = False
+
+
+class _LatencyWindow:
+    def __init__(self, size: int = 200) -> None:
+        self.samples: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, percent: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            if len(self.samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, math.ceil(len(ordered) * percent / 100) - 1)]
+
+
+def _hand_over(discarded: Callable[[T], None], future: "Future[T]") -> None:
+    if not future.cancelled() and future.exception() is None:
+        discarded(future.result())
+
+
+class ModelCaller:
+    def __init__(
+        self,
+        models: Sequence[str] = tuple(MODELS),
+        attempts: int = RETRY_ATTEMPTS,
+        max_delay: float = RETRY_MAX_DELAY,
+        hedge: bool = HEDGE_ENABLED,
+        hedge_percentile: float = HEDGE_PERCENTILE,
+        hedge_min_samples: int = HEDGE_MIN_SAMPLES,
+        hedge_workers: int = HEDGE_WORKERS,
+        breaker_failures: int = BREAKER_FAILURES,
+        breaker_cooldown: float = BREAKER_COOLDOWN,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.models = list(models)
+        self.attempts = max(1, attempts)
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_workers = max(2, hedge_workers)
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.sleep = sleep
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, _LatencyWindow] = {}
+        self.counters = {
+            "calls": 0,
+            "retries": 0,
+            "fallbacks": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "hedges_skipped": 0,
+            "fail_fast": 0,
+            "failures": 0,
+        }
+        # Failed attempts by upstream status ("transport" for network errors, "other" otherwise).
+        self.errors: Dict[str, int] = {}
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._hedge_busy = 0
+        self._lock = threading.Lock()
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self.breakers:
+                self.breakers[model] = CircuitBreaker(self.breaker_failures, self.breaker_cooldown)
+                self.latencies[model] = _LatencyWindow()
+            return self.breakers[model]
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=self.hedge_workers, thread_name_prefix="gemini-hedge")
+            return self._hedge_pool
+
+    def _submit(self, fn: Callable[[str], T], model: str, hedge: bool = False) -> Optional["Future[T]"]:
+        """``fn(model)`` on the hedging pool; a hedge is only sent (else ``None``) while a thread is idle."""
+        pool = self._pool()
+        with self._lock:
+            if hedge and self._hedge_busy >= self.hedge_workers:
+                self.counters["hedges_skipped"] += 1
+                return None
+            self._hedge_busy += 1
+        future = pool.submit(fn, model)
+        future.add_done_callback(self._hedge_done)
+        return future
+
+    def _hedge_done(self, _: Future) -> None:
+        with self._lock:
+            self._hedge_busy -= 1
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Seconds after which a duplicate request is sent, or ``None`` when hedging is off."""
+        if not self.hedge:
+            return None
+        self._breaker(model)
+        return self.latencies[model].percentile(self.hedge_percentile, self.hedge_min_samples)
+
+    def _attempt(self, fn: Callable[[str], T], model: str, discarded: Optional[Callable[[T], None]] = None) -> T:
+        delay = self.hedge_delay(model)
+        started = time.monotonic()
+        if delay is None:
+            result = fn(model)
+            self.latencies[model].add(time.monotonic() - started)
+            return result
+
+        primary = self._submit(fn, model)
+        assert primary is not None
+        done, _ = wait([primary], timeout=delay)
+        hedge = None if done else self._submit(fn, model, hedge=True)
+        if hedge is None:
+            result = primary.result()
+            self.latencies[model].add(time.monotonic() - started)
+            return result
+        self._count("hedges")
+        pending: List[Future] = [primary, hedge]
+        error: Optional[BaseException] = None
+        while pending:
+            done, remaining = wait(pending, return_when=FIRST_COMPLETED)
+            pending = list(remaining)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    if discarded is not None:
+                        # The loser keeps running in its thread; its reply is billed, then dropped.
+                        loser = hedge if future is primary else primary
+                        loser.add_done_callback(partial(_hand_over, discarded))
+                    self.latencies[model].add(time.monotonic() - started)
+                    return future.result()
+                error = future.exception()
+        assert error is not None
+        raise error
+
+    def _models(self, models: Optional[Sequence[str]]) -> List[str]:
+        return list(models or self.models)
+
+    def _all_open(self, order: Sequence[str]) -> ModelUnavailableError:
+        self._count("fail_fast")
+        wait_for = min((self._breaker(model).remaining() for model in order), default=self.breaker_cooldown)
+        return ModelUnavailableError(
+            "Model service unavailable: upstream is failing, retry shortly", retry_after=max(1.0, wait_for)
+        )
+
+    def _retry_same_model(self, breaker: CircuitBreaker, error: BaseException, attempt: int) -> bool:
+        """Record a failed attempt; sleep and return True to retry, False to move to the next model.
+
+        Errors that no retry or fallback can fix are re-raised.
+        """
+        code = status_code(error)
+        kind = str(code) if code is not None else "transport" if is_transient(error) else "other"
+        with self._lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+        if not _tries_next_model(error):
+            breaker.record_success()  # upstream answered; the request itself is at fault
+            raise error
+        breaker.record_failure()
+        if code == 404 or attempt == self.attempts:
+            return False
+        requested = retry_after(error) or 0.0
+        if requested > self.max_delay:
+            # Waiting that long would hold a worker; the next model may answer now.
+            return False
+        self._count("retries")
+        self.sleep(max(backoff_delay(attempt, cap=self.max_delay), requested))
+        return True
+
+    def call(
+        self,
+        fn: Callable[[str], T],
+        models: Optional[Sequence[str]] = None,
+        discarded: Optional[Callable[[T], None]] = None,
+    ) -> Tuple[T, str]:
+        """Run ``fn(model)`` with retries, hedging and fallback; returns ``(result, model_used)``.
+
+        ``discarded`` is called (from a pool thread) with each reply that lost a hedge race.
+        """
+        self._count("calls")
+        order = self._models(models)
+        last_error: Optional[BaseException] = None
+        for position, model in enumerate(order):
+            breaker = self._breaker(model)
+            for attempt in range(1, self.attempts + 1):
+                if not breaker.allow():
+                    break
+                try:
+                    result = self._attempt(fn, model, discarded)
+                except Exception as error:
+                    last_error = error
+                    if self._retry_same_model(breaker, error, attempt):
+                        continue
+                    break
+                breaker.record_success()
+                if position:
+                    self._count("fallbacks")
+                return result, model
+        self._count("failures")
+        if last_error is None:
+            raise self._all_open(order)
+        raise last_error
+
+    def stream(
+        self, fn: Callable[[str], Iterable[T]], models: Optional[Sequence[str]] = None
+    ) -> Iterator[Tuple[str, T]]:
+        """Streaming variant of :meth:`call`, yielding ``(model, chunk)``.
+
+        Retries and fallback only happen before the first chunk; once output has
+        started an error is raised to the caller. Streams are never hedged.
+        """
+        self._count("calls")
+        order = self._models(models)
+        last_error: Optional[BaseException] = None
+        for position, model in enumerate(order):
+            breaker = self._breaker(model)
+            for attempt in range(1, self.attempts + 1):
+                if not breaker.allow():
+                    break
+                started = False
+                try:
+                    for chunk in fn(model):
+                        if not started:
+                            started = True
+                            breaker.record_success()
+                            if position:
+                                self._count("fallbacks")
+                        yield model, chunk
+                except Exception as error:
+                    if started:
+                        raise
+                    last_error = error
+                    if self._retry_same_model(breaker, error, attempt):
+                        continue
+                    break
+                if not started:
+                    breaker.record_success()
+                return
+        self._count("failures")
+        if last_error is None:
+            raise self._all_open(order)
+        raise last_error
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            errors = dict(self.errors)
+            models = list(self.breakers)
+        return {
+            **counters,
+            "errors": errors,
+            "hedging": self.hedge,
+            "hedge_workers": self.hedge_workers,
+            "models": {
+                model: {
+                    "breaker": self.breakers[model].state,
+                    "consecutive_failures": self.breakers[model].failures,
+                    "trips": self.breakers[model].trips,
+                    "p95_ms": _ms(self.latencies[model].percentile(95)),
+                }
+                for model in models
+            },
+        }
+
+
+def http_status(error: BaseException) -> Optional[Tuple[int, str, Optional[float]]]:
+    """``(status, detail, retry_after)`` to answer with when the model layer gave up, else ``None``."""
+    if isinstance(error, ModelUnavailableError):
+        return 503, str(error), error.retry_after
+    code = status_code(error)
+    if code == 429:
+        return 429, "Gemini rate limit reached, retry shortly", retry_after(error)
+    if code is not None and code >= 500:
+        return 502, f"Gemini is failing upstream ({code}), retry shortly", retry_after(error)
+    if code is None and is_transient(error):
+        return 504, "Could not reach Gemini, retry shortly", None
+    return None
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+model_caller = ModelCaller()
@@ -0,0 +1,242 @@
+"""Tiered model routing: a cheap, fast model first, the regular models only when it is unsure.
+
+``DEEPFAKE_ROUTING_TIERS`` lists the tiers tried before the regular models
+(``DEEPFAKE_MODELS`` with their fallbacks), cheapest first, as comma-separated
+``model[:max_output_tokens[:min_confidence]]``. For example,
+``gemini-2.5-flash-lite:512:85`` answers with at most 512 output tokens, and its
+verdict stands when the model is at least 85% confident. The token budget
+defaults to ``DEEPFAKE_ROUTING_MAX_OUTPUT_TOKENS`` and the threshold to
+``DEEPFAKE_ROUTING_MIN_CONFIDENCE``.
+
+A tier's answer is escalated to the next tier when:
+
+* ``low_confidence``: the confidence is below the tier's threshold;
+* ``no_confidence``: the report has a verdict but no confidence;
+* ``ambiguous``: the findings contradict the verdict (FAKE without an anomaly,
+  or REAL with one);
+* ``truncated``: the JSON report was cut short (usually by the budget) and only
+  its verdict and confidence were recovered;
+* ``unreadable``: the report could not be parsed, or came without findings;
+* ``error``: the call failed, even after the caller's retries.
+
+The regular models answer whatever is left, and their answer always stands.
+When the tiers are empty (the default), every request goes straight to the
+regular models, as before.
+
+Per tier, the stats count calls, answers, escalations by reason and latency.
+They also report how often an escalated verdict agreed with the final one, so
+the thresholds can be tuned.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from detector.report import TRUNCATED_SUMMARY
+
+ROUTING_TIERS = os.environ.get("DEEPFAKE_ROUTING_TIERS", "")
+ROUTING_MIN_CONFIDENCE = int(os.environ.get("DEEPFAKE_ROUTING_MIN_CONFIDENCE", "85"))
+ROUTING_MAX_OUTPUT_TOKENS = int(os.environ.get("DEEPFAKE_ROUTING_MAX_OUTPUT_TOKENS", "512"))
+
+FINAL_TIER = "default"  # label of the regular models in traces and stats
+
+# ``ask(tier)`` -> ``(report, model_used)``; ``tier`` is ``None`` for the regular models
+Ask = Callable[[Optional["Tier"]], Tuple[Any, str]]
+
+
+class Tier:
+    __slots__ = ("model", "max_output_tokens", "min_confidence")
+
+    def __init__(self, model: str, max_output_tokens: int, min_confidence: int) -> None:
+        self.model = model
+        self.max_output_tokens = max_output_tokens
+        self.min_confidence = min_confidence
+
+    def __repr__(self) -> str:
+        return f"{self.model}:{self.max_output_tokens}:{self.min_confidence}"
+
+
+def parse_tiers(
+    spec: str, max_output_tokens: int = ROUTING_MAX_OUTPUT_TOKENS, min_confidence: int = ROUTING_MIN_CONFIDENCE
+) -> List[Tier]:
+    """Tiers from ``model[:max_output_tokens[:min_confidence]]`` entries; raises ``ValueError`` on bad numbers."""
+    tiers = []
+    for entry in spec.split(","):
+        parts = [part.strip() for part in entry.split(":")]
+        if not parts[0]:
+            continue
+        tokens = int(parts[1]) if len(parts) > 1 and parts[1] else max_output_tokens
+        threshold = int(parts[2]) if len(parts) > 2 and parts[2] else min_confidence
+        tiers.append(Tier(parts[0], tokens, threshold))
+    return tiers
+
+
+def escalation(tier: Tier, report: Any) -> Optional[str]:
+    """Why ``report`` from ``tier`` should go to the next tier, or ``None`` when it stands."""
+    if report.summary == TRUNCATED_SUMMARY:
+        return "truncated"
+    findings = report.findings
+    if findings is None:
+        # Recovered from labels: there is nothing to check the verdict against.
+        return "unreadable"
+    if report.confidence is None:
+        return "no_confidence"
+    if report.confidence < tier.min_confidence:
+        return "low_confidence"
+    anomalies = any(
+        finding.anomaly
+        for finding in (findings.lighting, findings.facial_artifacts, findings.texture_noise, findings.av_sync)
+        if finding is not None
+    )
+    if anomalies != report.is_fake:
+        return "ambiguous"
+    return None
+
+
+def _step(label: str, model: Optional[str], report: Any, seconds: float, outcome: str) -> Dict[str, Any]:
+    step: Dict[str, Any] = {"tier": label, "model": model, "outcome": outcome, "ms": round(seconds * 1000, 1)}
+    if report is not None:
+        step.update(verdict=report.verdict, confidence=report.confidence)
+    return step
+
+
+class _TierStats:
+    __slots__ = ("calls", "answered", "escalated", "seconds", "compared", "agreed")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.answered = 0
+        self.escalated: Dict[str, int] = {}
+        self.seconds = 0.0
+        self.compared = 0
+        self.agreed = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "answered": self.answered,
+            "escalated": dict(self.escalated),
+            "mean_ms": round(self.seconds / self.calls * 1000, 1) if self.calls else 0.0,
+            # Escalated verdicts the final answer agreed with: how cautious the threshold is
+            "agreement": round(self.agreed / self.compared, 4) if self.compared else None,
+        }
+
+
+class ModelRouter:
+    """Runs an analysis through the tiers (see the module docstring) and keeps per-tier stats."""
+
+    def __init__(self, tiers: Optional[List[Tier]] = None) -> None:
+        self.tiers = parse_tiers(ROUTING_TIERS) if tiers is None else list(tiers)
+        self.requests = 0
+        self.escalations = 0  # requests not answered by the first tier
+        self._seconds = 0.0
+        self._stats: Dict[str, _TierStats] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.tiers)
+
+    def signature(self) -> str:
+        """The tiers in a stable form, for cache keys: a new policy never reuses old verdicts."""
+        return ">".join(repr(tier) for tier in self.tiers)
+
+    def cascade(self, ask: Ask) -> Tuple[Any, Optional[str], List[Dict[str, Any]]]:
+        """Ask the tiers in turn: ``(report, model, steps)`` from the first whose answer stands.
+
+        ``report`` and ``model`` are ``None`` when every tier escalated; the
+        regular models answer then, and :meth:`conclude` records their answer.
+        """
+        from detector.report import ReportError
+
+        steps: List[Dict[str, Any]] = []
+        for tier in self.tiers:
+            began = time.perf_counter()
+            try:
+                report, model = ask(tier)
+            except ReportError:
+                steps.append(_step(tier.model, tier.model, None, time.perf_counter() - began, "unreadable"))
+                continue
+            except Exception:
+                # Even a 4xx goes on: a cheap model may reject options the regular ones accept,
+                # and a request that is really at fault fails again there with the right error.
+                steps.append(_step(tier.model, None, None, time.perf_counter() - began, "error"))
+                continue
+            reason = escalation(tier, report)
+            steps.append(_step(tier.model, model, report, time.perf_counter() - began, reason or "answered"))
+            if reason is None:
+                return report, model, steps
+        return None, None, steps
+
+    def conclude(
+        self,
+        steps: List[Dict[str, Any]],
+        started: float,
+        report: Any = None,
+        model: Optional[str] = None,
+        seconds: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Record a routed analysis and return its trace.
+
+        Pass the regular models' ``report`` when the tiers escalated; ``seconds``
+        defaults to the time since ``started`` the tiers did not use.
+        """
+        if report is not None:
+            if seconds is None:
+                seconds = time.perf_counter() - started - sum(step["ms"] for step in steps) / 1000
+            steps.append(_step(FINAL_TIER, model, report, seconds, "answered"))
+        return self._finish(steps, started)
+
+    def route(self, ask: Ask) -> Tuple[Any, str, Dict[str, Any]]:
+        """``(report, model, trace)`` from the first tier whose answer stands, else the regular models.
+
+        Errors from the regular models propagate, as without routing.
+        """
+        started = time.perf_counter()
+        report, model, steps = self.cascade(ask)
+        if report is not None:
+            return report, model, self.conclude(steps, started)
+        began = time.perf_counter()
+        report, model = ask(None)
+        return report, model, self.conclude(steps, started, report, model, time.perf_counter() - began)
+
+    def _finish(self, steps: List[Dict[str, Any]], started: float) -> Dict[str, Any]:
+        seconds = time.perf_counter() - started
+        final = steps[-1]
+        with self._lock:
+            self.requests += 1
+            self.escalations += len(steps) > 1
+            self._seconds += seconds
+            for step in steps:
+                stats = self._stats.setdefault(step["tier"], _TierStats())
+                stats.calls += 1
+                stats.seconds += step["ms"] / 1000
+                if step is final:
+                    stats.answered += 1
+                    continue
+                stats.escalated[step["outcome"]] = stats.escalated.get(step["outcome"], 0) + 1
+                if "verdict" in step:
+                    stats.compared += 1
+                    stats.agreed += step["verdict"] == final["verdict"]
+        return {
+            "answered_by": final["tier"],
+            "escalations": len(steps) - 1,
+            "ms": round(seconds * 1000, 1),
+            "steps": steps,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            labels = [tier.model for tier in self.tiers] + [FINAL_TIER]
+            return {
+                "enabled": self.enabled,
+                "tiers": [repr(tier) for tier in self.tiers],
+                "requests": self.requests,
+                "escalation_rate": round(self.escalations / self.requests, 4) if self.requests else 0.0,
+                "mean_ms": round(self._seconds / self.requests * 1000, 1) if self.requests else 0.0,
+                "per_tier": {label: self._stats.get(label, _TierStats()).snapshot() for label in labels},
+            }
+
+
+model_router = ModelRouter()
@@ -0,0 +1,425 @@
+"""Bulk scanner: analyse whole archives from the command line.
+
+Usage: python -m detector.scan PATH [PATH ...] [--manifest FILE] [-o scan.jsonl] [--format jsonl|csv]
+                               [--workers N] [--concurrency N] [--checkpoint FILE] [--fresh]
+
+Directories are walked for the supported extensions; ``--manifest`` names a
+file with one path per line (``-`` reads stdin). Each file is read, hashed,
+pre-screened, split and preprocessed (resized, or keyframes sampled) in a pool
+of ``--workers`` processes. Only the prepared payload comes back. The model
+calls then run from one event loop through :class:`detector.engine.AnalysisEngine`,
+with at most ``--concurrency`` files in flight. Model calls are also capped by
+``DEEPFAKE_MAX_CONCURRENT_CALLS``, but wait for a slot without timing out. The
+verdict cache, near-duplicate index, pre-screen, routing and segmentation apply
+as in the API.
+
+One row per file is streamed to the output as JSONL or CSV. Finished paths are
+appended to the checkpoint (``<output>.checkpoint`` by default) with their size
+and modification time, so a rerun skips them and appends to the same output.
+Failures worth retrying (429, 5xx, network) are not checkpointed. After a crash,
+the files that were in flight are scanned again, so their rows may repeat; the
+last row for a path wins. Progress and throughput (files/s, MB/s) go to stderr.
+
+The API key comes from ``--api-key`` or ``GEMINI_API_KEY``.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from detector.engine import SUPPORTED_EXTENSIONS, SUPPORTED_TYPES, AnalysisEngine, AnalysisRequest, error_status
+
+CSV_FIELDS = (
+    "path",
+    "status",
+    "verdict",
+    "confidence",
+    "is_fake",
+    "source",
+    "model",
+    "similarity",
+    "mime_type",
+    "size",
+    "sha256",
+    "ms",
+    "http_status",
+    "error",
+)
+
+
+def iter_paths(paths: Iterable[str], manifest: Optional[str] = None) -> Iterator[str]:
+    """Files to scan, lazily: directories walked in sorted order for supported extensions, then the manifest."""
+    extensions = tuple(f".{extension}" for extension in SUPPORTED_EXTENSIONS)
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(extensions):
+                    yield os.path.join(root, name)
+    if manifest is not None:
+        source = sys.stdin if manifest == "-" else open(manifest, encoding="utf-8")
+        try:
+            for line in source:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield line
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+
+class LoadedMedia:
+    """What a worker process returns for one file: identity plus the CPU stages' outputs."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.size = 0
+        self.digest = ""
+        self.mime_type: Optional[str] = None
+        self.hashes: List[int] = []
+        self.screening: Any = None
+        self.spans: List[Any] = []
+        self.prepared: Any = None
+        self.skipped: Optional[str] = None
+
+
+def load_media(path: str, dedupe: bool = True, max_bytes: Optional[int] = None) -> LoadedMedia:
+    """Read ``path`` and run the default CPU stages on it; runs in a worker process.
+
+    Stops early when the pre-screen settles an image or a video is long enough to
+    be split (its segments are sampled later, one by one).
+    """
+    from detector.cache import content_hash
+    from detector.phash import media_hashes
+    from detector.preprocess import prepare
+    from detector.prescreen import screen_media
+    from detector.segments import plan_for
+    from detector.uploads import sniff_type
+
+    loaded = LoadedMedia(path)
+    loaded.size = os.path.getsize(path)
+    if max_bytes is not None and loaded.size > max_bytes:
+        loaded.skipped = f"larger than {max_bytes // (1024 * 1024)}MB"
+        return loaded
+    with open(path, "rb") as handle:
+        data = handle.read()
+    loaded.digest = content_hash(data)
+    loaded.mime_type = sniff_type(data[:16])
+    if loaded.mime_type not in SUPPORTED_TYPES:
+        loaded.skipped = "unsupported file type"
+        return loaded
+    if dedupe:
+        loaded.hashes = media_hashes(data, loaded.mime_type)
+    loaded.screening = screen_media(data, loaded.mime_type)
+    if loaded.screening is not None and loaded.screening.decided:
+        return loaded
+    if loaded.mime_type.startswith("video/"):
+        loaded.spans = plan_for(data, loaded.mime_type)
+        if loaded.spans:
+            return loaded
+    loaded.prepared = prepare(data, loaded.mime_type)
+    return loaded
+
+
+def _source(result: Any) -> str:
+    if result.similarity is not None:
+        return "near-duplicate"
+    if result.cached:
+        return "cache"
+    if result.prescreened:
+        return "pre-screen"
+    return "segments" if result.segments else "model"
+
+
+class Checkpoint:
+    """Append-only record of finished paths with the size and mtime they had, one JSON line each."""
+
+    def __init__(self, path: Optional[str], fsync_every: int = 100) -> None:
+        self.path = path
+        self.fsync_every = fsync_every
+        self.finished: Dict[str, tuple] = {}
+        self._pending = 0
+        self._file: Optional[TextIO] = None
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    self.finished[entry["path"]] = (entry["size"], entry["mtime_ns"])
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(path)
+
+    def done(self, path: str, info: os.stat_result) -> bool:
+        return self.finished.get(self._key(path)) == (info.st_size, info.st_mtime_ns)
+
+    def record(self, path: str, info: os.stat_result, status: str) -> None:
+        if self.path is None:
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        entry = {"path": self._key(path), "size": info.st_size, "mtime_ns": info.st_mtime_ns, "status": status}
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        self._pending += 1
+        if self._pending >= self.fsync_every:
+            os.fsync(self._file.fileno())
+            self._pending = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+
+class ResultWriter:
+    """Rows streamed as JSONL (everything) or CSV (:data:`CSV_FIELDS`), flushed one by one."""
+
+    def __init__(self, stream: TextIO, output_format: str = "jsonl") -> None:
+        self.stream = stream
+        self.output_format = output_format
+        self._csv: Optional[csv.DictWriter] = None
+        if output_format == "csv":
+            self._csv = csv.DictWriter(stream, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            if not stream.seekable() or stream.tell() == 0:
+                self._csv.writeheader()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self.stream.write(json.dumps({key: value for key, value in row.items() if value is not None}) + "\n")
+        self.stream.flush()
+
+
+class ScanStats:
+    """Counts and throughput of one run; skipped (checkpointed) files are not part of the rates."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.files = 0
+        self.bytes = 0
+        self.resumed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.sources: Dict[str, int] = {}
+
+    def add(self, size: int, source: Optional[str] = None) -> None:
+        self.files += 1
+        self.bytes += size
+        if source is not None:
+            self.sources[source] = self.sources.get(source, 0) + 1
+
+    def snapshot(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "files": self.files,
+            "bytes": self.bytes,
+            "resumed": self.resumed,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "sources": dict(self.sources),
+            "elapsed_s": round(elapsed, 1),
+            "files_per_s": round(self.files / elapsed, 2) if elapsed else 0.0,
+            "mb_per_s": round(self.bytes / elapsed / 2**20, 2) if elapsed else 0.0,
+        }
+
+    def line(self) -> str:
+        stats = self.snapshot()
+        return (
+            f"{stats['files']} files, {stats['bytes'] / 2**20:.1f}MB in {stats['elapsed_s']:.0f}s "
+            f"({stats['files_per_s']:.1f} files/s, {stats['mb_per_s']:.1f}MB/s); {stats['errors']} errors, "
+            f"{stats['skipped']} skipped, {stats['resumed']} already done"
+        )
+
+
+class Scanner:
+    """Feeds paths through the worker pool and the engine; see the module docstring."""
+
+    def __init__(
+        self,
+        engine: AnalysisEngine,
+        api_key: str,
+        writer: ResultWriter,
+        checkpoint: Checkpoint,
+        workers: int = min(4, os.cpu_count() or 1),
+        concurrency: int = 8,
+        max_bytes: Optional[int] = None,
+        progress: float = 10.0,
+        log: TextIO = sys.stderr,
+    ) -> None:
+        self.engine = engine
+        self.api_key = api_key
+        self.writer = writer
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.concurrency = max(1, concurrency)
+        self.max_bytes = max_bytes
+        self.progress = progress
+        self.log = log
+        self.stats = ScanStats()
+
+    def _pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None  # load on the event loop's default thread pool
+        # Spawned, not forked: the parent already runs threads (model executor, client pool)
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def run(self, paths: Iterable[str]) -> dict:
+        loop = asyncio.get_running_loop()
+        pool = self._pool()
+        dedupe = self.engine.index() is not None
+        # Bounded, so the walk and the worker pool stay only a little ahead of the model calls
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(self.workers, 1) * 2)
+
+        async def produce() -> None:
+            try:
+                for path in paths:
+                    try:
+                        info = os.stat(path)
+                    except OSError as error:
+                        self._fail(path, None, 404, str(error), 0.0)
+                        continue
+                    if self.checkpoint.done(path, info):
+                        self.stats.resumed += 1
+                        continue
+                    future = loop.run_in_executor(pool, load_media, path, dedupe, self.max_bytes)
+                    await queue.put((path, info, future, time.perf_counter()))
+            finally:
+                for _ in range(self.concurrency):
+                    await queue.put(None)
+
+        async def consume() -> None:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                await self._scan(*item)
+
+        async def report() -> None:
+            while True:
+                await asyncio.sleep(self.progress)
+                print(f"[scan] {self.stats.line()}", file=self.log, flush=True)
+
+        reporter = asyncio.create_task(report()) if self.progress > 0 else None
+        try:
+            await asyncio.gather(produce(), *(consume() for _ in range(self.concurrency)))
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+            self.checkpoint.close()
+        print(f"[scan] done: {self.stats.line()}", file=self.log, flush=True)
+        return self.stats.snapshot()
+
+    async def _scan(self, path: str, info: os.stat_result, future: Any, began: float) -> None:
+        try:
+            loaded = await future
+            if loaded.skipped is not None:
+                self.stats.skipped += 1
+                self.writer.write({"path": path, "status": "skipped", "size": loaded.size, "error": loaded.skipped})
+                self.checkpoint.record(path, info, "skipped")
+                return
+            with open(path, "rb") as handle:
+                # The raw bytes stay on disk unless a stage needs them (Files API upload, segments)
+                request = AnalysisRequest(handle, loaded.size, loaded.digest, loaded.mime_type, self.api_key)
+                result = await self.engine.analyze_precomputed(
+                    request, loaded.hashes, loaded.screening, loaded.spans, loaded.prepared
+                )
+        except Exception as error:
+            status, detail, _ = error_status(error)
+            self._fail(path, info, status, detail, time.perf_counter() - began)
+            return
+        source = _source(result)
+        row = {
+            "path": path,
+            "status": "ok",
+            "mime_type": loaded.mime_type,
+            "size": loaded.size,
+            "sha256": loaded.digest,
+            "source": source,
+            "ms": round((time.perf_counter() - began) * 1000, 1),
+            **result.model_dump(exclude={"cached", "prescreened"}),
+        }
+        self.writer.write(row)
+        self.checkpoint.record(path, info, "ok")
+        self.stats.add(loaded.size, source)
+
+    def _fail(self, path: str, info: Optional[os.stat_result], status: int, detail: str, seconds: float) -> None:
+        self.stats.errors += 1
+        self.writer.write(
+            {"path": path, "status": "error", "http_status": status, "error": detail, "ms": round(seconds * 1000, 1)}
+        )
+        # Rate limits and upstream or network failures are worth another run; the rest are final
+        if info is not None and status < 500 and status != 429:
+            self.checkpoint.record(path, info, "error")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="files or directories to scan")
+    parser.add_argument("--manifest", help="file with one path per line ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="scan.jsonl", help="results file ('-' for stdout)")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="default: from the output's extension")
+    parser.add_argument("--checkpoint", help="default: <output>.checkpoint (none when writing to stdout)")
+    parser.add_argument("--fresh", action="store_true", help="ignore and overwrite an existing checkpoint and output")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="decode processes (0: threads)")
+    parser.add_argument("--concurrency", type=int, default=8, help="files in flight through the engine")
+    parser.add_argument("--max-mb", type=float, default=512.0, help="skip larger files")
+    parser.add_argument("--progress", type=float, default=10.0, help="seconds between progress lines (0: off)")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"), help="default: $GEMINI_API_KEY")
+    args = parser.parse_args(argv)
+    if not args.paths and not args.manifest:
+        parser.error("give files or directories to scan, or --manifest")
+    if not args.api_key:
+        parser.error("a Gemini API key is needed: --api-key or GEMINI_API_KEY")
+
+    to_stdout = args.output == "-"
+    output_format = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    checkpoint_path = args.checkpoint or (None if to_stdout else f"{args.output}.checkpoint")
+    if args.fresh and checkpoint_path is not None and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    from detector.concurrency import model_executor
+
+    # A scan queues for model slots as long as it takes instead of failing with 503
+    model_executor.queue_timeout = 0
+    stream = sys.stdout if to_stdout else open(args.output, "w" if args.fresh else "a", encoding="utf-8", newline="")
+    scanner = Scanner(
+        AnalysisEngine(),
+        args.api_key,
+        ResultWriter(stream, output_format),
+        Checkpoint(checkpoint_path),
+        workers=args.workers,
+        concurrency=args.concurrency,
+        max_bytes=int(args.max_mb * 1024 * 1024),
+        progress=args.progress,
+    )
+    try:
+        summary = asyncio.run(scanner.run(iter_paths(args.paths, args.manifest)))
+    except KeyboardInterrupt:
+        print(f"[scan] interrupted: {scanner.stats.line()}; rerun to resume", file=sys.stderr)
+        return 130
+    finally:
+        if not to_stdout:
+            stream.close()
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""Long videos analysed as time segments in parallel and merged into one verdict.
+
+A clip of at least ``DEEPFAKE_SEGMENT_MIN_SECONDS`` is cut into segments of about
+``DEEPFAKE_SEGMENT_SECONDS`` (at most ``DEEPFAKE_SEGMENT_MAX`` of them). Each
+segment gets its own keyframe sample and model call, up to
+``DEEPFAKE_SEGMENT_CONCURRENCY`` at a time. Latency then follows the slowest
+segment rather than the length of the clip, and a failed call only loses its own
+segment.
+
+The merged verdict is FAKE when at least ``DEEPFAKE_SEGMENT_QUORUM`` of the
+segments (rounded up, at least one) look manipulated, otherwise REAL. Failed
+segments do not vote either way: the quorum counts only segments that were or
+still may be analysed. Once the finished segments settle the verdict, the
+remaining ones are cancelled, as their verdicts could no longer change it.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+SEGMENT_MIN_SECONDS = float(os.environ.get("DEEPFAKE_SEGMENT_MIN_SECONDS", "60"))
+SEGMENT_SECONDS = float(os.environ.get("DEEPFAKE_SEGMENT_SECONDS", "20"))
+SEGMENT_MAX = int(os.environ.get("DEEPFAKE_SEGMENT_MAX", "8"))
+SEGMENT_CONCURRENCY = int(os.environ.get("DEEPFAKE_SEGMENT_CONCURRENCY", "4"))
+SEGMENT_QUORUM = float(os.environ.get("DEEPFAKE_SEGMENT_QUORUM", "0.5"))
+SEGMENT_FRAMES = int(os.environ.get("DEEPFAKE_SEGMENT_FRAMES", "8"))
+
+Span = Tuple[float, float]
+
+
+def plan_segments(duration: float, seconds: float = SEGMENT_SECONDS, max_segments: int = SEGMENT_MAX) -> List[Span]:
+    """Equal ``(start, end)`` spans of about ``seconds`` covering ``duration``."""
+    count = max(1, min(max_segments, math.ceil(duration / max(seconds, 1.0))))
+    width = duration / count
+    return [(round(index * width, 3), round(min(duration, (index + 1) * width), 3)) for index in range(count)]
+
+
+def clip_duration(source: Any) -> float:
+    import av  # type: ignore
+
+    from detector.preprocess import media_file
+
+    with av.open(media_file(source)) as container:
+        if container.duration:
+            return container.duration / av.time_base
+        stream = container.streams.video[0]
+        if stream.duration and stream.time_base:
+            return float(stream.duration * stream.time_base)
+    return 0.0
+
+
+def plan_for(source: Any, mime_type: str, min_seconds: float = SEGMENT_MIN_SECONDS) -> List[Span]:
+    """Segments for a long video, or ``[]`` when it should go to the model in one call."""
+    from detector.video import VIDEO_SAMPLING, av_available
+
+    if min_seconds <= 0 or not mime_type.startswith("video/") or not VIDEO_SAMPLING or not av_available():
+        return []
+    try:
+        duration = clip_duration(source)
+    except Exception:
+        return []
+    if duration < min_seconds:
+        return []
+    spans = plan_segments(duration)
+    return spans if len(spans) > 1 else []
+
+
+def sample_segment(source: Any, mime_type: str, start: float, end: float) -> Any:
+    """Keyframes (and audio) of one segment, ready for the model; ``source`` is bytes or a seekable file."""
+    from detector.video import sample_video
+
+    return sample_video(source, mime_type, max_frames=SEGMENT_FRAMES, start=start, end=end, record=False)
+
+
+def _clock(seconds: float) -> str:
+    minutes, rest = divmod(int(round(seconds)), 60)
+    return f"{minutes}:{rest:02d}"
+
+
+class SegmentRun:
+    """Votes and timeline of one segmented analysis.
+
+    Timeline entries start ``pending`` and end ``fake``, ``real``, ``failed`` or
+    ``cancelled`` (not needed once the verdict was settled).
+    """
+
+    def __init__(self, spans: List[Span], quorum: float = SEGMENT_QUORUM) -> None:
+        self.spans = spans
+        self.quorum = quorum
+        self.timeline: List[Dict[str, Any]] = [
+            {"index": index, "start": start, "end": end, "status": "pending"}
+            for index, (start, end) in enumerate(spans)
+        ]
+        self.reports: Dict[int, Any] = {}
+        self.errors: List[BaseException] = []
+        self.busy_seconds = 0.0
+        self.started = time.perf_counter()
+        self.settled_after: Optional[float] = None
+
+    def _count(self, status: str) -> int:
+        return sum(1 for entry in self.timeline if entry["status"] == status)
+
+    @property
+    def pending(self) -> int:
+        return self._count("pending")
+
+    @property
+    def voting(self) -> int:
+        """Segments with a say in the verdict: all but the failed ones."""
+        return len(self.spans) - self._count("failed")
+
+    @property
+    def needed(self) -> int:
+        """FAKE segments that make the clip FAKE; it shrinks as segments fail, which never flips a decision."""
+        return max(1, math.ceil(self.quorum * self.voting))
+
+    @property
+    def partial(self) -> bool:
+        """Whether some segment failed, so the verdict rests on part of the clip."""
+        return bool(self.errors)
+
+    def add(self, index: int, report: Any, model: str, seconds: float) -> Dict[str, Any]:
+        entry = self.timeline[index]
+        entry.update(
+            status="fake" if report.is_fake else "real",
+            verdict=report.verdict,
+            confidence=report.confidence,
+            model=model,
+            summary=report.summary,
+            ms=round(seconds * 1000, 1),
+        )
+        self.reports[index] = report
+        self.busy_seconds += seconds
+        self._check_settled()
+        return entry
+
+    def fail(self, index: int, error: BaseException, seconds: float) -> Dict[str, Any]:
+        entry = self.timeline[index]
+        entry.update(status="failed", error=str(error)[:200], ms=round(seconds * 1000, 1))
+        self.errors.append(error)
+        self.busy_seconds += seconds
+        self._check_settled()
+        return entry
+
+    def decision(self) -> Optional[bool]:
+        """True (FAKE) or False (REAL) once the remaining segments cannot change it."""
+        if not self.reports:
+            return None
+        fake = self._count("fake")
+        if fake >= self.needed:
+            return True
+        if fake + self.pending < self.needed:
+            return False
+        return None
+
+    def _check_settled(self) -> None:
+        if self.settled_after is None and self.decision() is not None:
+            self.settled_after = time.perf_counter() - self.started
+
+    def cancel_pending(self) -> int:
+        cancelled = 0
+        for entry in self.timeline:
+            if entry["status"] == "pending":
+                entry["status"] = "cancelled"
+                cancelled += 1
+        return cancelled
+
+    def line(self, entry: Dict[str, Any]) -> str:
+        """One readable timeline line (markdown)."""
+        span = f"**{_clock(entry['start'])}–{_clock(entry['end'])}**"
+        if entry["status"] in ("fake", "real"):
+            text = f"{span} {entry['verdict']} ({entry['confidence']}%)"
+            return f"- {text}: {entry['summary']}" if entry.get("summary") else f"- {text}"
+        if entry["status"] == "failed":
+            return f"- {span} not analysed: {entry['error']}"
+        return f"- {span} skipped, the verdict was already settled"
+
+    def verdict_fields(self) -> Dict[str, Any]:
+        """Merged verdict, confidence and findings; raises the first error if no segment succeeded."""
+        if not self.reports:
+            raise self.errors[0] if self.errors else RuntimeError("No segment was analysed")
+        is_fake = self._count("fake") >= self.needed
+        # Normally some segment agrees; fall back to all of them rather than fail on a cancelled run
+        agreeing = [report for report in self.reports.values() if report.is_fake == is_fake]
+        agreeing = agreeing or list(self.reports.values())
+        # The most confident agreeing segment speaks for the clip's findings
+        lead = max(agreeing, key=lambda report: report.confidence)
+        findings = lead.findings.model_dump(exclude_none=True) if lead.findings is not None else None
+        if findings:
+            # Face crop numbers point into one segment's keyframes, not into the clip
+            findings = {name: {k: v for k, v in finding.items() if k != "crop"} for name, finding in findings.items()}
+        return {
+            "verdict": "FAKE" if is_fake else "REAL",
+            "confidence": f"{round(sum(report.confidence for report in agreeing) / len(agreeing))}%",
+            "is_fake": is_fake,
+            "findings": findings,
+        }
+
+    def analysis(self) -> str:
+        fake = self._count("fake")
+        analysed = len(self.reports)
+        flagged = [entry for entry in self.timeline if entry["status"] == "fake"]
+        head = f"{fake} of {analysed} analysed segments look manipulated"
+        if flagged:
+            head += " (" + ", ".join(f"{_clock(e['start'])}–{_clock(e['end'])}" for e in flagged) + ")"
+        head += f"; the clip is FAKE once {self.needed} of {self.voting} do."
+        return "\n".join([head, ""] + [self.line(entry) for entry in self.timeline])
+
+    def model(self) -> Optional[str]:
+        models = Counter(entry["model"] for entry in self.timeline if entry.get("model"))
+        return models.most_common(1)[0][0] if models else None
+
+    def report(self) -> Dict[str, Any]:
+        """The ``segments`` field: counts, wall-clock against summed segment time, and the timeline."""
+        wall = time.perf_counter() - self.started
+        return {
+            "count": len(self.spans),
+            "quorum": self.needed,
+            "completed": len(self.reports),
+            "failed": self._count("failed"),
+            "cancelled": self._count("cancelled"),
+            "wall_ms": round(wall * 1000, 1),
+            "serial_ms": round(self.busy_seconds * 1000, 1),
+            "settled_ms": round(self.settled_after * 1000, 1) if self.settled_after is not None else None,
+            "timeline": self.timeline,
+        }
+
+
+class _Totals:
+    """Process-wide segmented-analysis counters for the health endpoint."""
+
+    def __init__(self) -> None:
+        self.videos = 0
+        self.segments = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.wall_ms = 0.0
+        self.serial_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, report: Dict[str, Any]) -> None:
+        with self._lock:
+            self.videos += 1
+            self.segments += report["count"]
+            self.completed += report["completed"]
+            self.failed += report["failed"]
+            self.cancelled += report["cancelled"]
+            self.wall_ms += report["wall_ms"]
+            self.serial_ms += report["serial_ms"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "videos": self.videos,
+                "segments": self.segments,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "mean_wall_ms": round(self.wall_ms / self.videos, 1) if self.videos else 0.0,
+                "parallel_speedup": round(self.serial_ms / self.wall_ms, 2) if self.wall_ms else 0.0,
+            }
+
+
+_totals = _Totals()
+
+
+def record_run(report: Dict[str, Any]) -> None:
+    _totals.record(report)
+
+
+def segment_stats() -> dict:
+    return _totals.stats()
@@ -0,0 +1,164 @@
+"""Incremental reading of a streamed forensic report, plus server-sent event helpers.
+
+:class:`ReportStream` is fed the text chunks of ``generate_content_stream``. It
+reports the verdict (and confidence, once complete) as soon as it appears, which
+is within the first chunk or two since the schema puts it first. It also turns
+each finding and the summary into a readable line as soon as that field is
+complete. Labelled plain-text replies are passed through as they arrive.
+"""
+
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from detector.report import CATEGORY_LABELS, VERDICT_PATTERN, ForensicReport, parse_report
+
+# A number only counts once it is followed by a delimiter, so "8" of "85" is never reported.
+_JSON_CONFIDENCE = re.compile(r'"confidence"\s*:\s*"?(\d{1,3}(?:\.\d+)?)%?"?\s*[,}]')
+_TEXT_CONFIDENCE = re.compile(r"\bconfidence\W{0,6}(\d{1,3}(?:\.\d+)?)\s*%", re.IGNORECASE)
+_STRING = r'"(?:[^"\\]|\\.)*"'
+_FINDING = re.compile(
+    r'"(' + "|".join(CATEGORY_LABELS) + r')"\s*:\s*\{\s*"anomaly"\s*:\s*(true|false)\s*,\s*"detail"\s*:\s*('
+    + _STRING + r")\s*\}"
+)
+_SUMMARY = re.compile(r'"summary"\s*:\s*(' + _STRING + ")")
+
+# Stop proxies (nginx, Vercel's edge) from buffering the event stream.
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class ReportStream:
+    """Accumulates streamed report text and extracts what is already final."""
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.verdict: Optional[str] = None
+        self.confidence: Optional[int] = None
+        self._json: Optional[bool] = None
+        self._emitted: set = set()
+        self._announced: Optional[Dict[str, Any]] = None
+
+    def feed(self, chunk: str) -> List[str]:
+        """Add a chunk; returns the readable pieces of analysis it completed."""
+        self.text += chunk
+        if self._json is None and self.text.strip():
+            self._json = self.text.lstrip().startswith(("{", "`"))
+        if self.verdict is None:
+            match = VERDICT_PATTERN.search(self.text)
+            if match is not None:
+                self.verdict = match.group(1).upper()
+        if self.confidence is None:
+            match = (_JSON_CONFIDENCE if self._json else _TEXT_CONFIDENCE).search(self.text)
+            if match is not None:
+                value = float(match.group(1))
+                self.confidence = min(100, round(value * 100 if "." in match.group(1) and value <= 1 else value))
+        if not self._json:
+            return [chunk] if chunk else []
+
+        pieces = []
+        for match in _FINDING.finditer(self.text):
+            name = match.group(1)
+            if name not in self._emitted:
+                self._emitted.add(name)
+                marker = "anomaly" if match.group(2) == "true" else "consistent"
+                pieces.append(f"- **{CATEGORY_LABELS[name]}** ({marker}): {json.loads(match.group(3))}\n")
+        match = _SUMMARY.search(self.text)
+        if match is not None and "summary" not in self._emitted:
+            self._emitted.add("summary")
+            pieces.append(f"\n{json.loads(match.group(1))}\n")
+        return pieces
+
+    def verdict_fields(self) -> Dict[str, Any]:
+        return {
+            "verdict": self.verdict,
+            "confidence": f"{self.confidence}%" if self.confidence is not None else None,
+            "is_fake": self.verdict == "FAKE",
+        }
+
+    def verdict_update(self) -> Optional[Dict[str, Any]]:
+        """Verdict fields if they changed since the last call: once for the verdict, once more
+        if the confidence completes in a later chunk."""
+        if self.verdict is None:
+            return None
+        fields = self.verdict_fields()
+        if fields == self._announced:
+            return None
+        self._announced = fields
+        return fields
+
+    def report(self) -> ForensicReport:
+        """Parse the complete text; raises :class:`detector.report.ReportError` without a verdict."""
+        return parse_report(self.text)
+
+
+def sse_event(event: str, data: Any) -> str:
+    """One server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class StreamTimings:
+    """Rolling time-to-first-chunk and time-to-verdict for streamed analyses."""
+
+    def __init__(self, window: int = 512) -> None:
+        self.window = window
+        self.streams = 0
+        self._first_chunk: List[float] = []
+        self._verdict: List[float] = []
+        self._total: List[float] = []
+        self._lock = threading.Lock()
+
+    def record(self, first_chunk_ms: Optional[float], verdict_ms: Optional[float], total_ms: float) -> None:
+        with self._lock:
+            self.streams += 1
+            milestones = ((self._first_chunk, first_chunk_ms), (self._verdict, verdict_ms), (self._total, total_ms))
+            for samples, value in milestones:
+                if value is not None:
+                    samples.append(value)
+                    del samples[:-self.window]
+
+    @staticmethod
+    def _summary(samples: List[float]) -> Optional[Dict[str, float]]:
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return {
+            "p50_ms": round(ordered[len(ordered) // 2], 1),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "streams": self.streams,
+                "first_chunk": self._summary(self._first_chunk),
+                "verdict": self._summary(self._verdict),
+                "total": self._summary(self._total),
+            }
+
+
+class StreamClock:
+    """Milestones of one streamed analysis, measured from when the request arrived."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.first_chunk_ms: Optional[float] = None
+        self.verdict_ms: Optional[float] = None
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def chunk(self) -> None:
+        if self.first_chunk_ms is None:
+            self.first_chunk_ms = self.elapsed_ms()
+
+    def verdict(self) -> None:
+        if self.verdict_ms is None:
+            self.verdict_ms = self.elapsed_ms()
+
+    def timings(self) -> Dict[str, Optional[float]]:
+        return {"first_chunk_ms": self.first_chunk_ms, "verdict_ms": self.verdict_ms, "total_ms": self.elapsed_ms()}
+
+
+stream_timings = StreamTimings()
@@ -0,0 +1,251 @@
+"""Bounded-memory upload ingestion.
+
+``UploadLimitMiddleware`` counts request body bytes as they arrive and answers
+413 as soon as a body passes the limit (or immediately, when Content-Length
+already says so), before the multipart parser has buffered anything more.
+Starlette spools each file part to a ``SpooledTemporaryFile`` (RAM up to 1MB,
+disk beyond), and :func:`ingest_upload` then makes a single chunked pass over
+that spool to enforce the exact file limit, hash the content and sniff its type.
+"""
+
+import asyncio
+import hashlib
+import ipaddress
+import json
+import os
+import tempfile
+from typing import Any, Awaitable, Callable, Iterable, Optional
+from urllib.parse import urlsplit
+
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+
+MAX_UPLOAD_BYTES = int(float(os.environ.get("DEEPFAKE_MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+CHUNK_SIZE = 256 * 1024
+# Room for multipart boundaries, part headers and small form fields such as api_key.
+MULTIPART_OVERHEAD = 64 * 1024
+SPOOL_MAX_MEMORY = 1024 * 1024
+URL_FETCH_TIMEOUT = float(os.environ.get("DEEPFAKE_URL_FETCH_TIMEOUT", "30"))
+ALLOW_PRIVATE_URLS = os.environ.get("DEEPFAKE_ALLOW_PRIVATE_URLS", "0").lower() in ("1", "true", "yes")
+
+
+def sniff_type(head: bytes) -> Optional[str]:
+    """MIME type implied by the leading bytes, for the formats the API accepts."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "video/x-msvideo"
+    if head[4:8] == b"ftyp":
+        return "video/quicktime" if head[8:12] == b"qt  " else "video/mp4"
+    if head[4:8] in (b"moov", b"mdat", b"wide", b"free"):
+        return "video/quicktime"
+    return None
+
+
+class IngestedUpload:
+    """A fully received upload: spooled file handle plus size, digest and sniffed type."""
+
+    def __init__(self, file: Any, size: int, digest: str, declared_type: str, sniffed_type: Optional[str]) -> None:
+        self.file = file
+        self.size = size
+        self.digest = digest
+        self.declared_type = declared_type
+        self.sniffed_type = sniffed_type
+
+    @property
+    def mime_type(self) -> str:
+        return self.sniffed_type or self.declared_type
+
+
+async def ingest_upload(
+    file: UploadFile,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    limit_detail: Optional[str] = None,
+) -> IngestedUpload:
+    """Single chunked pass over an upload: size limit, SHA-256 and type sniffing.
+
+    Raises ``HTTPException(400)`` for empty, oversize or mislabelled files.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    head = b""
+    await file.seek(0)
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if not head:
+            head = chunk[:16]
+        size += len(chunk)
+        if size > max_bytes:
+            detail = limit_detail or f"File too large (max {max_bytes / (1024 * 1024):g}MB)"
+            raise HTTPException(status_code=400, detail=detail)
+        hasher.update(chunk)
+    await file.seek(0)
+
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+
+    declared = file.content_type or "application/octet-stream"
+    sniffed = sniff_type(head)
+    if sniffed is not None and sniffed.split("/")[0] != declared.split("/")[0]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File content ({sniffed}) does not match declared type {declared}",
+        )
+    return IngestedUpload(file.file, size, hasher.hexdigest(), declared, sniffed)
+
+
+async def _check_public_host(host: str) -> None:
+    # Refuse to fetch from loopback, private or link-local addresses (SSRF guard).
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None)
+    except OSError:
+        raise HTTPException(status_code=400, detail=f"Cannot resolve host {host}") from None
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0])
+        if not address.is_global:
+            raise HTTPException(status_code=400, detail=f"URL host {host} is not publicly routable")
+
+
+async def check_public_url(url: str) -> None:
+    """Refuse ``url`` unless it is http(s) on a publicly routable host (or ``DEEPFAKE_ALLOW_PRIVATE_URLS``)."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise HTTPException(status_code=400, detail=f"Unsupported URL: {url}")
+    if not ALLOW_PRIVATE_URLS:
+        await _check_public_host(parts.hostname)
+
+
+async def fetch_url_upload(url: str, max_bytes: int = MAX_UPLOAD_BYTES) -> UploadFile:
+    """Download ``url`` into a spooled temp file, enforcing ``max_bytes`` while streaming.
+
+    The result is a regular ``UploadFile`` so it goes through the same validation as
+    multipart uploads. Redirects are not followed.
+    """
+    import httpx
+
+    await check_public_url(url)
+    parts = urlsplit(url)
+
+    too_large = HTTPException(status_code=400, detail=f"File too large (max {max_bytes / (1024 * 1024):g}MB)")
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    size = 0
+    head = b""
+    try:
+        async with httpx.AsyncClient(timeout=URL_FETCH_TIMEOUT, follow_redirects=False) as client:
+            async with client.stream("GET", url) as response:
+                if response.status_code >= 300:
+                    raise HTTPException(status_code=400, detail=f"Could not fetch {url}: HTTP {response.status_code}")
+                if int(response.headers.get("content-length") or 0) > max_bytes:
+                    raise too_large
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    if not head:
+                        head = chunk[:16]
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise too_large
+                    spool.write(chunk)
+                declared = response.headers.get("content-type", "").split(";")[0].strip().lower()
+    except HTTPException:
+        spool.close()
+        raise
+    except httpx.HTTPError as error:
+        spool.close()
+        raise HTTPException(status_code=400, detail=f"Could not fetch {url}: {type(error).__name__}") from None
+
+    spool.seek(0)
+    content_type = declared if declared.startswith(("image/", "video/")) else (sniff_type(head) or declared)
+    filename = os.path.basename(parts.path) or parts.hostname
+    return UploadFile(spool, size=size, filename=filename, headers=Headers({"content-type": content_type}))
+
+
+class _BodyTooLarge(HTTPException):
+    # An HTTPException so FastAPI's body parsing re-raises it untouched and answers 413.
+    def __init__(self, detail: str) -> None:
+        super().__init__(status_code=413, detail=detail)
+
+
+class UploadLimitMiddleware:
+    """Pure ASGI middleware rejecting request bodies larger than ``max_body`` bytes with 413.
+
+    Only POST requests to ``paths`` (prefix match) are checked, except those
+    under ``exclude`` (which may have their own limit); the body is never
+    buffered here, just counted as it streams through to the application.
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        max_body: int,
+        paths: Iterable[str] = ("/",),
+        detail: Optional[str] = None,
+        exclude: Iterable[str] = (),
+    ) -> None:
+        self.app = app
+        self.max_body = max_body
+        self.paths = tuple(paths)
+        self.exclude = tuple(exclude)
+        self.detail = detail or f"Request body too large (max {max_body / (1024 * 1024):g}MB)"
+
+    async def _reject(self, send: Callable[[dict], Awaitable[None]]) -> None:
+        body = json.dumps({"detail": self.detail}).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(
+        self,
+        scope: dict,
+        receive: Callable[[], Awaitable[dict]],
+        send: Callable[[dict], Awaitable[None]],
+    ) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].startswith(self.paths)
+            or (self.exclude and scope["path"].startswith(self.exclude))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > self.max_body:
+                    await self._reject(send)
+                    return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> dict:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    raise _BodyTooLarge(self.detail)
+            return message
+
+        async def tracking_send(message: dict) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await self._reject(send)
@@ -0,0 +1,397 @@
+"""Keyframe sampling so a clip costs a bounded number of frames instead of its full length.
+
+The video is decoded once with PyAV, frame by frame, and about ``VIDEO_SCAN_FPS``
+frames per second are scored against the last selected frame: a tiny greyscale
+thumbnail catches scene changes and, when OpenCV is installed, a crop of the
+largest face catches face-region changes (expressions, mouth movement, swaps
+that only touch the face). A frame is also taken whenever too long has passed
+without one, so static shots still get temporal coverage. The best
+``VIDEO_MAX_FRAMES`` candidates (never more than one per second of clip) are
+sent as timestamped JPEG stills, optionally followed by a short mono WAV excerpt
+for the lip-sync check. With ``DEEPFAKE_FACE_CROPS`` on, a keyframe with a face
+is sent small, followed by a crop of its largest face at the frame's own
+resolution (see :mod:`detector.regions`).
+
+Decoding stops after ``VIDEO_DECODE_BUDGET`` seconds; the frames gathered so far
+are used and the report says the clip was truncated. With ``start``/``end`` only
+that stretch of the clip is sampled (see :mod:`detector.segments`).
+"""
+
+import importlib.util
+import io
+import math
+import os
+import threading
+import time
+import wave
+from typing import Any, Dict, List, Optional, Tuple
+
+from detector.faces import detect_faces
+from detector.preprocess import IMAGE_QUALITY, PreparedMedia, media_file, media_size
+from detector.regions import (
+    FACE_CONTEXT_SIDE,
+    FACE_CROP_SIDE,
+    FACE_CROPS,
+    FaceCrop,
+    encode_jpeg,
+    face_boxes,
+    record_frame_crops,
+)
+
+VIDEO_SAMPLING = os.environ.get("DEEPFAKE_VIDEO_SAMPLING", "1").lower() not in ("0", "false", "no")
+VIDEO_MAX_FRAMES = int(os.environ.get("DEEPFAKE_VIDEO_MAX_FRAMES", "16"))
+VIDEO_SCAN_FPS = float(os.environ.get("DEEPFAKE_VIDEO_SCAN_FPS", "4"))
+VIDEO_DECODE_BUDGET = float(os.environ.get("DEEPFAKE_VIDEO_DECODE_BUDGET", "10"))
+VIDEO_SCENE_THRESHOLD = float(os.environ.get("DEEPFAKE_VIDEO_SCENE_THRESHOLD", "0.10"))
+VIDEO_FACE_THRESHOLD = float(os.environ.get("DEEPFAKE_VIDEO_FACE_THRESHOLD", "0.12"))
+VIDEO_FRAME_SIDE = int(os.environ.get("DEEPFAKE_VIDEO_FRAME_SIDE", "768"))
+VIDEO_AUDIO_SECONDS = float(os.environ.get("DEEPFAKE_VIDEO_AUDIO_SECONDS", "6"))
+
+AUDIO_RATE = 16000
+_SCAN_WIDTH = 320
+_THUMB = (32, 18)
+_FACE_THUMB = (16, 16)
+_METADATA_KEYS = ("encoder", "creation_time", "make", "model", "software", "handler_name")
+
+
+def av_available() -> bool:
+    """Whether PyAV is installed; checked without importing it, so health probes stay cheap."""
+    return importlib.util.find_spec("av") is not None
+
+
+def _difference(a: bytes, b: bytes) -> float:
+    return sum(abs(x - y) for x, y in zip(a, b)) / (255.0 * len(a))
+
+
+class Keyframe:
+    __slots__ = ("time", "score", "reason", "jpeg", "has_face", "crop")
+
+    def __init__(
+        self, time: float, score: float, reason: str, jpeg: bytes, has_face: bool, crop: Optional[FaceCrop] = None
+    ) -> None:
+        self.time = time
+        self.score = score
+        self.reason = reason
+        self.jpeg = jpeg
+        self.has_face = has_face
+        self.crop = crop
+
+
+class SampledVideo(PreparedMedia):
+    """Selected keyframes and audio excerpt standing in for the whole clip."""
+
+    def __init__(
+        self,
+        frames: List[Keyframe],
+        audio: Optional[bytes],
+        audio_start: float,
+        stats: Dict[str, Any],
+        mime_type: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        segment: Optional[Tuple[float, float]] = None,
+    ) -> None:
+        super().__init__(b"", mime_type, metadata, stats["original_bytes"], transformed=True)
+        self.frames = frames
+        self.audio = audio
+        self.audio_start = audio_start
+        self.stats = stats
+        self.segment = segment
+        crops = [frame.crop for frame in frames if frame.crop is not None]
+        for number, crop in enumerate(crops, 1):
+            crop.number = number
+        if crops:
+            self.regions = {"faces": len(crops), "crops": [crop.describe() for crop in crops]}
+
+    @property
+    def payload_bytes(self) -> int:
+        crops = sum(len(frame.crop.jpeg) for frame in self.frames if frame.crop is not None)
+        return sum(len(frame.jpeg) for frame in self.frames) + crops + len(self.audio or b"")
+
+    def parts(self) -> List[Any]:
+        from google.genai import types  # type: ignore
+
+        parts: List[Any] = []
+        for frame in self.frames:
+            parts.append(types.Part.from_text(text=f"Frame at {frame.time:.2f}s ({frame.reason}):"))
+            parts.append(types.Part.from_bytes(data=frame.jpeg, mime_type="image/jpeg"))
+            if frame.crop is not None:
+                parts.append(types.Part.from_text(text=frame.crop.label()))
+                parts.append(types.Part.from_bytes(data=frame.crop.jpeg, mime_type="image/jpeg"))
+        if self.audio:
+            parts.append(types.Part.from_text(text=f"Audio from {self.audio_start:.2f}s:"))
+            parts.append(types.Part.from_bytes(data=self.audio, mime_type="audio/wav"))
+        return parts
+
+    def prompt_note(self) -> str:
+        if self.segment is not None:
+            start, end = self.segment
+            clip = f"{end - start:.1f}s segment from {start:.1f}s to {end:.1f}s"
+            clip += f" of a {self.stats['duration']:.1f}s video"
+        else:
+            clip = f"{self.stats['duration']:.1f}s video"
+        note = (
+            f"\n\nThe {clip} was reduced to {len(self.frames)} keyframes chosen at "
+            "scene and face-region changes, shown above with their timestamps"
+        )
+        if self.audio:
+            note += f", plus {self.stats['audio_seconds']:.1f}s of audio starting at {self.audio_start:.2f}s"
+        note += (
+            ". Judge temporal cues (blinking, lip-sync) from these samples; the sampling and JPEG "
+            "compression of the stills are not evidence of manipulation."
+        )
+        if self.regions:
+            note += (
+                " Keyframes with a face are followed by a full-detail crop of it; set each finding's crop to "
+                "the number of the face crop its evidence is in."
+            )
+        if self.metadata:
+            note += "\nContainer metadata:\n" + "\n".join(f"- {key}: {value}" for key, value in self.metadata.items())
+        return note
+
+
+def _container_metadata(container: Any) -> Dict[str, Any]:
+    metadata: Dict[str, Any] = {}
+    for source in [container.metadata] + [stream.metadata for stream in container.streams]:
+        for key, value in (source or {}).items():
+            if any(name in key.lower() for name in _METADATA_KEYS) and key not in metadata and value:
+                metadata[key] = str(value)[:200]
+    return metadata
+
+
+def _encode_frame(frame: Any, side: int) -> bytes:
+    scale = min(1.0, side / max(frame.width, frame.height))
+    image = frame.to_image(width=max(2, int(frame.width * scale)), height=max(2, int(frame.height * scale)))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def _face_frame(frame: Any, small: Any, face: Any, side: int) -> Tuple[bytes, Optional[FaceCrop]]:
+    """The frame shrunk to the context size, and a crop of ``face`` (found on ``small``) at full resolution."""
+    image = frame.to_image()
+    jpeg, _ = encode_jpeg(image, min(side, FACE_CONTEXT_SIDE))
+    scale = (image.width / small.width, image.height / small.height)
+    boxes = face_boxes([face], scale, image.size, limit=1)
+    if not boxes:
+        return _encode_frame(frame, side), None
+    crop = FaceCrop(0, boxes[0], *encode_jpeg(image.crop(boxes[0]), FACE_CROP_SIDE), time=float(frame.time or 0.0))
+    return jpeg, crop
+
+
+def _audio_excerpt(source: Any, start: float, seconds: float) -> Optional[bytes]:
+    """Mono 16kHz WAV of ``seconds`` of audio from ``start``, or ``None`` without an audio track."""
+    import av  # type: ignore
+
+    source.seek(0)
+    with av.open(source) as container:
+        if not container.streams.audio:
+            return None
+        stream = container.streams.audio[0]
+        if start > 0:
+            container.seek(int(start * av.time_base))
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=AUDIO_RATE)
+        needed = int(seconds * AUDIO_RATE) * 2
+        pcm = bytearray()
+        for frame in container.decode(stream):
+            if frame.time is not None and frame.time + frame.samples / frame.sample_rate < start:
+                continue
+            for chunk in resampler.resample(frame):
+                pcm += bytes(chunk.planes[0])[: chunk.samples * 2]
+            if len(pcm) >= needed:
+                break
+    if not pcm:
+        return None
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(AUDIO_RATE)
+        output.writeframes(bytes(pcm[:needed]))
+    return buffer.getvalue()
+
+
+class _Totals:
+    """Process-wide sampling counters for the health endpoint."""
+
+    def __init__(self) -> None:
+        self.clips = 0
+        self.frames_selected = 0
+        self.original_bytes = 0
+        self.payload_bytes = 0
+        self.decode_ms = 0.0
+        self.truncated = 0
+        self._lock = threading.Lock()
+
+    def record(self, stats: Dict[str, Any]) -> None:
+        with self._lock:
+            self.clips += 1
+            self.frames_selected += stats["frames_selected"]
+            self.original_bytes += stats["original_bytes"]
+            self.payload_bytes += stats["payload_bytes"]
+            self.decode_ms += stats["decode_ms"]
+            self.truncated += int(stats["truncated"])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "clips": self.clips,
+                "frames_selected": self.frames_selected,
+                "mean_decode_ms": round(self.decode_ms / self.clips, 1) if self.clips else 0.0,
+                "truncated": self.truncated,
+                "payload_reduction": round(1 - self.payload_bytes / self.original_bytes, 4)
+                if self.original_bytes
+                else 0.0,
+            }
+
+
+_totals = _Totals()
+
+
+def sample_video(
+    source: Any,
+    mime_type: str,
+    max_frames: int = VIDEO_MAX_FRAMES,
+    scan_fps: float = VIDEO_SCAN_FPS,
+    decode_budget: float = VIDEO_DECODE_BUDGET,
+    audio_seconds: float = VIDEO_AUDIO_SECONDS,
+    frame_side: int = VIDEO_FRAME_SIDE,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    record: bool = True,
+    face_crops: bool = FACE_CROPS,
+) -> SampledVideo:
+    """Pick informative keyframes (and an audio excerpt) from a video file or bytes.
+
+    ``start`` and ``end`` (seconds) restrict sampling to part of the clip; ``record``
+    adds the clip to the health endpoint's totals. ``face_crops`` sends keyframes
+    with a face small, each followed by a crop of the face.
+    """
+    import av  # type: ignore
+
+    source = media_file(source)
+    original_bytes = media_size(source)
+
+    started = time.perf_counter()
+    decoded = scanned = 0
+    truncated = False
+    candidates: List[Keyframe] = []
+    with av.open(source) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        if container.duration:
+            duration = container.duration / av.time_base
+        elif stream.duration and stream.time_base:
+            duration = float(stream.duration * stream.time_base)
+        else:
+            duration = 0.0
+        metadata = _container_metadata(container)
+        stop = min(end, duration) if end is not None and duration else end
+        span = (stop if stop is not None else duration) - start
+        budget = min(max_frames, max(1, math.ceil(span))) if span > 0 else max_frames
+        coverage_gap = max(1.0, span / budget) if span > 0 else 2.0
+        if start > 0:
+            container.seek(int(start * av.time_base))  # lands on the keyframe at or before start
+
+        next_scan = start
+        last_thumb: Optional[bytes] = None
+        last_face: Optional[bytes] = None
+        last_time = start
+        for frame in container.decode(stream):
+            decoded += 1
+            moment = float(frame.time or 0.0)
+            if stop is not None and moment >= stop:
+                break
+            if moment < next_scan:
+                continue
+            next_scan = moment + 1.0 / scan_fps
+            scanned += 1
+
+            height = max(2, int(_SCAN_WIDTH * frame.height / frame.width))
+            small = frame.to_image(width=_SCAN_WIDTH, height=height)
+            thumb = small.convert("L").resize(_THUMB).tobytes()
+            faces = detect_faces(small)
+            face_thumb = small.crop(faces[0]).convert("L").resize(_FACE_THUMB).tobytes() if faces else None
+
+            scene_score = 1.0 if last_thumb is None else _difference(thumb, last_thumb)
+            face_score = 0.0
+            if face_thumb is not None:
+                face_score = 1.0 if last_face is None else _difference(face_thumb, last_face)
+            if last_thumb is None:
+                reason = "first frame"
+            elif scene_score >= VIDEO_SCENE_THRESHOLD:
+                reason = "scene change"
+            elif face_score >= VIDEO_FACE_THRESHOLD:
+                reason = "face change"
+            elif moment - last_time >= coverage_gap:
+                reason = "interval"
+            else:
+                reason = ""
+            if reason:
+                last_thumb, last_time = thumb, moment
+                if face_thumb is not None:
+                    last_face = face_thumb
+                score = max(scene_score / VIDEO_SCENE_THRESHOLD, face_score / VIDEO_FACE_THRESHOLD)
+                if faces and face_crops:
+                    jpeg, crop = _face_frame(frame, small, faces[0], frame_side)
+                else:
+                    jpeg, crop = _encode_frame(frame, frame_side), None
+                candidates.append(Keyframe(moment, score, reason, jpeg, bool(faces), crop))
+                if len(candidates) > 4 * budget:
+                    weakest = min(range(1, len(candidates)), key=lambda i: candidates[i].score)
+                    del candidates[weakest]
+
+            if time.perf_counter() - started > decode_budget:
+                truncated = True
+                break
+
+    chosen = candidates[:1] + sorted(candidates[1:], key=lambda frame: frame.score, reverse=True)[: budget - 1]
+    chosen.sort(key=lambda frame: frame.time)
+
+    audio = None
+    audio_start = start
+    if span > 0:
+        audio_seconds = min(audio_seconds, span)
+    if audio_seconds > 0:
+        with_face = next((frame for frame in chosen if frame.has_face), None)
+        if with_face is not None:
+            audio_start = max(start, with_face.time - audio_seconds / 2)
+        if duration:
+            audio_start = max(start, min(audio_start, start + span - audio_seconds))
+        audio = _audio_excerpt(source, audio_start, audio_seconds)
+
+    decode_ms = (time.perf_counter() - started) * 1000
+    stats: Dict[str, Any] = {
+        "duration": round(duration, 3),
+        "frames_decoded": decoded,
+        "frames_scanned": scanned,
+        "frames_selected": len(chosen),
+        "audio_seconds": audio_seconds if audio else 0.0,
+        "decode_ms": round(decode_ms, 1),
+        "truncated": truncated,
+        "original_bytes": original_bytes,
+    }
+    segment = (start, start + span) if end is not None else None
+    sample = SampledVideo(chosen, audio, audio_start, stats, mime_type, metadata, segment)
+    stats["payload_bytes"] = sample.payload_bytes
+    stats["reduction"] = round(1 - sample.payload_bytes / original_bytes, 4) if original_bytes else 0.0
+    if record:
+        _totals.record(stats)
+        if sample.regions:
+            record_frame_crops(len(sample.regions["crops"]))
+    return sample
+
+
+def sampling_stats() -> dict:
+    return _totals.stats()
+
+
+def prepare_video(source: Any, mime_type: str) -> PreparedMedia:
+    """Sampled keyframes when that is smaller than the clip (bytes or a seekable file); otherwise the clip itself."""
+    size = media_size(source)
+    try:
+        sample = sample_video(source, mime_type)
+    except Exception:
+        return PreparedMedia(source, mime_type, original_bytes=size)
+    if not sample.frames or sample.payload_bytes >= size:
+        return PreparedMedia(source, mime_type, original_bytes=size)
+    return sample
@@ -0,0 +1,100 @@
+"""Shared fixtures: the Vercel API with the stub Gemini client and throwaway job storage."""
+
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings are read when the modules are imported, so they are fixed before the first import.
+_STATE_DIR = tempfile.mkdtemp(prefix="deepfake-tests-")
+os.environ.update(
+    {
+        "DEEPFAKE_JOBS_DB": os.path.join(_STATE_DIR, "jobs.sqlite3"),
+        "DEEPFAKE_JOBS_DIR": os.path.join(_STATE_DIR, "jobs"),
+        "DEEPFAKE_JOB_POLL_INTERVAL": "0.05",
+        "DEEPFAKE_CACHE_BACKEND": "none",
+        "DEEPFAKE_PHASH_ENABLED": "0",
+        "DEEPFAKE_KEY_RATE": "0",
+        "DEEPFAKE_IP_RATE": "0",
+        "DEEPFAKE_KEY_TOKENS_PER_MINUTE": "0",
+        "DEEPFAKE_ALLOW_PRIVATE_URLS": "1",
+    }
+)
+
+
+def jpeg(color: tuple, size: tuple = (64, 48)) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope="session")
+def api():
+    """``api.index`` answering through the in-process stub client (no network, no delay)."""
+    import api.index as module
+    from benchmarks import stub_model
+
+    stub_model.install(module, latency=0.0)
+    return module
+
+
+@pytest.fixture
+def client(api):
+    from fastapi.testclient import TestClient
+
+    with TestClient(api.app) as test_client:
+        yield test_client
+
+
+def model_calls(api, api_key: str) -> int:
+    """Model calls made with ``api_key``'s pooled stub client."""
+    lease = api.client_pool.acquire(api_key)
+    try:
+        return lease.client.models.calls
+    finally:
+        api.client_pool.release(lease)
+
+
+class WebhookReceiver(ThreadingHTTPServer):
+    """Local HTTP server that records the JSON bodies POSTed to it."""
+
+    def __init__(self) -> None:
+        self.payloads: list = []
+        self.received = threading.Event()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("content-length") or 0))
+                receiver.payloads.append(json.loads(body))
+                self.send_response(204)
+                self.end_headers()
+                receiver.received.set()
+
+        super().__init__(("127.0.0.1", 0), Handler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/hook"
+
+
+@pytest.fixture
+def webhook():
+    receiver = WebhookReceiver()
+    thread = threading.Thread(target=receiver.serve_forever, daemon=True)
+    thread.start()
+    yield receiver
+    receiver.shutdown()
+    receiver.server_close()
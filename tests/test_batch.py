@@ -0,0 +1,55 @@
+"""Batch analysis: NDJSON lines per item, shared analyses for duplicates, per-item errors."""
+
+import json
+
+from conftest import jpeg, model_calls
+
+
+def _batch(client, files, api_key, **data):
+    response = client.post("/api/analyze/batch", files=files, data={"api_key": api_key, **data})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines() if line]
+    return {line["index"]: line for line in lines}
+
+
+def test_duplicate_items_share_one_analysis(api, client):
+    photo = jpeg((200, 40, 40))
+    files = [
+        ("files", ("first.jpg", photo, "image/jpeg")),
+        ("files", ("other.jpg", jpeg((40, 200, 40)), "image/jpeg")),
+        ("files", ("copy.jpg", photo, "image/jpeg")),
+    ]
+    items = _batch(client, files, "batch-duplicates")
+
+    assert sorted(items) == [0, 1, 2]
+    assert all(item["status_code"] == 200 for item in items.values())
+    assert items[2]["duplicate_of"] == 0
+    assert "duplicate_of" not in items[0] and "duplicate_of" not in items[1]
+    assert items[2]["result"] == items[0]["result"]
+    assert items[0]["result"]["verdict"] == "REAL"
+    assert model_calls(api, "batch-duplicates") == 2
+
+
+def test_bad_items_fail_alone(api, client):
+    files = [
+        ("files", ("photo.jpg", jpeg((10, 10, 220)), "image/jpeg")),
+        ("files", ("notes.txt", b"not media", "text/plain")),
+        ("files", ("empty.png", b"", "image/png")),
+        ("files", ("fake.jpg", b"\x89PNG\r\n\x1a\n" + b"\x00" * 32, "video/mp4")),
+    ]
+    items = _batch(client, files, "batch-errors")
+
+    assert items[0]["status_code"] == 200 and items[0]["result"]["verdict"] == "REAL"
+    assert items[1]["status_code"] == 400 and "Unsupported file type" in items[1]["error"]
+    assert items[2]["status_code"] == 400 and "empty" in items[2]["error"]
+    assert items[3]["status_code"] == 400 and "does not match" in items[3]["error"]
+    assert all("result" not in items[index] for index in (1, 2, 3))
+    assert items[1]["source"] == "notes.txt"
+    assert model_calls(api, "batch-errors") == 1
+
+
+def test_batch_needs_items_and_key(client):
+    assert client.post("/api/analyze/batch", data={"api_key": "k"}).status_code == 400
+    files = [("files", ("photo.jpg", jpeg((1, 2, 3)), "image/jpeg"))]
+    assert client.post("/api/analyze/batch", files=files).status_code == 400
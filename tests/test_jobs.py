@@ -0,0 +1,118 @@
+"""Background jobs: lifecycle through the API, tenant scoping, dedup, leases and webhooks."""
+
+import asyncio
+import time
+
+import pytest
+
+from conftest import jpeg
+from detector.jobs import DONE, FAILED, QUEUED, RUNNING, JobRunner, JobStore
+
+
+def _submit(client, photo, api_key, **data):
+    files = {"file": ("photo.jpg", photo, "image/jpeg")}
+    response = client.post("/api/jobs", files=files, data={"api_key": api_key, **data})
+    assert response.status_code == 202
+    return response.json()
+
+
+def _wait(client, job_id, api_key, ready=lambda job: job["status"] in (DONE, FAILED), timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/api/jobs/{job_id}", params={"api_key": api_key}).json()
+        if ready(job) or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "spool"))
+
+
+def _create(store, tmp_path, webhook_url=None, tenant="tenant-a"):
+    source = tmp_path / "upload"
+    source.write_bytes(b"\xff\xd8\xff" + b"\x00" * 64)
+    with open(source, "rb") as handle:
+        return store.create(handle, "image/jpeg", 67, "digest", "key", "dedup", webhook_url, tenant)
+
+
+def test_job_runs_to_done_and_webhook_is_delivered(client, webhook):
+    job = _submit(client, jpeg((90, 90, 30)), "jobs-lifecycle", webhook_url=webhook.url)
+    assert job["status"] == QUEUED and not job["deduplicated"]
+
+    finished = _wait(client, job["job_id"], "jobs-lifecycle")
+    assert finished["status"] == DONE
+    assert finished["result"]["verdict"] == "REAL"
+    assert finished["attempts"] == 1
+
+    assert webhook.received.wait(5)
+    assert webhook.payloads[0]["job_id"] == job["job_id"]
+    assert webhook.payloads[0]["result"]["verdict"] == "REAL"
+    delivered = _wait(client, job["job_id"], "jobs-lifecycle", ready=lambda job: job["webhook_status"])
+    assert delivered["webhook_status"] == "delivered (204)"
+
+
+def test_jobs_are_scoped_to_their_key(client):
+    photo = jpeg((30, 90, 90))
+    job = _submit(client, photo, "jobs-owner")
+
+    assert client.get(f"/api/jobs/{job['job_id']}", params={"api_key": "jobs-other"}).status_code == 404
+    assert client.get(f"/api/jobs/{job['job_id']}").status_code == 400
+
+    again = _submit(client, photo, "jobs-owner")
+    assert again["deduplicated"] and again["job_id"] == job["job_id"]
+    other = _submit(client, photo, "jobs-other")
+    assert not other["deduplicated"] and other["job_id"] != job["job_id"]
+
+
+def test_expired_lease_passes_the_job_to_another_worker(store, tmp_path):
+    job = _create(store, tmp_path)
+    first = store.claim(lease_seconds=-1)  # lapses at once, as if the worker had died
+    second = store.claim()
+    assert first["id"] == second["id"] == job["id"]
+    assert second["attempts"] == 2 and first["lease_owner"] != second["lease_owner"]
+
+    assert not store.complete(first, {"verdict": "FAKE"})
+    assert not store.fail(first, "late", retry=True)
+    assert store.get(job["id"])["status"] == RUNNING
+
+    assert store.complete(second, {"verdict": "REAL"})
+    done = store.get(job["id"])
+    assert done["status"] == DONE and done["api_key"] is None and done["content_path"] is None
+    assert store.claim() is None
+
+
+def test_retry_backoff_then_permanent_failure(store, tmp_path):
+    job = _create(store, tmp_path)
+    claimed = store.claim()
+    assert store.fail(claimed, "upstream 503", retry=True, max_attempts=2)
+    queued = store.get(job["id"])
+    assert queued["status"] == QUEUED and queued["available_at"] > time.time()
+    assert store.claim() is None  # still backing off
+
+    store._execute("UPDATE jobs SET available_at = 0 WHERE id = ?", (job["id"],))
+    claimed = store.claim()
+    assert claimed["attempts"] == 2
+    assert store.fail(claimed, "upstream 503", retry=True, max_attempts=2)
+    failed = store.get(job["id"])
+    assert failed["status"] == FAILED and failed["error"] == "upstream 503"
+
+
+def test_worker_that_lost_its_lease_stays_silent(store, tmp_path, webhook):
+    job = _create(store, tmp_path, webhook_url=webhook.url)
+    stale = store.claim(lease_seconds=-1)
+    current = store.claim()
+
+    async def process(_: dict) -> dict:
+        return {"verdict": "FAKE"}
+
+    runner = JobRunner(lambda: store, process)
+    asyncio.run(runner._run(stale))
+    assert store.get(job["id"])["status"] == RUNNING
+    assert not webhook.received.wait(0.5)
+
+    asyncio.run(runner._run(current))
+    assert store.get(job["id"])["status"] == DONE
+    assert webhook.received.wait(5)
+    assert webhook.payloads[0]["result"] == {"verdict": "FAKE"}